@@ -0,0 +1,71 @@
+"""Microbenchmark of the authentication of a request with a bearer token.
+
+Compares verifying the token for every request with the claims cache
+(`JWT_CLAIMS_CACHE_SIZE`), for ECDSA and RSA signed tokens. Clients send
+the same token with all of their requests.
+
+Usage, from web/geosearch:
+
+    python -m benchmarks.authentication [--requests 2000] [--repeat 5]
+"""
+import argparse
+import time
+import timeit
+
+import flask
+from jwcrypto.jwk import JWK, JWKSet
+from jwcrypto.jwt import JWT
+
+from datapunt_geosearch import authz
+
+KEYS = {
+    "ES256": dict(kty="EC", crv="P-256"),
+    "RS256": dict(kty="RSA", size=2048),
+}
+
+
+def make_token(key, alg):
+    now = int(time.time())
+    token = JWT(
+        header={"alg": alg, "kid": key.get("kid")},
+        claims={
+            "iat": now,
+            "exp": now + 3600,
+            "realm_access": {"roles": ["fp_mdw", "brk_ro"]},
+            "sub": "benchmark@amsterdam.nl",
+            "email": "benchmark@amsterdam.nl",
+        },
+    )
+    token.make_signed_token(key)
+    return token.serialize()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = flask.Flask("benchmark")
+    for alg, key_settings in KEYS.items():
+        key = JWK.generate(kid=alg.lower(), **key_settings)
+        keyset = JWKSet()
+        keyset.add(key)
+        token = make_token(key, alg)
+        app.config.update(JW_KEYSET=keyset, JWKS_SIGNING_ALGORITHMS=[alg])
+
+        for name, cache_size in (("verify every request", 0), ("claims cache", 1000)):
+            app.config["JWT_CLAIMS_CACHE_SIZE"] = cache_size
+            with app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+                seconds = min(
+                    timeit.repeat(
+                        lambda: authz.check_authentication(flask.request),
+                        number=args.requests,
+                        repeat=args.repeat,
+                    )
+                )
+            print(f"{alg} {name:<22} {seconds / args.requests * 1e6:>10,.1f} µs/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Load generation and latency statistics for the benchmarks.
+
+Requests are sent to a target, which is either the Flask app in this
+process (`InProcessTarget`) or a running geosearch (`HttpTarget`).
+"""
+import json
+import subprocess  # nosec B404: only runs git with fixed arguments
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+import requests
+
+PERCENTILES = (50, 95, 99)
+
+
+class Sample(NamedTuple):
+    """The outcome of a single request, or a single call of a timed function."""
+
+    label: str
+    status: int  # 0 when the request raised an exception
+    seconds: float
+    size: int
+
+    @property
+    def failed(self):
+        return not 200 <= self.status < 400
+
+
+class InProcessTarget:
+    """Sends the requests to a Flask app with its test client, one per thread."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def get(self, path, headers=None) -> Tuple[int, int]:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.get(path, headers=headers)
+        return response.status_code, len(response.get_data())
+
+
+class HttpTarget:
+    """Sends the requests to a running geosearch, with a session per thread."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def get(self, path, headers=None) -> Tuple[int, int]:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.get(self.base_url + path, headers=headers, timeout=self.timeout)
+        return response.status_code, len(response.content)
+
+
+def run(
+    target,
+    paths: Iterable[Tuple[str, str]],
+    concurrency=1,
+    rate: Optional[float] = None,
+    headers: Optional[dict] = None,
+) -> Tuple[List[Sample], float]:
+    """Send GET requests for the (label, path) pairs, with `headers`.
+
+    Up to `concurrency` requests are in flight at the same time. With a `rate`
+    (requests per second), request `n` is not sent before `n / rate` seconds
+    after the start, so the load does not depend on the response times.
+
+    Returns the samples, in the order of `paths`, and the elapsed seconds.
+    """
+    paths = list(paths)
+    start = time.perf_counter()
+
+    def send(index, label, path):
+        if rate:
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        sent = time.perf_counter()
+        try:
+            status, size = target.get(path, headers=headers)
+        except Exception:
+            status, size = 0, 0
+        return Sample(label, status, time.perf_counter() - sent, size)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(send, index, label, path) for index, (label, path) in enumerate(paths)
+        ]
+        samples = [future.result() for future in futures]
+    return samples, time.perf_counter() - start
+
+
+def timed(label, func: Callable, repeat: int) -> Tuple[List[Sample], float]:
+    """Call `func` `repeat` times, as `run` does for requests."""
+    samples = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        called = time.perf_counter()
+        try:
+            func()
+            status = 200
+        except Exception:
+            status = 0
+        samples.append(Sample(label, status, time.perf_counter() - called, 0))
+    return samples, time.perf_counter() - start
+
+
+def percentile(sorted_values, percent):
+    """Return the nearest-rank percentile of values sorted in ascending order."""
+    if not sorted_values:
+        return None
+    rank = -(-len(sorted_values) * percent // 100)  # ceil
+    return sorted_values[max(int(rank), 1) - 1]
+
+
+def summarize(samples: List[Sample], seconds: float) -> dict:
+    """Return the counts, throughput and latency (in milliseconds) of samples."""
+    latencies = sorted(sample.seconds * 1000 for sample in samples)
+    errors = sum(sample.failed for sample in samples)
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else None,
+        "seconds": round(seconds, 3),
+        "throughput": round(len(samples) / seconds, 1) if seconds else None,
+        "bytes": sum(sample.size for sample in samples),
+        "latency_ms": {
+            **{f"p{percent}": _round(percentile(latencies, percent)) for percent in PERCENTILES},
+            "mean": _round(sum(latencies) / len(latencies)) if latencies else None,
+            "max": _round(latencies[-1]) if latencies else None,
+        },
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def git_commit() -> Optional[str]:
+    """Return the commit that is checked out, so results can be compared between commits."""
+    try:
+        # git is looked up on the PATH, the arguments are fixed
+        return subprocess.run(  # nosec B603 B607
+            ["git", "rev-parse", "HEAD"], capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summaries(summaries: dict, baseline: Optional[dict] = None):
+    """Print the summaries by name, with the change of the latency against a baseline.
+
+    They are printed to stderr, which keeps stdout for the JSON results.
+    """
+    print(
+        f"{'':<32} {'count':>7} {'err%':>6} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}",
+        file=sys.stderr,
+    )
+    for name, summary in summaries.items():
+        latency = summary["latency_ms"]
+        line = (
+            f"{name:<32} {summary['count']:>7} {(summary['error_rate'] or 0) * 100:>6.1f}"
+            f" {summary['throughput'] or 0:>9.1f}"
+            + "".join(f" {latency[f'p{percent}'] or 0:>9.2f}" for percent in PERCENTILES)
+        )
+        print(line, file=sys.stderr)
+        previous = (baseline or {}).get(name)
+        if previous:
+            changes = []
+            for percent in PERCENTILES:
+                old, new = previous["latency_ms"][f"p{percent}"], latency[f"p{percent}"]
+                changes.append(f" {(new - old) / old * 100:>+8.1f}%" if old and new else " " * 10)
+            print(f"{'  vs. baseline':<57}" + "".join(changes), file=sys.stderr)
+
+
+def write_results(path, results):
+    """Write the results as JSON to `path`, or to stdout when that is "-"."""
+    text = json.dumps(results, indent=2)
+    if path == "-":
+        print(text)
+    else:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+
+
+def read_baseline(path) -> Optional[dict]:
+    if path is None:
+        return None
+    with open(path) as f:
+        return json.load(f)["results"]
@@ -0,0 +1,102 @@
+"""Microbenchmark for turning result rows into features.
+
+Compares building every feature from a DictCursor row (`build_feature`, as
+`DataSourceBase.execute_queries` used to do) with the compiled projection plans
+on plain tuples (`build_features`).
+
+Usage, from web/geosearch:
+
+    python -m benchmarks.projection [--rows 10000] [--repeat 5]
+"""
+import argparse
+import timeit
+from collections import OrderedDict
+
+from psycopg2.extras import DictRow
+
+from datapunt_geosearch.datasource import DataSourceBase
+
+# The columns of the point query of a temporal dataservices table,
+# with `volgnummer` requested in `_fields`.
+COLUMNS = (
+    "display",
+    "type",
+    "uri",
+    "geometrie",
+    "id",
+    "begin_geldigheid",
+    "eind_geldigheid",
+    "volgnummer",
+    "distance",
+)
+
+
+class FakeDictCursor:
+    """Just enough of a DictCursor to create DictRows."""
+
+    def __init__(self, columns):
+        self.index = OrderedDict((column, position) for position, column in enumerate(columns))
+        self.description = columns
+
+
+def make_rows(count):
+    return [
+        (
+            f"Buurt {i}",
+            "gebieden/buurten",
+            f"https://api.data.amsterdam.nl/v1/gebieden/buurten/{i}/",
+            "0103000020407100000100000005000000",
+            str(i),
+            None,
+            None,
+            1,
+            float(i),
+        )
+        for i in range(count)
+    ]
+
+
+def make_dict_rows(rows):
+    cursor = FakeDictCursor(COLUMNS)
+    dict_rows = []
+    for values in rows:
+        row = DictRow(cursor)
+        row[:] = values
+        dict_rows.append(row)
+    return dict_rows
+
+
+def make_datasource():
+    datasource = DataSourceBase(connection=object())
+    datasource.dataset_field_names = ["volgnummer", "naam"]
+    datasource.field_names_in_query = ["volgnummer"]
+    return datasource
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    datasource = make_datasource()
+    rows = make_rows(args.rows)
+    dict_rows = make_dict_rows(rows)
+    if [datasource.build_feature(row) for row in dict_rows] != datasource.build_features(
+        rows, COLUMNS
+    ):
+        raise SystemExit("build_features does not return the same features as build_feature")
+
+    benchmarks = {
+        "build_feature (DictCursor rows)": lambda: [
+            datasource.build_feature(row) for row in dict_rows
+        ],
+        "build_features (projection plan)": lambda: datasource.build_features(rows, COLUMNS),
+    }
+    for name, benchmark in benchmarks.items():
+        seconds = min(timeit.repeat(benchmark, number=1, repeat=args.repeat))
+        print(f"{name:<36} {args.rows / seconds:>12,.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main()
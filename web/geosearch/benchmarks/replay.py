@@ -0,0 +1,175 @@
+"""Replay recorded search requests against geosearch.
+
+Reads the requests of `/` from a file (or stdin with "-"), one per line, as:
+
+- an access log line, with the request line quoted: `"GET /?x=...&y=... HTTP/1.1"`
+- a uwsgi request log line: `... GET /?x=...&y=... => generated ...`
+- a path: `/?x=...&y=...`
+- a query string, without whitespace: `x=...&y=...`
+- a JSON object with the path in "path", or the query string in "query"
+
+Other requests (such as POST), other lines, blank lines and lines starting
+with "#" are skipped. The requests are sent to the Flask app in this process,
+or to a running geosearch with `--url`, at most `--concurrency` at the same
+time and, with `--rate`, at a fixed number of requests per second.
+
+The latency percentiles, error rate and bytes served are reported per
+combination of requested datasets, and for all requests.
+
+Usage, from web/geosearch:
+
+    python -m benchmarks.replay access.log [--url http://localhost:8022]
+        [--rate 50] [--concurrency 8] [--limit 10000] [--repeat 1]
+        [--token TOKEN] [--output results.json] [--baseline previous.json]
+"""
+import argparse
+import datetime
+import itertools
+import json
+import platform
+import re
+import sys
+from collections import defaultdict
+from typing import Iterable, Iterator, Optional
+from urllib.parse import parse_qs, parse_qsl, urlsplit
+
+from benchmarks import load
+
+# The quoted request line of an access log (combined log format, uwsgi, nginx)
+REQUEST_LINE = re.compile(r'"(?:GET|HEAD) (\S+) HTTP/[\d.]+"')
+# The request of a uwsgi request log line
+UWSGI_REQUEST = re.compile(r"\b(?:GET|HEAD) (\S+) =>")
+
+ALL_DATASETS = "(all datasets)"
+TOTAL = "total"
+
+
+def parse_path(line: str) -> Optional[str]:
+    """Return the path of the search request on a line, or None when there is none."""
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+
+    match = REQUEST_LINE.search(line) or UWSGI_REQUEST.search(line)
+    if match:
+        path = match.group(1)
+    elif line.startswith("{"):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+        if "path" in record:
+            path = str(record["path"])
+        elif "query" in record:
+            path = "/?" + str(record["query"]).lstrip("?")
+        else:
+            return None
+    elif line.startswith("/"):
+        path = line
+    elif is_query_string(line.lstrip("?")):
+        path = "/?" + line.lstrip("?")
+    else:
+        return None
+
+    if urlsplit(path).path != "/":
+        return None
+    return path
+
+
+def is_query_string(line: str) -> bool:
+    """Whether a line is a query string of key=value pairs."""
+    if not line or any(char.isspace() for char in line):
+        return False
+    try:
+        parse_qsl(line, keep_blank_values=True, strict_parsing=True)
+    except ValueError:
+        return False
+    return True
+
+
+def dataset_combination(path: str) -> str:
+    """Return the datasets that are searched by a request, sorted and comma separated."""
+    values = parse_qs(urlsplit(path).query).get("datasets")
+    if not values:
+        return ALL_DATASETS
+    datasets = {name.strip() for value in values for name in value.split(",") if name.strip()}
+    return ",".join(sorted(datasets)) or ALL_DATASETS
+
+
+def read_paths(lines: Iterable[str]) -> Iterator[str]:
+    for line in lines:
+        path = parse_path(line)
+        if path is not None:
+            yield path
+
+
+def summarize_by_combination(samples, seconds) -> dict:
+    """Return the summary of all samples, followed by those of the dataset
+    combinations, most requested first."""
+    by_combination = defaultdict(list)
+    for sample in samples:
+        by_combination[sample.label].append(sample)
+    summaries = {TOTAL: load.summarize(samples, seconds)}
+    for label, group in sorted(by_combination.items(), key=lambda item: -len(item[1])):
+        summaries[label] = load.summarize(group, seconds)
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file", help='file with the recorded requests, "-" for stdin')
+    parser.add_argument(
+        "--url", help="replay against a running geosearch instead of the app in this process"
+    )
+    parser.add_argument("--rate", type=float, help="requests per second (default: unlimited)")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--limit", type=int, help="replay at most this many requests")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the requests this often")
+    parser.add_argument("--token", help="bearer token to send with the requests")
+    parser.add_argument("--output", default="-", help="JSON results file (default: stdout)")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    args = parser.parse_args()
+
+    if args.file == "-":
+        paths = list(itertools.islice(read_paths(sys.stdin), args.limit))
+    else:
+        with open(args.file) as f:
+            paths = list(itertools.islice(read_paths(f), args.limit))
+    if not paths:
+        parser.error(f"No search requests found in {args.file}")
+    requests = [(dataset_combination(path), path) for path in paths] * args.repeat
+
+    if args.url:
+        target = load.HttpTarget(args.url)
+    else:
+        from datapunt_geosearch import create_app
+
+        target = load.InProcessTarget(create_app("datapunt_geosearch.config"))
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else None
+
+    summaries = summarize_by_combination(
+        *load.run(target, requests, concurrency=args.concurrency, rate=args.rate, headers=headers)
+    )
+
+    load.print_summaries(summaries, load.read_baseline(args.baseline))
+    load.write_results(
+        args.output,
+        {
+            "benchmark": "replay",
+            "commit": load.git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "parameters": {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("output", "baseline", "token")
+            },
+            "results": summaries,
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
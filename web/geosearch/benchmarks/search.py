@@ -0,0 +1,353 @@
+"""Benchmark of the search path against a PostGIS database with synthetic datasets.
+
+Creates a `benchmark` dataset with `--tables` tables of `--rows` points or
+polygons each (optionally temporal), registers it in the `datasets_*` tables
+like dso-api does, and measures the latency and throughput of:
+
+- `/` at points where the generated tables have features
+- `/catalogus/`
+- the refresh of the dataset registry, from scratch and when nothing changed
+
+The database is the one of `DSN_DATASERVICES_DATASETS`, so the usual
+DATASERVICES_DB_*_OVERRIDE environment variables apply. Use a database of its
+own, e.g. the `database` service of docker-compose:
+
+    docker compose up -d database
+    export DATASERVICES_DB_HOST_OVERRIDE=localhost DATASERVICES_DB_PORT_OVERRIDE=5432 \\
+        DATASERVICES_DB_USER_OVERRIDE=postgres DATASERVICES_DB_PASSWORD_OVERRIDE=insecure \\
+        DATASERVICES_DB_DATABASE_OVERRIDE=dataservices
+
+Usage, from web/geosearch:
+
+    python -m benchmarks.search [--tables 5] [--rows 10000] [--geometry point|polygon]
+        [--temporal] [--requests 500] [--concurrency 4] [--output results.json]
+        [--baseline previous.json]
+
+The results are written as JSON, with the commit that was checked out,
+so they can be compared between commits with `--baseline`.
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+
+from benchmarks import load
+from psycopg2 import sql
+
+from datapunt_geosearch import create_app
+from datapunt_geosearch.db import dbconnection
+from datapunt_geosearch.registry import registry
+
+DATASET = "benchmark"
+
+# The features are generated within this extent (RD), roughly Amsterdam.
+EXTENT = (110000, 476000, 135000, 494000)
+
+
+def make_schema(tables, temporal):
+    """Return the Amsterdam schema of the benchmark dataset."""
+    properties = {
+        "schema": {"$ref": "https://schemas.data.amsterdam.nl/schema@v1.1.1#/definitions/schema"},
+        "id": {"type": "string"},
+        "name": {"type": "string"},
+        "geometry": {"$ref": "https://geojson.org/schema/Geometry.json"},
+    }
+    table = {"type": "table", "auth": "OPENBAAR", "version": "1.0.0"}
+    if temporal:
+        properties.update(
+            identificatie={"type": "string"},
+            volgnummer={"type": "integer"},
+            beginGeldigheid={"type": "string", "format": "date-time"},
+            eindGeldigheid={"type": "string", "format": "date-time"},
+        )
+        table["temporal"] = {
+            "identifier": "volgnummer",
+            "dimensions": {"geldigOp": ["beginGeldigheid", "eindGeldigheid"]},
+        }
+
+    return {
+        "type": "dataset",
+        "id": DATASET,
+        "title": "Benchmark",
+        "status": "beschikbaar",
+        "version": "0.0.1",
+        "crs": "EPSG:28992",
+        "authorizationGrantor": "n.v.t.",
+        "owner": "Gemeente Amsterdam",
+        "creator": "bronhouder onbekend",
+        "publisher": "Datateam Beheer en Openbare Ruimte",
+        "defaultVersion": "v1",
+        "versions": {
+            "v1": {
+                "status": "beschikbaar",
+                "lifecycleStatus": "stable",
+                "version": "1.0.0",
+                "tables": [
+                    {
+                        **table,
+                        "id": name,
+                        "schema": {
+                            "$schema": "http://json-schema.org/draft-07/schema#",
+                            "type": "object",
+                            "additionalProperties": False,
+                            "identifier": ["identificatie", "volgnummer"] if temporal else ["id"],
+                            "required": ["schema", "id"],
+                            "display": "name",
+                            "properties": properties,
+                        },
+                    }
+                    for name in tables
+                ],
+            }
+        },
+    }
+
+
+METADATA_DDL = """
+CREATE TABLE IF NOT EXISTS "datasets_dataset" (
+  "id" serial NOT NULL PRIMARY KEY,
+  "name" varchar(50) NOT NULL UNIQUE,
+  "path" varchar(50) NOT NULL UNIQUE,
+  "ordering" integer NOT NULL,
+  "enable_api" boolean NOT NULL,
+  "schema_data" varchar NULL,
+  "default_version" varchar NOT NULL,
+  "auth" varchar(150) NULL
+);
+CREATE TABLE IF NOT EXISTS "datasets_datasettable" (
+  "id" serial NOT NULL PRIMARY KEY,
+  "name" varchar(100) NOT NULL,
+  "enable_geosearch" boolean NOT NULL,
+  "db_table" varchar(100) NOT NULL UNIQUE,
+  "auth" varchar(150) NULL,
+  "display_field" varchar(50) NULL,
+  "geometry_field" varchar(50) NULL,
+  "geometry_field_type" varchar(50) NULL,
+  "dataset_id" integer NOT NULL,
+  "id_field" varchar(50) NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "datasets_datasetversion" (
+  "id" serial NOT NULL PRIMARY KEY,
+  "version" varchar(3) NOT NULL,
+  "lifecycle_status" varchar NOT NULL,
+  "dataset_id" integer NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "datasets_datasettable_dataset_versions" (
+  "id" serial NOT NULL PRIMARY KEY,
+  "datasettable_id" integer NOT NULL,
+  "datasetversion_id" integer NOT NULL
+);
+"""
+
+UNREGISTER_SQL = """
+DELETE FROM datasets_datasettable_dataset_versions
+ WHERE datasetversion_id IN (
+   SELECT dv.id FROM datasets_datasetversion dv
+     JOIN datasets_dataset d ON d.id = dv.dataset_id WHERE d.name = %(dataset)s);
+DELETE FROM datasets_datasettable
+ WHERE dataset_id IN (SELECT id FROM datasets_dataset WHERE name = %(dataset)s);
+DELETE FROM datasets_datasetversion
+ WHERE dataset_id IN (SELECT id FROM datasets_dataset WHERE name = %(dataset)s);
+DELETE FROM datasets_dataset WHERE name = %(dataset)s;
+"""
+
+TABLE_DDL = """
+CREATE TABLE {table} (
+  "id" varchar(16) NOT NULL PRIMARY KEY,
+  "identificatie" varchar(16) NOT NULL,
+  "name" varchar(100) NOT NULL,
+  "begin_geldigheid" timestamp without time zone,
+  "eind_geldigheid" timestamp without time zone,
+  "volgnummer" integer,
+  "geometry" geometry({geometry_type}, 28992)
+);
+"""
+
+# The polygons are squares of 10 to 100 meters around the random points.
+INSERT_SQL = """
+INSERT INTO {table} (id, identificatie, name, volgnummer, begin_geldigheid, geometry)
+SELECT
+  CASE WHEN %(temporal)s THEN i || '.1' ELSE i::text END,
+  i::text,
+  'Object ' || i,
+  CASE WHEN %(temporal)s THEN 1 END,
+  CASE WHEN %(temporal)s THEN timestamp '2020-01-01' END,
+  CASE WHEN %(polygon)s THEN ST_Expand(point, 5 + random() * 45) ELSE point END
+FROM (
+  SELECT i, ST_SetSRID(ST_MakePoint(
+    %(xmin)s + random() * (%(xmax)s - %(xmin)s),
+    %(ymin)s + random() * (%(ymax)s - %(ymin)s)
+  ), 28992) AS point
+  FROM generate_series(1, %(rows)s) AS i
+) AS points
+"""
+
+
+def create_dataset(dsn, args):
+    """(Re)create the benchmark dataset, leaving other datasets alone."""
+    tables = [f"t{index}" for index in range(args.tables)]
+    geometry_type = args.geometry.upper()
+    schema_data = json.dumps(make_schema(tables, args.temporal))
+    xmin, ymin, xmax, ymax = EXTENT
+
+    conn = dbconnection(dsn)
+    with conn.cursor() as cur:
+        cur.execute(METADATA_DDL)
+        cur.execute(UNREGISTER_SQL, {"dataset": DATASET})
+        cur.execute(
+            "SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename LIKE %s",
+            (f"{DATASET}\\_%",),
+        )
+        for (table_name,) in cur.fetchall():
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(table_name)))
+
+        cur.execute(
+            """INSERT INTO datasets_dataset
+                 (name, path, ordering, enable_api, schema_data, default_version)
+               VALUES (%s, %s, 1, true, %s, 'v1') RETURNING id""",
+            (DATASET, f"benchmarks/{DATASET}", schema_data),
+        )
+        (dataset_id,) = cur.fetchone()
+        cur.execute(
+            """INSERT INTO datasets_datasetversion (version, lifecycle_status, dataset_id)
+               VALUES ('v1', 'S', %s) RETURNING id""",
+            (dataset_id,),
+        )
+        (version_id,) = cur.fetchone()
+
+        cur.execute("SELECT setseed(%s)", (args.seed / 2**31,))
+        for name in tables:
+            table_name = f"{DATASET}_{name}_v1"
+            table = sql.Identifier(table_name)
+            cur.execute(
+                sql.SQL(TABLE_DDL).format(table=table, geometry_type=sql.SQL(geometry_type))
+            )
+            cur.execute(
+                sql.SQL(INSERT_SQL).format(table=table),
+                dict(
+                    temporal=args.temporal,
+                    polygon=args.geometry == "polygon",
+                    rows=args.rows,
+                    xmin=xmin,
+                    ymin=ymin,
+                    xmax=xmax,
+                    ymax=ymax,
+                ),
+            )
+            cur.execute(sql.SQL("CREATE INDEX ON {} USING gist (geometry)").format(table))
+            cur.execute(sql.SQL("ANALYZE {}").format(table))
+
+            cur.execute(
+                """INSERT INTO datasets_datasettable
+                     (name, enable_geosearch, db_table, display_field, geometry_field,
+                      geometry_field_type, dataset_id, id_field)
+                   VALUES (%s, true, %s, 'name', 'geometry', %s, %s, 'id') RETURNING id""",
+                (name, table_name, geometry_type, dataset_id),
+            )
+            (table_id,) = cur.fetchone()
+            cur.execute(
+                """INSERT INTO datasets_datasettable_dataset_versions
+                     (datasettable_id, datasetversion_id) VALUES (%s, %s)""",
+                (table_id, version_id),
+            )
+    return tables
+
+
+def search_points(dsn, tables, count, seed):
+    """Return `count` points on features of the generated tables."""
+    conn = dbconnection(dsn)
+    query = sql.SQL(" UNION ALL ").join(
+        sql.SQL(
+            "(SELECT ST_X(p), ST_Y(p) FROM (SELECT ST_PointOnSurface(geometry) AS p"
+            " FROM {} ORDER BY id LIMIT %(count)s) AS s)"
+        ).format(sql.Identifier(f"{DATASET}_{name}_v1"))
+        for name in tables
+    )
+    with conn.cursor() as cur:
+        cur.execute(query, {"count": count})
+        points = [tuple(row) for row in cur.fetchall()]
+    # A seeded generator, so runs sample the same points (not for security)
+    random.Random(seed).shuffle(points)  # nosec B311
+    return points[:count]
+
+
+def refresh_registry(full):
+    """Refresh the registry, rebuilding every dataset when `full`."""
+    if full:
+        registry._dataservices_datasets = {}
+        registry._schemas = {}
+    with registry._refresh_lock:
+        registry._refresh()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", type=int, default=5, help="number of tables")
+    parser.add_argument("--rows", type=int, default=10000, help="rows per table")
+    parser.add_argument("--geometry", choices=["point", "polygon"], default="point")
+    parser.add_argument("--temporal", action="store_true", help="generate temporal tables")
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    parser.add_argument("--refreshes", type=int, default=20, help="registry refreshes")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--radius", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--url", help="benchmark a running geosearch instead of the app in this process"
+    )
+    parser.add_argument(
+        "--skip-setup", action="store_true", help="reuse the dataset of the previous run"
+    )
+    parser.add_argument("--output", default="-", help="JSON results file (default: stdout)")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    args = parser.parse_args()
+
+    app = create_app("datapunt_geosearch.config")
+    dsn = app.config["DSN_DATASERVICES_DATASETS"]
+    tables = [f"t{index}" for index in range(args.tables)]
+    with app.app_context():
+        if not args.skip_setup:
+            tables = create_dataset(dsn, args)
+        points = search_points(dsn, tables, args.requests, args.seed)
+    search_paths = [
+        ("search", f"/?x={x:.1f}&y={y:.1f}&radius={args.radius}&datasets={DATASET}")
+        for x, y in points
+    ]
+    catalogus_paths = [("catalogus", "/catalogus/")] * args.requests
+
+    target = load.HttpTarget(args.url) if args.url else load.InProcessTarget(app)
+    # Initialize the registry and the connections before measuring.
+    load.run(target, search_paths[: args.concurrency * 2], concurrency=args.concurrency)
+
+    summaries = {
+        "search": load.summarize(*load.run(target, search_paths, args.concurrency)),
+        "catalogus": load.summarize(*load.run(target, catalogus_paths, args.concurrency)),
+    }
+    if not args.url:
+        with app.app_context():
+            for name, full in (("registry_refresh_full", True), ("registry_refresh", False)):
+                summaries[name] = load.summarize(
+                    *load.timed(name, lambda: refresh_registry(full), args.refreshes)
+                )
+
+    baseline = load.read_baseline(args.baseline)
+    load.print_summaries(summaries, baseline)
+    load.write_results(
+        args.output,
+        {
+            "benchmark": "search",
+            "commit": load.git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "parameters": {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("output", "baseline")
+            },
+            "results": summaries,
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,13 @@ from flask import g
 from opentelemetry.trace import Span
 
 from datapunt_geosearch.blueprints import health, search
-from datapunt_geosearch.db import connection_cache
+from datapunt_geosearch.db import release_connections
 
 
 def deactivate_user_context(e):
-    """Rollback the end user context on any db connections using it."""
-    for conn in connection_cache.values():
-        if conn._active_user:
-            conn.deactivate_end_user()
+    """Rollback the end user context on the db connections of the request,
+    and return them to their pools."""
+    release_connections()
 
 
 def response_hook(span: Span, status: str, response_headers: List):
@@ -29,7 +28,7 @@ def create_app(import_path: str = "datapunt_geosearch.config"):
     CORS(app)
 
     FlaskInstrumentor().instrument_app(
-        app, excluded_urls="/status/health", response_hook=response_hook
+        app, excluded_urls="/status/health,/status/live,/status/ready", response_hook=response_hook
     )
     Psycopg2Instrumentor().instrument(
         enable_commenter=True, commenter_options={"opentelemetry_values": True}
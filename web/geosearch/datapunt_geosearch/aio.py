@@ -0,0 +1,174 @@
+"""Asynchronous execution of the datasource queries.
+
+In the `async` query mode, the queries of all datasources of a request run
+at the same time on a single event loop per process, with asynchronous
+(psycopg 3) database connections. A request no longer needs a thread and a
+connection per datasource while it waits for the database, only the
+connections for the queries that are actually running.
+
+The SQL is still generated by the datasources (with `psycopg2.sql`) and
+converted with `to_async_sql`.
+"""
+import asyncio
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+import psycopg
+from flask import current_app as app
+from psycopg import sql as async_sql
+from psycopg2 import sql
+
+from datapunt_geosearch.db import PoolTimeout, end_user_context
+
+_logger = logging.getLogger(__name__)
+
+# The event loop, running in a daemon thread. Started on first use
+# (so after uwsgi has forked the worker processes).
+_loop = None
+_loop_lock = threading.Lock()
+
+# Connection pools by DSN, only used on the event loop.
+async_pools = {}
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return the event loop for the asynchronous queries, starting it when needed."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="geosearch-asyncio", daemon=True
+            ).start()
+        return _loop
+
+
+def to_async_sql(composable: sql.Composable) -> async_sql.Composable:
+    """Convert a `psycopg2.sql` composable into its psycopg 3 equivalent."""
+    if isinstance(composable, sql.Composed):
+        return async_sql.Composed([to_async_sql(part) for part in composable.seq])
+    if isinstance(composable, sql.SQL):
+        return async_sql.SQL(composable.string)
+    if isinstance(composable, sql.Identifier):
+        return async_sql.Identifier(*composable.strings)
+    if isinstance(composable, sql.Literal):
+        return async_sql.Literal(composable.wrapped)
+    if isinstance(composable, sql.Placeholder):
+        return async_sql.Placeholder(composable.name)
+    raise TypeError(f"Can not convert {composable!r}")
+
+
+class AsyncConnectionPool:
+    """A pool of asynchronous connections for a single DSN.
+
+    - opens connections on demand, at most `max_size` are in use
+    - waits at most `timeout` seconds for a connection when the pool is exhausted
+    - replaces connections that are older than `max_lifetime` seconds
+    - closes connections that were in use when a query failed or was cancelled
+
+    The pool must only be used on the event loop.
+    """
+
+    def __init__(self, dsn, max_size=10, timeout=5, max_lifetime=3600):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self._semaphore = asyncio.Semaphore(max_size)
+        # (created_at, connection), last-in first-out
+        self._idle = collections.deque()
+        self._counters = collections.Counter()
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        """Check out a connection, which goes back to the pool on exit."""
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self._counters["timeouts"] += 1
+            raise PoolTimeout(f"No connection available within {self.timeout} seconds") from None
+
+        try:
+            created_at, connection = await self._checkout()
+            try:
+                yield connection
+            except BaseException:
+                # The state of the connection is unknown, e.g. after a cancelled query.
+                await connection.close()
+                raise
+            self._idle.append((created_at, connection))
+        finally:
+            self._semaphore.release()
+
+    async def _checkout(self):
+        while self._idle:
+            created_at, connection = self._idle.pop()
+            if connection.closed or time.monotonic() - created_at > self.max_lifetime:
+                await connection.close()
+                continue
+            return created_at, connection
+
+        self._counters["connects"] += 1
+        # Text is always returned as str, also from databases with the SQL_ASCII encoding.
+        connection = await psycopg.AsyncConnection.connect(
+            self.dsn, autocommit=True, client_encoding="utf8"
+        )
+        return time.monotonic(), connection
+
+    def stats(self):
+        return {
+            "idle": len(self._idle),
+            "max_size": self.max_size,
+            **self._counters,
+        }
+
+
+def get_async_pool(dsn, **settings) -> AsyncConnectionPool:
+    """Returns the asynchronous connection pool for a DSN, creating it on first use."""
+    if dsn not in async_pools:
+        async_pools[dsn] = AsyncConnectionPool(dsn, **settings)
+    return async_pools[dsn]
+
+
+class AsyncDBConnection:
+    """The asynchronous counterpart of `_DBConnection`, for a datasource of a request.
+
+    It is created in the request, which determines the end user role,
+    and used on the event loop. Every cursor has a connection of its own,
+    so the datasources of a request can be queried at the same time.
+    """
+
+    def __init__(self, dsn, set_user_role=False):
+        self.dsn = dsn
+        self.set_user_role = set_user_role
+        self.end_user = end_user_context(set_user_role)
+        self.pool_settings = dict(
+            max_size=app.config.get("DB_POOL_MAX_SIZE", 10),
+            timeout=app.config.get("DB_POOL_TIMEOUT", 5),
+            max_lifetime=app.config.get("DB_POOL_MAX_LIFETIME", 3600),
+        )
+
+    @contextlib.asynccontextmanager
+    async def cursor(self):
+        """Yields a cursor, in the role of the end user when that is enabled."""
+        async with get_async_pool(self.dsn, **self.pool_settings).connection() as conn:
+            if self.end_user is None:
+                async with conn.cursor() as cur:
+                    yield cur
+                return
+
+            role_name, app_name = self.end_user
+            # As with _DBConnection, the role is only switched for a transaction
+            # that is rolled back afterwards.
+            async with conn.transaction(force_rollback=True):
+                await conn.execute(
+                    async_sql.SQL("SET LOCAL ROLE {}").format(async_sql.Identifier(role_name))
+                )
+                await conn.execute(
+                    async_sql.SQL("SET application_name TO {}").format(async_sql.Literal(app_name))
+                )
+                async with conn.cursor() as cur:
+                    yield cur
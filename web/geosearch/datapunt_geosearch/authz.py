@@ -2,14 +2,18 @@ import functools
 import json
 import logging
 import re
+import threading
+import time
 
 import requests
 from flask import abort, current_app, g
 from flask import request as flask_request
-from jwcrypto.common import JWException
+from jwcrypto.common import JWException, base64url_decode, json_decode
 from jwcrypto.jwk import JWKSet
 from jwcrypto.jwt import JWT, JWTExpired, JWTMissingKey
 
+from datapunt_geosearch.claims_cache import get_claims_cache
+
 logger = logging.getLogger("auth")
 logger.setLevel(logging.INFO)
 
@@ -47,28 +51,36 @@ def check_authentication(request):
         - sets user defined in JWT token on appcontext
 
     Aborts with 401 in case Authorization header contains incorrect token.
+
+    The claims of verified tokens are cached until the token expires, see `claims_cache`.
     """
     g.authz_scopes = None
     g.token_subject = None
     token = get_token_from_request(request=request)
     if token is not None:
-        try:
-            jwt = JWT(
-                jwt=token,
-                key=current_app.config.get("JW_KEYSET"),
-                algs=current_app.config.get("JWKS_SIGNING_ALGORITHMS"),
-            )
-        except JWTMissingKey as e:
-            logger.warning("Auth problem: unknown key. {}".format(e))
-            abort(401, "Incorrect Bearer. Unknown key.")
-        except JWTExpired as e:
-            logger.warning("Auth problem: expired JWT. {}".format(e))
-            abort(401, "Expired JWT.")
-        except ValueError as e:
-            logger.warning("Auth problem: incorrect token. {}".format(e))
-            abort(401, "Incorrect Bearer.")
-
-        claims = get_claims(jwt)
+        claims_cache = get_claims_cache()
+        cached = (
+            claims_cache.get(token, get_current_keyset()) if claims_cache is not None else None
+        )
+        if cached is not None:
+            claims = cached.claims
+        else:
+            try:
+                jwt = verify_token(token)
+            except JWTMissingKey as e:
+                logger.warning("Auth problem: unknown key. {}".format(e))
+                abort(401, "Incorrect Bearer. Unknown key.")
+            except JWTExpired as e:
+                logger.warning("Auth problem: expired JWT. {}".format(e))
+                abort(401, "Expired JWT.")
+            except ValueError as e:
+                logger.warning("Auth problem: incorrect token. {}".format(e))
+                abort(401, "Incorrect Bearer.")
+
+            claims = get_claims(jwt)
+            if claims_cache is not None:
+                claims_cache.set(token, jwt, get_current_keyset(), claims)
+
         if claims:
             g.authz_scopes = claims["scopes"]
             g.token_subject = claims["sub"]
@@ -82,6 +94,38 @@ def check_authentication(request):
             )
 
 
+def get_current_keyset() -> JWKSet:
+    """Return the keyset of the JW_KEYSET setting, which is a JWKSet or a KeysetManager."""
+    keys = current_app.config.get("JW_KEYSET")
+    return keys.keyset if isinstance(keys, KeysetManager) else keys
+
+
+def verify_token(token) -> JWT:
+    """Return the verified JWT of a token.
+
+    When the token is signed with a key that is not in the keyset, the keys of
+    a KeysetManager are reloaded (rate limited) and the token is verified again.
+    """
+    algs = current_app.config.get("JWKS_SIGNING_ALGORITHMS")
+    try:
+        return JWT(jwt=token, key=get_current_keyset(), algs=algs)
+    except JWTMissingKey:
+        keys = current_app.config.get("JW_KEYSET")
+        if not isinstance(keys, KeysetManager) or not keys.reload_missing_key(
+            get_token_kid(token)
+        ):
+            raise
+    return JWT(jwt=token, key=keys.keyset, algs=algs)
+
+
+def get_token_kid(token):
+    """Return the `kid` of the (unverified) header of a token, or None."""
+    try:
+        return json_decode(base64url_decode(token.split(".", 1)[0])).get("kid")
+    except (ValueError, AttributeError):
+        return None
+
+
 def get_token_from_request(request):
     """
     Parse request and get Auth token from it, if Authorization header is set.
@@ -146,6 +190,104 @@ def load_jwks_from_url(keyset, jwks_url):
         logger.info("Loaded JWKS from JWKS_URL setting {}".format(jwks_url))
 
 
+class KeysetManager:
+    """The keyset to verify tokens with, with the keys of a JWKS URL.
+
+    The keys of `jwks` are available right away. The keys of `jwks_url` are
+    loaded in a background thread, started on first use (so after uwsgi has
+    forked the worker processes), and reloaded every `refresh_interval` seconds.
+    Keys that have been loaded already (by the warm-up in the uwsgi master) are
+    only reloaded when their `refresh_interval` has passed.
+    When loading fails, the keys that were loaded before keep being used and
+    loading is retried after `min_reload_interval` seconds.
+
+    A token signed with an unknown key triggers a reload, at most once per
+    `min_reload_interval` seconds, so rotated keys are used right away.
+    """
+
+    def __init__(self, jwks=None, jwks_url=None, refresh_interval=3600, min_reload_interval=60):
+        self.jwks = jwks
+        self.jwks_url = jwks_url
+        self.refresh_interval = refresh_interval
+        self.min_reload_interval = min_reload_interval
+        self._keyset = get_keyset(jwks=jwks)
+        self._lock = threading.RLock()
+        self._thread = None
+        self._reloaded_at = None
+        self.loaded_at = None
+        self.last_error = None
+        self.reloads = 0
+
+    @property
+    def keyset(self) -> JWKSet:
+        if self.jwks_url and self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._reload_worker, name="geosearch-jwks", daemon=True
+                    )
+                    self._thread.start()
+        return self._keyset
+
+    def _reload_worker(self):
+        if self.loaded_at is not None:
+            time.sleep(max(0, self.loaded_at + self.refresh_interval - time.time()))
+        while True:
+            interval = self.refresh_interval if self.reload() else self.min_reload_interval
+            time.sleep(interval)
+
+    def reload(self) -> bool:
+        """Load the keys of the URL and swap them in. Returns False when loading failed."""
+        with self._lock:
+            self._reloaded_at = time.monotonic()
+            keyset = get_keyset(jwks=self.jwks)
+            try:
+                load_jwks_from_url(keyset=keyset, jwks_url=self.jwks_url)
+            except ValueError as e:
+                self.last_error = str(e)
+                logger.warning("Keeping the current keys. {}".format(e))
+                return False
+
+            # Keep the key objects that did not change, the claims cache
+            # depends on their identity.
+            current = self._keyset
+            self._keyset = JWKSet()
+            for key in keyset["keys"]:
+                kid = key.get("kid")
+                previous = current.get_key(kid) if kid is not None else None
+                if previous is not None and previous.export() == key.export():
+                    key = previous
+                self._keyset.add(key)
+            self.loaded_at = time.time()
+            self.last_error = None
+            self.reloads += 1
+            return True
+
+    def reload_missing_key(self, kid) -> bool:
+        """Reload the keys for a token that is signed with an unknown key.
+
+        Returns True when the keyset has the key afterwards.
+        """
+        if not self.jwks_url or kid is None:
+            return False
+        with self._lock:
+            # Another request may have reloaded the keys in the meantime
+            if self._keyset.get_key(kid) is None and (
+                self._reloaded_at is None
+                or time.monotonic() - self._reloaded_at >= self.min_reload_interval
+            ):
+                self.reload()
+            return self._keyset.get_key(kid) is not None
+
+    def stats(self):
+        return {
+            "keys": len(self._keyset["keys"]),
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
+
+
 def convert_scope(scope):
     """
     Convert Keycloak role to authz style scope
@@ -11,13 +11,91 @@ from opentelemetry.sdk.resources import SERVICE_NAME, Resource
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
 
-from datapunt_geosearch.authz import get_keyset
+from datapunt_geosearch.authz import KeysetManager
 
 DATABASE_SET_ROLE = os.getenv("DATABASE_SET_ROLE", False)
 CLOUD_ENV = os.getenv("CLOUD_ENV", "CLOUDVPS")
 
 db_connection_string = "postgresql://{username}:{password}@{host}:{port}/{db}"
 
+# How the engine queries the datasources of a request:
+#  - sequential: one query per table
+#  - union: one UNION ALL query for all tables that share a database connection
+#  - concurrent: datasources are queried in parallel, on their own connections
+#  - async: datasources are queried at the same time on an event loop, with
+#    asynchronous connections
+QUERY_MODE = os.getenv("QUERY_MODE", "sequential")
+# Number of worker threads per process for the concurrent query mode
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", 4))
+
+# Search responses are streamed in chunks of this many bytes. A smaller chunk is
+# sent when a datasource is done.
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 32768))
+
+# In-process cache for the results of the database datasources, in bytes per process.
+# 0 disables the cache.
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 0))
+# Seconds that results are cached, defaults to the refresh interval of the registry.
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 0))
+# Coordinates are rounded to these precisions (meters and degrees) in the cache keys
+RESULT_CACHE_PRECISION_RD = float(os.getenv("RESULT_CACHE_PRECISION_RD", 0.1))
+RESULT_CACHE_PRECISION_WGS84 = float(os.getenv("RESULT_CACHE_PRECISION_WGS84", 0.000001))
+
+# Execute the datasource queries as server side prepared statements.
+# Do not enable this behind a transaction pooling proxy (e.g. PgBouncer).
+PREPARED_STATEMENTS = os.getenv("PREPARED_STATEMENTS", "False").lower() in ("true", "1")
+
+# Polygon tables with at most this many rows and bytes of geometry data are kept in
+# an in-memory spatial index, refreshed with the registry. 0 rows disables the index.
+SPATIAL_INDEX_MAX_ROWS = int(os.getenv("SPATIAL_INDEX_MAX_ROWS", 0))
+SPATIAL_INDEX_MAX_BYTES = int(os.getenv("SPATIAL_INDEX_MAX_BYTES", 50_000_000))
+# Seconds after which the indexed tables of unchanged datasets are loaded again.
+SPATIAL_INDEX_MAX_AGE = int(os.getenv("SPATIAL_INDEX_MAX_AGE", 3600))
+
+# Let the database assemble the features as JSON text, instead of building
+# and serializing them in Python.
+DATABASE_JSON = os.getenv("DATABASE_JSON", "False").lower() in ("true", "1")
+
+# Load the dataset registry and the keys before uwsgi forks the workers, and open the
+# connection pools of every worker right after the fork.
+WARMUP = os.getenv("WARMUP", "True").lower() in ("true", "1")
+
+# File in which the rows of the dataset registry are shared by the processes of a host,
+# so only one of them queries the dataservices database per refresh. Empty disables it.
+REGISTRY_SNAPSHOT_PATH = os.getenv("REGISTRY_SNAPSHOT_PATH", "")
+
+# Directory in which the processes of a host share their metrics, so /status/metrics
+# serves the metrics of all uwsgi workers. Empty serves those of the process itself.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+
+# Seconds that the result of pinging the database is reused by the readiness probe, and
+# between the queries on a dataset of the background health check.
+HEALTH_CHECK_CACHE_SECONDS = float(os.getenv("HEALTH_CHECK_CACHE_SECONDS", 10))
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 60))
+
+# Database connection pool, per process and per DSN.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+# Seconds after which a connection is replaced
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 3600))
+# Seconds after which an idle connection beyond DB_POOL_MIN_SIZE is closed
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", 600))
+# Seconds to wait for a connection when all connections are in use
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+# Connections that have been idle for more seconds are pinged on checkout
+DB_POOL_CHECK_IDLE = float(os.getenv("DB_POOL_CHECK_IDLE", 30))
+
+# External datasources: connections (and concurrent requests) per base URL,
+# and the timeout of a request in seconds.
+EXTERNAL_MAX_CONNECTIONS = int(os.getenv("EXTERNAL_MAX_CONNECTIONS", 10))
+EXTERNAL_TIMEOUT = float(os.getenv("EXTERNAL_TIMEOUT", 1))
+# Requests to a base URL are stopped after this many consecutive failures, and
+# tried again after EXTERNAL_RESET_TIMEOUT seconds.
+EXTERNAL_MAX_FAILURES = int(os.getenv("EXTERNAL_MAX_FAILURES", 5))
+EXTERNAL_RESET_TIMEOUT = float(os.getenv("EXTERNAL_RESET_TIMEOUT", 30))
+# Seconds that responses of external datasources are cached, 0 disables the cache.
+EXTERNAL_CACHE_TTL = float(os.getenv("EXTERNAL_CACHE_TTL", 0))
+
 # Configure OpenTelemetry to use Azure Monitor with the
 # APPLICATIONINSIGHTS_CONNECTION_STRING environment variable.
 APPLICATIONINSIGHTS_CONNECTION_STRING = os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING")
@@ -119,4 +197,19 @@ JWKS_SIGNING_ALGORITHMS = [
     "RS512",
 ]
 
-JW_KEYSET = get_keyset(jwks=JWKS, jwks_url=JWKS_URL)
+# The keys of JWKS_URL are loaded in the background and reloaded every JWKS_REFRESH_INTERVAL
+# seconds. Tokens signed with an unknown key trigger a reload, at most once per
+# JWKS_MIN_RELOAD_INTERVAL seconds.
+JWKS_REFRESH_INTERVAL = int(os.getenv("JWKS_REFRESH_INTERVAL", 3600))
+JWKS_MIN_RELOAD_INTERVAL = int(os.getenv("JWKS_MIN_RELOAD_INTERVAL", 60))
+
+JW_KEYSET = KeysetManager(
+    jwks=JWKS,
+    jwks_url=JWKS_URL,
+    refresh_interval=JWKS_REFRESH_INTERVAL,
+    min_reload_interval=JWKS_MIN_RELOAD_INTERVAL,
+)
+
+# Number of verified tokens per process whose claims are cached until they expire.
+# 0 disables the cache.
+JWT_CLAIMS_CACHE_SIZE = int(os.getenv("JWT_CLAIMS_CACHE_SIZE", 1000))
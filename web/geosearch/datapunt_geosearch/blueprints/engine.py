@@ -1,5 +1,12 @@
+import asyncio
 import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from cachetools import LRUCache
+from psycopg2 import Error as Psycopg2Error
 from schematools.naming import to_snake_case
 
 try:
@@ -8,43 +15,278 @@ except ImportError:
     import json
 
 from flask import current_app as app
+from flask import g
 
+from datapunt_geosearch.aio import AsyncDBConnection, get_event_loop
+from datapunt_geosearch.datasource import execute_union_queries
+from datapunt_geosearch.db import dedicated_connection, end_user_role
+from datapunt_geosearch.metrics import record_serialization, record_streamed
 from datapunt_geosearch.registry import registry
+from datapunt_geosearch.result_cache import get_result_cache
 
 _logger = logging.getLogger(__name__)
 
+QUERY_MODE_SEQUENTIAL = "sequential"
+QUERY_MODE_UNION = "union"
+QUERY_MODE_CONCURRENT = "concurrent"
+QUERY_MODE_ASYNC = "async"
+
+# Yielded by `query_datasources` when a datasource is done, the chunk that is
+# pending is sent then.
+FLUSH = object()
+
+# Worker pool for the concurrent query mode, created on first use
+# (so after uwsgi has forked the worker processes).
+_executor = None
+
+# WGS84 coordinates projected to the CRS of the datasources, by (lat, lon, srid).
+_projection_cache = LRUCache(maxsize=4096)
+_projection_lock = threading.Lock()
+
 
 def generate_async(request_args, authz_scopes=None):
+    """Yield the FeatureCollection for the request, in chunks of bytes.
+
+    The header is yielded right away, so the time to the first byte does not
+    depend on the datasources.
+    """
+    parts = generate_feature_collection(request_args, authz_scopes)
+    yield next(parts)
+    yield from buffer_chunks(parts, chunk_size=app.config.get("STREAM_CHUNK_SIZE", 32768))
+
+
+def generate_feature_collection(request_args, authz_scopes=None):
     datasets = request_args.get("datasets", "").split(",")
 
     first_item = True
-    yield '{"type": "FeatureCollection", "features": ['
-    for ds in registry.filter_datasources(names=datasets, scopes=authz_scopes):
-        for row in fetch_data(ds, request_args, datasets):
-            if first_item:
-                first_item = False
-            else:
-                yield ","
-            yield json.dumps(row)
-    yield "]}"
-
-
-def fetch_data(sourceClass, request_args, datasets):
-    dsn = None
-    if sourceClass.dsn_name is not None:
-        try:
-            dsn = app.config[sourceClass.dsn_name]
-        except AttributeError:
-            _logger.error(
-                "Can not find configuration for %s." % sourceClass.dsn_name,
-                exc_info=True,
-            )
-            return []
+    yield b'{"type": "FeatureCollection", "features": ['
+    source_classes = registry.filter_datasources(names=datasets, scopes=authz_scopes)
+    for feature in query_datasources(source_classes, request_args, datasets, authz_scopes):
+        if feature is FLUSH:
+            yield FLUSH
+            continue
+        if first_item:
+            first_item = False
+        else:
+            yield b","
+        yield feature
+    yield b"]}"
+
+
+def buffer_chunks(parts, chunk_size):
+    """Join the `parts` (str or bytes) into chunks of at least `chunk_size` bytes.
+
+    A smaller chunk is sent at a `FLUSH`, when a datasource is done, so results
+    that are available are not held back while the next datasource is queried.
+    """
+    buffer = bytearray()
+    for part in parts:
+        if part is FLUSH:
+            if buffer:
+                yield bytes(buffer)
+                buffer.clear()
+            continue
+        buffer += part.encode() if isinstance(part, str) else part
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def query_datasources(source_classes, request_args, datasets, authz_scopes=None):
+    """Yield the serialized features (bytes) of all `source_classes`, with a `FLUSH`
+    after the cached results and after every datasource that has been queried.
+
+    Results of database datasources are served from the result cache when
+    possible. The other datasources are queried using the configured QUERY_MODE.
+    """
+    cache = get_result_cache()
+    cache_keys = {}
+    for sourceClass in source_classes:
+        key = None
+        if cache is not None and sourceClass.dsn_name is not None:
+            key = result_cache_key(sourceClass, request_args, datasets, authz_scopes)
+            features = cache.get(key)
+            if features is not None:
+                record_streamed(
+                    metrics_dataset(sourceClass),
+                    sourceClass.dsn_name,
+                    sum(len(feature) for feature in features),
+                )
+                yield from features
+                continue
+        cache_keys[sourceClass] = key
+    yield FLUSH
+
+    request_args = project_coordinates(list(cache_keys), request_args)
+    for sourceClass, features in fetch_all_data(list(cache_keys), request_args, datasets):
+        if features is None:
+            # Failed, nothing to show (or to cache)
+            continue
+        # Features can already be serialized by the database (DATABASE_JSON).
+        start = time.perf_counter()
+        serialized = tuple(serialize_feature(feature) for feature in features)
+        dataset = metrics_dataset(sourceClass)
+        record_serialization(dataset, sourceClass.dsn_name, time.perf_counter() - start)
+        record_streamed(dataset, sourceClass.dsn_name, sum(len(feature) for feature in serialized))
+        if cache_keys[sourceClass] is not None:
+            cache.set(cache_keys[sourceClass], serialized)
+        yield from serialized
+        yield FLUSH
+
+
+def serialize_feature(feature) -> bytes:
+    """Return the JSON of a feature, as bytes."""
+    if isinstance(feature, str):
+        # Serialized by the database (DATABASE_JSON)
+        return feature.encode()
+    serialized = json.dumps(feature)
+    # orjson returns bytes, the json module str
+    return serialized if isinstance(serialized, bytes) else serialized.encode()
+
+
+def metrics_dataset(sourceClass):
+    """The value of the dataset label in the metrics of a datasource class: the
+    "<dataset>/<table>" key of its table, as in the query metrics (comma separated
+    for datasources with several tables)."""
+    return ",".join(
+        sorted(
+            f"{dataset}/{dataset_ident}"
+            for dataset, tables in sourceClass.metadata["datasets"].items()
+            for dataset_ident in tables
+        )
+    )
+
+
+def fetch_all_data(source_classes, request_args, datasets):
+    """Yield `(sourceClass, features)` for all `source_classes`, using the configured
+    QUERY_MODE. The features are None when the data could not be fetched."""
+    query_mode = app.config.get("QUERY_MODE", QUERY_MODE_SEQUENTIAL)
+    if query_mode == QUERY_MODE_UNION:
+        yield from fetch_data_union(source_classes, request_args, datasets)
+    elif query_mode == QUERY_MODE_CONCURRENT:
+        yield from fetch_data_concurrent(source_classes, request_args, datasets)
+    elif query_mode == QUERY_MODE_ASYNC:
+        yield from fetch_data_async(source_classes, request_args, datasets)
+    else:
+        for sourceClass in source_classes:
+            yield sourceClass, fetch_data(sourceClass, request_args, datasets)
+
+
+def project_coordinates(source_classes, request_args):
+    """Return the `request_args` with WGS84 coordinates projected to the CRS of
+    the database datasources in `source_classes`, as `{srid: (x, y)}` in "projected".
+
+    The coordinates are projected once per request (and CRS) instead of in
+    every query. When that fails, the queries project the coordinates themselves.
+    """
+    request_args = dict(request_args, projected=None)
+    classes = [sourceClass for sourceClass in source_classes if sourceClass.dsn_name is not None]
+    if request_args["rd"] or not classes:
+        return request_args
+
+    try:
+        request_args["projected"] = project_wgs84(
+            float(request_args["x"]),
+            float(request_args["y"]),
+            {sourceClass.get_srid() for sourceClass in classes},
+            classes[0],
+        )
+    except (KeyError, Psycopg2Error):
+        _logger.warning("Failed to project the coordinates of the request", exc_info=True)
+    return request_args
+
+
+def project_wgs84(lat, lon, srids, sourceClass):
+    """Return `{srid: (x, y)}` for a WGS84 point in every CRS of `srids`.
+
+    The projections that are not cached are done with a single query, on a
+    connection of the pool of `sourceClass` that is returned right after it.
+    The request does not hold on to it, the concurrent query modes use their
+    own connections anyway.
+    """
+    with _projection_lock:
+        projected = {
+            srid: _projection_cache[(lat, lon, srid)]
+            for srid in srids
+            if (lat, lon, srid) in _projection_cache
+        }
+    missing = sorted(set(srids).difference(projected))
+    if not missing:
+        return projected
+
+    with dedicated_connection(
+        get_dsn(sourceClass), set_user_role=sourceClass.set_user_role
+    ) as connection, connection.cursor() as cur:
+        cur.execute(
+            "SELECT srid, ST_X(point), ST_Y(point) FROM ("
+            " SELECT srid, ST_Transform(ST_SetSRID(ST_MakePoint(%(lon)s, %(lat)s), 4326), srid)"
+            " AS point FROM unnest(%(srids)s::int[]) AS srid"
+            ") AS projected",
+            {"lat": lat, "lon": lon, "srids": missing},
+        )
+        rows = cur.fetchall()
+
+    with _projection_lock:
+        for srid, x, y in rows:
+            projected[srid] = _projection_cache[(lat, lon, srid)] = (x, y)
+    return projected
+
+
+def result_cache_key(sourceClass, request_args, datasets, authz_scopes=None):
+    """Return the key for the results of `sourceClass` in the result cache.
+
+    The coordinates are quantised, so that clicks that are (almost) on the same
+    spot share their results. The key contains everything else that can make
+    a difference for the result, including the authorization of the caller.
+    """
+    if request_args["rd"]:
+        precision = app.config.get("RESULT_CACHE_PRECISION_RD", 0.1)
+    else:
+        precision = app.config.get("RESULT_CACHE_PRECISION_WGS84", 0.000001)
+
+    served = set()
+    for dataset, tables in sourceClass.metadata["datasets"].items():
+        served.add(dataset)
+        served.update(f"{dataset}/{table}" for table in tables)
 
-    datasource = sourceClass(dsn=dsn)
+    return (
+        sourceClass,
+        round(float(request_args["x"]) / precision),
+        round(float(request_args["y"]) / precision),
+        bool(request_args["rd"]),
+        request_args.get("radius") or None,
+        request_args["limit"] or None,
+        tuple(sorted(served.intersection(datasets))),
+        tuple(sorted(fn for fn in request_args.get("_fields", "").split(",") if fn)),
+        frozenset(authz_scopes or ()),
+        end_user_role() if sourceClass.set_user_role else None,
+    )
+
+
+def get_dsn(sourceClass):
+    """Return the connection string for a datasource class.
+
+    Raises a KeyError when there is no configuration for the `dsn_name`.
+    """
+    if sourceClass.dsn_name is None:
+        return None
+    return app.config[sourceClass.dsn_name]
+
+
+def configure_datasource(datasource, request_args):
+    """Set the request parameters on a datasource instance."""
+    datasource.prepare_statements = app.config.get("PREPARED_STATEMENTS", False)
+    datasource.database_json = app.config.get("DATABASE_JSON", False)
     datasource.use_rd = request_args["rd"]
     datasource.x = float(request_args["x"])
     datasource.y = float(request_args["y"])
+    projected = request_args.get("projected")
+    if projected and datasource.dsn_name is not None:
+        # The WGS84 coordinates were already projected to the CRS of the datasource.
+        datasource.use_rd = True
+        datasource.x, datasource.y = projected[datasource.get_srid()]
     if request_args.get("radius"):
         datasource.radius = request_args.get("radius")
 
@@ -54,11 +296,169 @@ def fetch_data(sourceClass, request_args, datasets):
     if field_names_in_query := request_args.get("_fields", "").split(","):
         # We collect extra field_names that need to be in the resulting response
         datasource.field_names_in_query = [to_snake_case(fn) for fn in field_names_in_query if fn]
+    return datasource
+
+
+def fetch_data(sourceClass, request_args, datasets, connection=None):
+    """Query a datasource class. Returns None when that fails."""
+    try:
+        dsn = get_dsn(sourceClass)
+    except KeyError:
+        _logger.error(
+            "Can not find configuration for %s." % sourceClass.dsn_name,
+            exc_info=True,
+        )
+        return None
+
+    datasource = configure_datasource(sourceClass(dsn=dsn, connection=connection), request_args)
 
     try:
         response = datasource.execute_queries(datasets=datasets)
     except Exception:
         _logger.error("Failed to fetch data from %s" % datasource, exc_info=True)
-        return []
+        return None
     else:
         return response
+
+
+def fetch_data_union(source_classes, request_args, datasets):
+    """Fetch the data of all datasource classes that share a database
+    with a single `UNION ALL` query per connection.
+
+    The classes are grouped by connection and by CRS, as the branches of a union
+    share the (projected) coordinates of the request. Classes without a database
+    (external datasources) and classes that are the only one in their group are
+    queried one by one. When the combined query fails, the classes of that group
+    fall back to separate queries.
+
+    Yields `(sourceClass, features)` per class.
+    """
+    groups = defaultdict(list)
+    for sourceClass in source_classes:
+        groups[(sourceClass.dsn_name, sourceClass.set_user_role, sourceClass.get_srid())].append(
+            sourceClass
+        )
+
+    for (dsn_name, _set_user_role, _srid), classes in groups.items():
+        if dsn_name is None or len(classes) == 1:
+            for sourceClass in classes:
+                yield sourceClass, fetch_data(sourceClass, request_args, datasets)
+            continue
+
+        try:
+            dsn = app.config[dsn_name]
+            datasources = [
+                configure_datasource(sourceClass(dsn=dsn), request_args) for sourceClass in classes
+            ]
+            results = execute_union_queries(datasources, datasets=datasets)
+        except Exception:
+            _logger.error(
+                "Failed to fetch data from %s with a union query" % dsn_name, exc_info=True
+            )
+            for sourceClass in classes:
+                yield sourceClass, fetch_data(sourceClass, request_args, datasets)
+            continue
+
+        yield from zip(classes, results)
+
+
+def get_executor():
+    """Return the worker pool for concurrent queries."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config.get("QUERY_WORKERS", 4), thread_name_prefix="geosearch-query"
+        )
+    return _executor
+
+
+def fetch_data_concurrent(source_classes, request_args, datasets):
+    """Fetch the data of all datasource classes in the worker pool.
+
+    Every datasource is queried on its own database connection.
+    `(sourceClass, features)` is yielded as soon as the queries of a datasource
+    have completed, so the slowest table determines the latency instead
+    of the sum of all tables.
+    """
+    flask_app = app._get_current_object()
+    email = g.get("email")
+    futures = {
+        get_executor().submit(
+            fetch_data_in_worker, flask_app, email, sourceClass, request_args, datasets
+        ): sourceClass
+        for sourceClass in source_classes
+    }
+    try:
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # Do not run the remaining queries when the client went away.
+        for future in futures:
+            future.cancel()
+
+
+def fetch_data_in_worker(flask_app, email, sourceClass, request_args, datasets):
+    """Run `fetch_data` in a worker thread, on a connection of its own.
+
+    Worker threads have no request context, so the application context is
+    pushed here and the end user is copied for the role switching.
+    """
+    with flask_app.app_context():
+        g.email = email
+        if sourceClass.dsn_name is None:
+            return fetch_data(sourceClass, request_args, datasets)
+
+        try:
+            with dedicated_connection(
+                get_dsn(sourceClass), set_user_role=sourceClass.set_user_role
+            ) as connection:
+                return fetch_data(sourceClass, request_args, datasets, connection=connection)
+        except Exception:
+            _logger.error("Failed to fetch data from %s" % sourceClass.__name__, exc_info=True)
+            return None
+
+
+def fetch_data_async(source_classes, request_args, datasets):
+    """Fetch the data of all datasource classes on the event loop.
+
+    The datasources are queried at the same time, with asynchronous
+    database connections. `(sourceClass, features)` is yielded as soon as
+    the queries of a datasource have completed.
+    """
+    loop = get_event_loop()
+    futures = {}
+    for sourceClass in source_classes:
+        try:
+            dsn = get_dsn(sourceClass)
+            connection = (
+                AsyncDBConnection(dsn, set_user_role=sourceClass.set_user_role)
+                if dsn is not None
+                else None
+            )
+            datasource = configure_datasource(
+                sourceClass(dsn=dsn, connection=connection), request_args
+            )
+        except Exception:
+            _logger.error("Failed to fetch data from %s" % sourceClass.__name__, exc_info=True)
+            yield sourceClass, None
+            continue
+
+        future = asyncio.run_coroutine_threadsafe(
+            datasource.execute_queries_async(datasets=datasets), loop
+        )
+        futures[future] = sourceClass
+
+    try:
+        for future in as_completed(futures):
+            try:
+                features = future.result()
+            except Exception:
+                _logger.error(
+                    "Failed to fetch data from %s" % futures[future].__name__, exc_info=True
+                )
+                features = None
+            yield futures[future], features
+    finally:
+        # Do not run the remaining queries when the client went away.
+        for future in futures:
+            future.cancel()
@@ -5,7 +5,15 @@ import time
 
 from flask import Blueprint, Response, current_app
 
+from datapunt_geosearch.authz import KeysetManager
+from datapunt_geosearch.claims_cache import get_claims_cache
+from datapunt_geosearch.db import pool_stats
+from datapunt_geosearch.health_check import get_health_check
+from datapunt_geosearch.http_client import http_stats
+from datapunt_geosearch.metrics import render_prometheus
 from datapunt_geosearch.registry import registry
+from datapunt_geosearch.result_cache import get_result_cache
+from datapunt_geosearch.warmup import is_ready
 
 health = Blueprint("health", __name__)
 
@@ -14,12 +22,24 @@ logger = logging.getLogger(__name__)
 
 @health.route("/status", methods=["GET", "HEAD", "OPTIONS"])
 def system_status():
+    result_cache = get_result_cache()
+    claims_cache = get_claims_cache()
+    keys = current_app.config.get("JW_KEYSET")
     message = json.dumps(
         {
             "Delay": registry.INITIALIZE_DELAY_SECONDS,
             "Datasets initialized": registry._datasets_initialized,
             "Time since last refresh": time.time()
             - (registry._datasets_initialized or time.time()),
+            "Registry refreshing": registry.refreshing,
+            "Registry refresh": registry.refresh_stats,
+            "Registry snapshot generation": registry._snapshot_generation,
+            "Connection pools": pool_stats(),
+            "External datasources": http_stats(),
+            "Result cache": result_cache.stats() if result_cache is not None else None,
+            "Claims cache": claims_cache.stats() if claims_cache is not None else None,
+            "Keyset": keys.stats() if isinstance(keys, KeysetManager) else None,
+            "Health check": get_health_check().stats(),
         }
     )
     return Response(message, content_type="application/json")
@@ -27,36 +47,33 @@ def system_status():
 
 @health.route("/status/force-refresh", methods=["GET", "HEAD", "OPTIONS"])
 def force_refresh():
-    registry._datasets_initialized = time.time()
-    registry.init_datasets()
+    registry.refresh(wait=True, force=True)
     return system_status()
 
 
+@health.route("/status/metrics", methods=["GET", "HEAD", "OPTIONS"])
+def prometheus_metrics():
+    """The query metrics of this process, in the Prometheus text format."""
+    return Response(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@health.route("/status/live", methods=["GET", "HEAD", "OPTIONS"])
+def liveness():
+    """The process is serving requests, this does not touch the database."""
+    return Response("OK", content_type="text/plain; charset=utf-8")
+
+
+@health.route("/status/ready", methods=["GET", "HEAD", "OPTIONS"])
 @health.route("/status/health", methods=["GET", "HEAD", "OPTIONS"])
-def search_list():
-    """Execute test query against datasources"""
-
-    logger.debug("Accessing health endpoint. New and shiny.")
-    # Use one of the ref db. datasources
-    gebieden_buurten_ds_cls = registry.get_by_name("gebieden/buurten")
-    x, y, response_text = 120993, 485919, []
-    # Trying to load the data sources
-    try:
-        gebieden_buurten_dsn = gebieden_buurten_ds_cls(
-            dsn=current_app.config["DSN_DATASERVICES_DATASETS"]
-        )
-    except Exception as e:
-        return repr(e), 500
-    # Attempting to query
-    try:
-        results = gebieden_buurten_dsn.query(x, y)
-    except Exception as e:
-        return repr(e), 500
-
-    if results["type"] == "Error":
-        return Response(results["message"], content_type="text/plain; charset=utf-8", status=500)
-
-    if not len(results["features"]):
-        response_text.append("No results from bag dataset")
-
-    return Response("Connectivity OK", content_type="text/plain; charset=utf-8")
+def readiness():
+    """The worker is warmed up, the database can be reached and the datasets can be queried.
+
+    Uses the cached results of the health check, see `health_check`.
+    """
+    if not is_ready():
+        return Response("Warming up", content_type="text/plain; charset=utf-8", status=503)
+
+    result = get_health_check().ready()
+    return Response(
+        result.message, content_type="text/plain; charset=utf-8", status=200 if result.ok else 503
+    )
@@ -1,6 +1,9 @@
 # Python
+import hashlib
 import logging
+import threading
 
+from cachetools import LRUCache
 from flask import Blueprint, Response, jsonify, request, send_from_directory, stream_with_context
 
 from datapunt_geosearch.authz import authenticate, get_current_authz_scopes
@@ -11,6 +14,11 @@ search = Blueprint("search", __name__)
 
 _logger = logging.getLogger(__name__)
 
+# Catalogus responses (body and ETag) by registry generation and set of scopes.
+# Entries of previous generations are evicted as the new ones are added.
+_catalogus_cache = LRUCache(maxsize=128)
+_catalogus_lock = threading.Lock()
+
 
 def get_coords_and_type(args):
     """
@@ -87,20 +95,42 @@ def search_everywhere():
 @search.route("/catalogus/", methods=["GET"])
 @authenticate
 def search_catalogus():
-    """Generate a list of all values that can be used as input to the root endpoint."""
+    """Generate a list of all values that can be used as input to the root endpoint.
+
+    The response only depends on the registry and the scopes of the caller, so it
+    is cached for those and served with an ETag. Clients that send a matching
+    If-None-Match header get a 304 Not Modified.
+    """
+    body, etag = get_catalogus(get_current_authz_scopes())
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    # The datasets depend on the token of the caller.
+    response.vary.add("Authorization")
+    return response.make_conditional(request)
+
+
+def get_catalogus(scopes=None):
+    """Return the body of the catalogus response for `scopes`, and its ETag."""
+    # Initializes or refreshes the registry when needed. The generation is read
+    # before the providers, so a concurrent refresh can not leave stale entries.
+    registry.init_datasets()
+    key = (registry.generation, frozenset(scopes or ()))
+    with _catalogus_lock:
+        cached = _catalogus_cache.get(key)
+    if cached is not None:
+        return cached
 
     # Note that we filter the top-level keys as they are  defined in
     # DataSourceClass.metadata["datasets"] since it is completely illogical
     # and unpredictable for users of the API what the results will be when these
     # keys are used. They are not based on any known naming-scheme except for the
     # fact that they are used in this codebase.
-    dataset_names = [
-        name
-        for name, dataset in registry.get_all_datasources().items()
-        if dataset.check_scopes(scopes=get_current_authz_scopes()) and "/" in name
-    ]
-
-    return jsonify({"datasets": dataset_names})
+    dataset_names = registry.get_dataset_table_names(scopes=scopes)
+    body = jsonify({"datasets": dataset_names}).get_data()
+    cached = body, hashlib.sha1(body, usedforsecurity=False).hexdigest()
+    with _catalogus_lock:
+        _catalogus_cache[key] = cached
+    return cached
 
 
 # Adding cors headers
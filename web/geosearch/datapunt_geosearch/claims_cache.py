@@ -0,0 +1,105 @@
+"""In-process cache for the claims of verified bearer tokens.
+
+Clients send the same token with hundreds of map requests. Verifying the
+signature of the token (ECDSA or RSA) is most of the cost of authentication,
+so the claims of a verified token are kept here, by a digest of the token,
+until the token expires.
+
+A cached entry is only used while the keyset still has the very key that
+verified the token. When that key is removed or replaced (rotated or revoked),
+the token is verified again.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from cachetools import TLRUCache
+from flask import current_app as app
+
+_claims_cache = None
+_claims_cache_lock = threading.Lock()
+
+
+class ClaimsEntry(NamedTuple):
+    expires_at: float
+    kid: str
+    key: object
+    claims: Optional[dict]
+
+
+def _expires_at(_key, entry, _now):
+    return entry.expires_at
+
+
+class ClaimsCache:
+    """A cache of the claims of verified tokens, bounded by the number of tokens.
+
+    Entries expire at the `exp` of their token, the least recently used entries
+    are evicted when the cache is full. Tokens without a `kid` or `exp` are not cached.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._cache = TLRUCache(maxsize=maxsize, ttu=_expires_at, timer=time.time)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token, keyset) -> Optional[ClaimsEntry]:
+        """Return the entry of a token, or None when it has to be verified.
+
+        The claims of the entry must not be modified, they are shared with other requests.
+        """
+        with self._lock:
+            entry = self._cache.get(self._digest(token))
+        if entry is not None and (keyset is None or keyset.get_key(entry.kid) is not entry.key):
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def set(self, token, jwt, keyset, claims):
+        """Cache the claims (see `authz.get_claims`) of a token that `jwt` verified."""
+        kid = json.loads(jwt.header).get("kid")
+        expires_at = json.loads(jwt.claims).get("exp")
+        if kid is None or not isinstance(expires_at, (int, float)) or expires_at <= time.time():
+            return
+        key = keyset.get_key(kid)
+        if key is None:
+            return
+        with self._lock:
+            self._cache[self._digest(token)] = ClaimsEntry(expires_at, kid, key, claims)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._cache),
+                "max_entries": self.maxsize,
+            }
+
+
+def get_claims_cache():
+    """Return the claims cache, or None when it is disabled (JWT_CLAIMS_CACHE_SIZE = 0)."""
+    global _claims_cache
+    maxsize = app.config.get("JWT_CLAIMS_CACHE_SIZE", 0)
+    if not maxsize:
+        return None
+    with _claims_cache_lock:
+        if _claims_cache is None or _claims_cache.maxsize != maxsize:
+            _claims_cache = ClaimsCache(maxsize=maxsize)
+        return _claims_cache
@@ -1,18 +1,50 @@
+import asyncio
+import contextlib
+import functools
 import logging
+import operator
+import time
 import urllib.parse
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 
 import psycopg2.extras
 import requests
+from flask import current_app as app
 from psycopg2 import sql
 from schematools.naming import toCamelCase
 
+from datapunt_geosearch.aio import to_async_sql
 from datapunt_geosearch.db import dbconnection
 from datapunt_geosearch.exceptions import DataSourceException
+from datapunt_geosearch.http_client import CircuitOpenError, get_http_client
+from datapunt_geosearch.metrics import record_query
+from datapunt_geosearch.spatial_index import get_spatial_index
+from datapunt_geosearch.statements import execute_prepared, statement_cache
 
 _logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=1024)
+def compile_projection(default_properties: Tuple[str], extra_field_names: Tuple[str], columns):
+    """Compile the plan to turn result rows with `columns` into feature properties.
+
+    Returns the output keys and a function that picks the matching values
+    from a row (a tuple), in the same order.
+    """
+    positions = {column: position for position, column in enumerate(columns)}
+    plan = [(prop, positions[prop]) for prop in default_properties if prop in positions]
+    plan += [
+        (toCamelCase(prop), positions[prop]) for prop in extra_field_names if prop in positions
+    ]
+    keys = tuple(key for key, _position in plan)
+    if not plan:
+        return keys, lambda row: ()
+    if len(plan) == 1:
+        position = plan[0][1]
+        return keys, lambda row: (row[position],)
+    return keys, operator.itemgetter(*(position for _key, position in plan))
+
+
 class DataSourceBase:
     """
     Base class for querying geo spatial datasets
@@ -20,6 +52,7 @@ class DataSourceBase:
 
     db = None
     dsn = None
+    dsn_name = None
     dataset = None
     # opr_type = openbare_ruimte_type. Water, Weg, Terrein...
     default_properties = ("id", "display", "type", "uri", "opr_type", "distance")
@@ -40,6 +73,10 @@ class DataSourceBase:
     field_names_in_query = None
     # whether the db connection should switch end user context for querying
     set_user_role = False
+    # whether the queries are executed as server side prepared statements
+    prepare_statements = False
+    # whether the features are assembled as JSON text by the database
+    database_json = False
 
     def __init__(self, dsn=None, connection=None):
         _logger.debug("Creating DataSource: %s" % self.__class__.__name__)
@@ -106,67 +143,201 @@ class DataSourceBase:
         self.meta["datasets"] = None
         return False
 
-    def execute_queries(self, datasets=None):
-        """Execute queries on all datasets in the datasource.
+    def iter_tables(self, datasets=None):
+        """Yield the `(dataset_key, table)` pairs that should be queried.
 
         Datasets are optionally filtered by `datasets`. Filtering can be
         done with "<dataset/table>" or by "<dataset>". In the latter case
         all tables under that dataset will be queried.
+        """
+        datasets = datasets or []
+        for dataset in self.meta["datasets"]:
+            for dataset_indent, table in self.meta["datasets"][dataset].items():
+                dataset_key = f"{dataset}/{dataset_indent}"
+                if len(datasets) and not any(
+                    [
+                        dataset in datasets,
+                        dataset_key in datasets,
+                    ]
+                ):
+                    # Actively filter datasets
+                    continue
+                yield dataset_key, table
+
+    def get_dataset_key(self, table):
+        """Return the "<dataset>/<table>" key of a table of this datasource."""
+        for dataset, tables in self.meta["datasets"].items():
+            for dataset_ident, dataset_table in tables.items():
+                if dataset_table == table:
+                    return f"{dataset}/{dataset_ident}"
+        return table
+
+    def build_features(self, rows, columns):
+        """Turn result rows (tuples with `columns`) into (GeoJSON-like) features."""
+        keys, values = compile_projection(
+            self.default_properties, tuple(sorted(self.extra_field_names)), tuple(columns)
+        )
+        return [{"properties": dict(zip(keys, values(row)))} for row in rows]
+
+    def build_feature(self, row):
+        """Turn a result row (a mapping) into a (GeoJSON-like) feature."""
+        return {
+            "properties": {
+                **{prop: row[prop] for prop in self.default_properties if prop in row},
+                **{
+                    toCamelCase(prop): row[prop]
+                    for prop in tuple(self.extra_field_names)
+                    if prop in row
+                },
+            }
+        }
+
+    def execute_queries(self, datasets=None):
+        """Execute queries on all datasets in the datasource.
+
+        Datasets are optionally filtered by `datasets`, see `iter_tables`.
 
         For example datasets=["bag"] will query all tables under the root "bag"
         in the self.metadata["datasets"] dict.
         """
-        datasets = datasets or []
-        if "fields" in self.meta:
-            self.fields = ",".join(self.meta["fields"])
+        features = []
+        with contextlib.ExitStack() as stack:
+            cur = None
+            for _dataset_key, table in self.iter_tables(datasets):
+                rows = self.query_spatial_index(table)
+                if rows is not None:
+                    features.extend(self.build_feature(row) for row in rows)
+                    continue
+
+                if cur is None:
+                    # Only open a cursor when a table is not in the spatial index.
+                    cur = stack.enter_context(self.dbconn.cursor())
+                if self.database_json and self.get_output_columns() is not None:
+                    features.extend(self.execute_feature_json_query(cur, table))
+                    continue
+
+                if self.meta["operator"] == "contains":
+                    rows = self.execute_polygon_query(cur, table, self.temporal_bounds)
+                else:
+                    rows = self.execute_point_query(cur, table, self.temporal_bounds)
+
+                if not len(rows):
+                    _logger.debug("no results for table: %s", table)
+                    continue
 
+                columns = [column.name for column in cur.description]
+                features.extend(self.build_features(rows, columns))
+        return features
+
+    async def execute_queries_async(self, datasets=None):
+        """Execute queries on all datasets in the datasource, on an `AsyncDBConnection`.
+
+        This is the asynchronous variant of `execute_queries`.
+        """
         features = []
-        with self.dbconn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            for dataset in self.meta["datasets"]:
-                for dataset_indent, table in self.meta["datasets"][dataset].items():
-                    dataset_key = f"{dataset}/{dataset_indent}"
-                    if len(datasets) and not any(
-                        [
-                            dataset in datasets,
-                            dataset_key in datasets,
-                        ]
-                    ):
-                        # Actively filter datasets
-                        continue
-
-                    if self.meta["operator"] == "contains":
-                        rows = self.execute_polygon_query(cur, table, self.temporal_bounds)
-                    else:
-                        rows = self.execute_point_query(cur, table, self.temporal_bounds)
-
-                    if not len(rows):
-                        _logger.debug("no results for table: %s", table)
-                        continue
-
-                    for row in rows:
-                        features.append(
-                            {
-                                "properties": {
-                                    **{
-                                        prop: row[prop]
-                                        for prop in self.default_properties
-                                        if prop in row
-                                    },
-                                    **{
-                                        toCamelCase(prop): row[prop]
-                                        for prop in tuple(self.extra_field_names)
-                                        if prop in row
-                                    },
-                                }
-                            }
-                        )
+        async with contextlib.AsyncExitStack() as stack:
+            cur = None
+            for _dataset_key, table in self.iter_tables(datasets):
+                rows = self.query_spatial_index(table)
+                if rows is not None:
+                    features.extend(self.build_feature(row) for row in rows)
+                    continue
+
+                if cur is None:
+                    cur = await stack.enter_async_context(self.dbconn.cursor())
+                database_json = self.database_json and self.get_output_columns() is not None
+                if database_json:
+                    query = self.get_feature_json_query(table)
+                else:
+                    query = self.get_query(table)
+
+                start = time.perf_counter()
+                await cur.execute(to_async_sql(query), self.get_query_params())
+                executed = time.perf_counter()
+                rows = await cur.fetchall()
+                record_query(
+                    self.get_dataset_key(table),
+                    self.dsn_name,
+                    executed - start,
+                    time.perf_counter() - executed,
+                    len(rows),
+                )
+                if database_json:
+                    features.extend(row[0] for row in rows)
+                    continue
+
+                if not len(rows):
+                    _logger.debug("no results for table: %s", table)
+                    continue
+
+                columns = [column.name for column in cur.description]
+                features.extend(self.build_features(rows, columns))
         return features
 
+    def get_output_columns(self) -> Optional[List[str]]:
+        """Return the column names of the point and polygon queries, or None when
+        they are not known (the registry sets the `columns` of its `fields`)."""
+        if "columns" not in self.meta:
+            return None
+        return list(self.meta["columns"]) + self.get_extra_columns() + ["distance"]
+
+    def get_extra_columns(self) -> List[str]:
+        """Return the extra fields to select, those that are not selected already.
+
+        The columns of the `fields` (e.g. `id`) can also be requested as extra field.
+        """
+        return sorted(self.extra_field_names - set(self.meta.get("columns", ())))
+
+    def get_feature_json_sql(self) -> sql.Composable:
+        """SQL for the feature of a row (aliased `q`) of the point or polygon query
+        as JSON text, with the same properties as `build_feature`."""
+        columns = self.get_output_columns()
+        properties = [(prop, prop) for prop in self.default_properties if prop in columns]
+        properties += [(prop, toCamelCase(prop)) for prop in sorted(self.extra_field_names)]
+        return sql.SQL(
+            "json_build_object('properties', json_build_object({properties}))::text"
+        ).format(
+            properties=sql.SQL(", ").join(
+                sql.SQL("{}, q.{}").format(sql.Literal(key), sql.Identifier(column))
+                for column, key in properties
+            )
+        )
+
+    def get_feature_json_query(self, table) -> sql.Composed:
+        return sql.SQL("SELECT {feature} FROM ({query}) AS q ORDER BY q.distance").format(
+            feature=self.get_feature_json_sql(), query=self.get_query(table)
+        )
+
+    def execute_feature_json_query(self, cur, table) -> List[str]:
+        """Execute the point or polygon query for `table` and return the features
+        as JSON text, ready to be streamed."""
+        shape = "polygon" if self.meta["operator"] == "contains" else "point"
+        rows = self.execute_query(
+            cur,
+            f"{shape}_json",
+            table,
+            self.temporal_bounds,
+            lambda: self.get_feature_json_query(table),
+        )
+        return [row[0] for row in rows]
+
+    def query_spatial_index(self, table):
+        """Return the rows for `table` from the in-memory spatial index,
+        or None when the table has to be queried in the database."""
+        if self.meta["operator"] != "contains":
+            return None
+        index = get_spatial_index(self, table)
+        if index is None:
+            return None
+        return index.contains(self.x, self.y)
+
     def get_variable_sql(self, table: str) -> Dict[str, sql.Identifier]:
         """Get the variable sql parts for this
         Datasource as psycopg2 Identifiers and SQL"""
 
-        field_names = self.fields.split(",") + list(self.extra_field_names)
+        if "fields" in self.meta:
+            self.fields = ",".join(self.meta["fields"])
+        field_names = self.fields.split(",") + self.get_extra_columns()
 
         return dict(
             fields=sql.SQL(", ").join(
@@ -181,28 +352,45 @@ class DataSourceBase:
             ),
         )
 
-    def get_db_crs(self) -> sql.Literal:
-        if self.crs is None:
-            return sql.Literal(28992)
-        return sql.Literal(int(self.crs.split(":")[-1]))
+    @classmethod
+    def get_srid(cls) -> int:
+        """Return the SRID of the geometries of this datasource."""
+        if cls.crs is None:
+            return 28992
+        return int(cls.crs.split(":")[-1])
 
-    # Point query
-    def execute_point_query(self, cur, table, temporal_bounds=None):
-        tmp_bounds = sql.SQL("")
-        if temporal_bounds is not None:
-            start, end = temporal_bounds
-            tmp_bounds = sql.SQL(
-                " AND ({start} < now() or {start} IS NULL)\
-                     AND ({end} > now() OR {end} IS NULL)"
-            ).format(start=sql.Identifier(start), end=sql.Identifier(end))
-
-        coordinate_stmt = sql.SQL("ST_GeomFromText('POINT({x} {y})', {crs})")
+    def get_db_crs(self) -> sql.Literal:
+        return sql.Literal(self.get_srid())
+
+    def get_temporal_predicate(self, temporal_bounds=None) -> sql.Composable:
+        if temporal_bounds is None:
+            return sql.SQL("")
+        start, end = temporal_bounds
+        return sql.SQL(
+            " AND ({start} < now() or {start} IS NULL)\
+                 AND ({end} > now() OR {end} IS NULL)"
+        ).format(start=sql.Identifier(start), end=sql.Identifier(end))
+
+    def get_coordinate_sql(self) -> sql.Composable:
+        # The coordinates are bound as parameters (and not formatted into a WKT
+        # literal), so that the statement can also be prepared server side.
+        coordinate_stmt = sql.SQL("ST_SetSRID(ST_MakePoint({x}, {y}), {crs})")
         if not self.use_rd:
             # In this case, coordinates are latlng and projected to rijksdriehoek
             coordinate_stmt = sql.SQL(
-                "ST_Transform(ST_GeomFromText('POINT({y} {x})', 4326), {crs})"
+                "ST_Transform(ST_SetSRID(ST_MakePoint({y}, {x}), 4326), {crs})"
             )
-        stmt = sql.SQL(
+        return coordinate_stmt.format(
+            x=sql.Placeholder("x"), y=sql.Placeholder("y"), crs=self.get_db_crs()
+        )
+
+    def get_query_params(self) -> dict:
+        """The parameters for the placeholders in the point and polygon queries."""
+        return {"x": self.x, "y": self.y, "radius": self.radius, "limit": self.limit}
+
+    # Point query
+    def get_point_query(self, table, temporal_bounds=None) -> sql.Composed:
+        return sql.SQL(
             """
             SELECT {fields},
                 ST_Distance({geo_field},
@@ -213,31 +401,23 @@ class DataSourceBase:
         """
         ).format(
             radius=sql.Placeholder("radius"),
-            temp_predicate=tmp_bounds,
-            coordinate_stmt=coordinate_stmt.format(
-                x=sql.Placeholder("x"), y=sql.Placeholder("y"), crs=self.get_db_crs()
-            ),
+            temp_predicate=self.get_temporal_predicate(temporal_bounds),
+            coordinate_stmt=self.get_coordinate_sql(),
             **self.get_variable_sql(table),
         )
-        cur.execute(stmt, {"x": self.x, "y": self.y, "radius": self.radius, "limit": self.limit})
-        return cur.fetchall()
 
-    def execute_polygon_query(self, cur, table, temporal_bounds=None):
-        tmp_bounds = sql.SQL("")
-        if temporal_bounds is not None:
-            start, end = temporal_bounds
-            tmp_bounds = sql.SQL(
-                " AND ({start} < now() or {start} IS NULL)\
-                     AND ({end} > now() OR {end} IS NULL)"
-            ).format(start=sql.Identifier(start), end=sql.Identifier(end))
-
-        coordinate_stmt = sql.SQL("ST_GeomFromText('POINT({x} {y})', {crs})")
-        if not self.use_rd:
-            coordinate_stmt = sql.SQL(
-                "ST_Transform(ST_GeomFromText('POINT({y} {x})', 4326), {crs})"
-            )
+    def execute_point_query(self, cur, table, temporal_bounds=None):
+        return self.execute_query(
+            cur,
+            "point",
+            table,
+            temporal_bounds,
+            lambda: self.get_point_query(table, temporal_bounds),
+        )
 
-        stmt = sql.SQL(
+    # Polygon query
+    def get_polygon_query(self, table, temporal_bounds=None) -> sql.Composed:
+        return sql.SQL(
             """
             SELECT {fields},\
                  ST_Distance(ST_Centroid({geo_field}), {coordinate_stmt}) AS distance
@@ -247,14 +427,66 @@ class DataSourceBase:
                      {extra_where} {temp_predicate} ORDER BY distance
         """
         ).format(
-            temp_predicate=tmp_bounds,
-            coordinate_stmt=coordinate_stmt.format(
-                x=sql.Placeholder("x"), y=sql.Placeholder("y"), crs=self.get_db_crs()
-            ),
+            temp_predicate=self.get_temporal_predicate(temporal_bounds),
+            coordinate_stmt=self.get_coordinate_sql(),
             **self.get_variable_sql(table),
         )
-        cur.execute(stmt, {"x": self.x, "y": self.y})
-        return cur.fetchall()
+
+    def execute_polygon_query(self, cur, table, temporal_bounds=None):
+        return self.execute_query(
+            cur,
+            "polygon",
+            table,
+            temporal_bounds,
+            lambda: self.get_polygon_query(table, temporal_bounds),
+        )
+
+    def execute_query(self, cur, shape, table, temporal_bounds, build_query):
+        """Execute the query from `build_query` and return the rows.
+
+        When `prepare_statements` is set, the query is executed as a prepared
+        statement. The statement is looked up by everything that determines
+        the query text, so the query itself is only built once.
+        """
+        start = time.perf_counter()
+        if not self.prepare_statements:
+            cur.execute(build_query(), self.get_query_params())
+        else:
+            self.execute_prepared_query(cur, shape, table, temporal_bounds, build_query)
+        executed = time.perf_counter()
+        rows = cur.fetchall()
+        record_query(
+            self.get_dataset_key(table),
+            self.dsn_name,
+            executed - start,
+            time.perf_counter() - executed,
+            len(rows),
+        )
+        return rows
+
+    def execute_prepared_query(self, cur, shape, table, temporal_bounds, build_query):
+        """Execute the query from `build_query` as a prepared statement."""
+        key = (
+            type(self),
+            shape,
+            table,
+            self.meta["geofield"],
+            tuple(self.meta.get("fields", [self.fields])),
+            self.crs,
+            self.extra_where,
+            temporal_bounds,
+            self.use_rd,
+            self.limit is not None,
+            tuple(sorted(self.extra_field_names)),
+        )
+        statement = statement_cache.get(key, build_query, cur)
+        execute_prepared(self.dbconn, cur, statement, self.get_query_params())
+
+    def get_query(self, table) -> sql.Composed:
+        """Return the point or polygon query for `table`, depending on the operator."""
+        if self.meta["operator"] == "contains":
+            return self.get_polygon_query(table, self.temporal_bounds)
+        return self.get_point_query(table, self.temporal_bounds)
 
     def query(self, x, y, rd=True, radius=None, limit=None, field_names_in_query=None):
         """Query all datasets in this datasource"""
@@ -290,6 +522,81 @@ class DataSourceBase:
             }
 
 
+def execute_union_queries(datasources, datasets=None):
+    """Query the tables of several datasources in a single database round trip.
+
+    The datasources must share their connection (same DSN and role switching)
+    and be configured for the same request and CRS (coordinates, radius and limit),
+    a ValueError is raised otherwise.
+    Every table query becomes a branch of one `UNION ALL` statement. Rows are
+    tagged with their branch number and returned as JSON objects, so branches
+    with different columns (extra fields, temporal bounds) can be combined.
+    When all datasources use `database_json`, the branches return the features
+    as JSON text instead.
+
+    Returns a list with the features of each datasource, in the order of `datasources`.
+    """
+    database_json = all(
+        datasource.database_json and datasource.get_output_columns() is not None
+        for datasource in datasources
+    )
+    branches = []
+    owners = []
+    features = [[] for _ in datasources]
+    for index, datasource in enumerate(datasources):
+        for _dataset_key, table in datasource.iter_tables(datasets):
+            rows = datasource.query_spatial_index(table)
+            if rows is not None:
+                features[index].extend(datasource.build_feature(row) for row in rows)
+                continue
+            if database_json:
+                feature = datasource.get_feature_json_sql()
+            else:
+                feature = sql.SQL("to_jsonb(q) - 'geometrie'")
+            branches.append(
+                sql.SQL(
+                    "SELECT {branch} AS branch, q.distance, {feature} AS feature"
+                    " FROM ({query}) AS q"
+                ).format(
+                    branch=sql.Literal(len(owners)),
+                    feature=feature,
+                    query=datasource.get_query(table),
+                )
+            )
+            owners.append(index)
+
+    if not branches:
+        return features
+
+    params = datasources[0].get_query_params()
+    for datasource in datasources[1:]:
+        if datasource.get_query_params() != params:
+            raise ValueError(f"{datasource} is not queried with the same parameters")
+
+    stmt = sql.Composed(
+        [sql.SQL(" UNION ALL ").join(branches), sql.SQL(" ORDER BY branch, distance")]
+    )
+    with datasources[0].dbconn.cursor() as cur:
+        start = time.perf_counter()
+        cur.execute(stmt, params)
+        executed = time.perf_counter()
+        rows = cur.fetchall()
+        record_query(
+            "union",
+            datasources[0].dsn_name,
+            executed - start,
+            time.perf_counter() - executed,
+            len(rows),
+        )
+        for branch, _distance, row in rows:
+            index = owners[branch]
+            if database_json:
+                features[index].append(row)
+            else:
+                features[index].append(datasources[index].build_feature(row))
+    return features
+
+
 class ExternalDataSource(DataSourceBase):
     """
     ExternalDataSource specification.
@@ -330,15 +637,51 @@ class ExternalDataSource(DataSourceBase):
             self.meta = kwargs.pop("meta")
         else:
             self.meta = self.metadata.copy()
+        self.http_client = get_http_client(
+            self.meta["base_url"],
+            max_connections=app.config.get("EXTERNAL_MAX_CONNECTIONS", 10),
+            timeout=app.config.get("EXTERNAL_TIMEOUT", 1),
+            max_failures=app.config.get("EXTERNAL_MAX_FAILURES", 5),
+            reset_timeout=app.config.get("EXTERNAL_RESET_TIMEOUT", 30),
+            cache_ttl=app.config.get("EXTERNAL_CACHE_TTL", 0),
+        )
 
     def execute_queries(self, datasets=None):
         """
         Execute queries on given datasets.
+        The datasets are fetched at the same time when there are several.
+
+        :param datasets: list of datasets to filter, optional.
+        """
+        fetches = list(self.iter_fetches(datasets))
+        if len(fetches) > 1:
+            results = self.http_client.executor.map(
+                lambda fetch_kwargs: self.fetch_data(**fetch_kwargs), fetches
+            )
+        else:
+            results = [self.fetch_data(**fetch_kwargs) for fetch_kwargs in fetches]
+        return [feature for features in results for feature in features]
+
+    async def execute_queries_async(self, datasets=None):
+        """Asynchronous variant of `execute_queries`, the datasets are fetched
+        at the same time in the worker threads of the HTTP client."""
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    self.http_client.executor, functools.partial(self.fetch_data, **fetch_kwargs)
+                )
+                for fetch_kwargs in self.iter_fetches(datasets)
+            )
+        )
+        return [feature for features in results for feature in features]
+
+    def iter_fetches(self, datasets=None):
+        """Yield the arguments for `fetch_data` of the datasets to query.
 
         :param datasets: list of datasets to filter, optional.
         """
         datasets = datasets or []
-        features = []
         request_params = dict(x=self.x, y=self.y)
         if self.limit:
             request_params["limit"] = self.limit
@@ -349,18 +692,18 @@ class ExternalDataSource(DataSourceBase):
                 if len(datasets) and not (dataset in datasets or dataset_indent in datasets):
                     continue
 
-                features += self.fetch_data(
+                yield dict(
                     dataset_name=f"{dataset}/{dataset_indent}",
                     subset_url=subset_url,
                     request_params=request_params,
                 )
-        return features
 
     def fetch_data(self, dataset_name: str, subset_url: str, request_params: dict = None):
         """
-        Fetch data from self.meta["base_url"] + subset url and format it
-        before returning.
-        Wraps requests.RequestException and retuns empty list if it's raisen.
+        Fetch data from self.meta["base_url"] + subset url with the pooled
+        HTTP client of the base url, and format it before returning.
+        Wraps requests.RequestException and retuns empty list if it's raisen,
+        or when the circuit of the base url is open.
 
         :param subset_url: relative to self.meta["base_url"] path
         :type subset_url: str
@@ -370,12 +713,18 @@ class ExternalDataSource(DataSourceBase):
         """
         search_url = urllib.parse.urljoin(self.meta["base_url"], subset_url)
         try:
-            result = requests.get(search_url, params=request_params, timeout=1)
+            result = self.http_client.get_json(search_url, params=request_params)
+        except CircuitOpenError:
+            _logger.debug(f"Not fetching data from {search_url}, the remote API is failing.")
+            return []
         except requests.exceptions.RequestException as e:
             _logger.warning(f"Failed to fetch data from {search_url}. Error '{e}'.")
             return []
 
-        return self.format_result(dataset_name=dataset_name, result=result.json())
+        # The (cached) response itself is not modified.
+        return self.format_result(
+            dataset_name=dataset_name, result=[dict(item) for item in result]
+        )
 
     def format_result(self, dataset_name: str, result: list):
         """
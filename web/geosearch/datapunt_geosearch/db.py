@@ -1,9 +1,12 @@
+import collections
 import contextlib
 import functools
 import logging
+import threading
+import time
 
+import psycopg2.extensions
 import psycopg2.extras
-from cachetools import LRUCache, cached
 from flask import current_app as app
 from flask import g
 from psycopg2 import Error as Psycopg2Error
@@ -21,6 +24,35 @@ def is_internal(user_email: str) -> bool:
     return user_email.endswith("@amsterdam.nl") or user_email.endswith("@ggd.amsterdam.nl")
 
 
+def end_user_role():
+    """Return the database role that is used for the end user of the current request.
+
+    This is None when the end user feature is disabled. See `end_user_context`.
+    """
+    try:
+        context = end_user_context()
+    except PermissionError:
+        # External users have no database role, their queries fail.
+        return USER_ROLE.format(user_email=g.get("email"))
+    return context[0] if context is not None else None
+
+
+def end_user_context(set_user_role=True):
+    """Return the `(role_name, app_name)` to query as for the end user of the
+    current request, or None when the end user feature is disabled.
+
+    Raises a PermissionError for external users, as they have no database role.
+    """
+    if not app.config["DATABASE_SET_ROLE"] or not set_user_role:
+        return None
+    user_email = g.get("email")
+    if not user_email:
+        return ANONYMOUS_ROLE, ANONYMOUS_APP_NAME
+    if is_internal(user_email):
+        return INTERNAL_ROLE, user_email
+    raise PermissionError(f"User {user_email} is not available in database")
+
+
 def retry_on_psycopg2_error(func):
     """
     Decorator that retries 3 times after Postgres error, in particular if
@@ -46,13 +78,263 @@ def retry_on_psycopg2_error(func):
     return wrapper_retry
 
 
-connection_cache = LRUCache(maxsize=128)
+class PoolTimeout(Psycopg2Error):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """A pool of _DBConnection instances for a single DSN.
+
+    - opens connections on demand, up to `max_size`
+    - keeps at least `min_size` connections open
+    - closes connections that are older than `max_lifetime` seconds or
+      have been idle for more than `max_idle` seconds (beyond `min_size`)
+    - waits at most `timeout` seconds for a connection when the pool is exhausted
+    - checks the health of a connection on checkout; connections that have
+      been idle for more than `check_idle` seconds are pinged first
+
+    Idle connections are handed out last-in first-out, so the surplus
+    connections become idle long enough to be reaped.
+    """
+
+    def __init__(
+        self,
+        dsn,
+        set_user_role=False,
+        min_size=1,
+        max_size=10,
+        max_lifetime=3600,
+        max_idle=600,
+        timeout=5,
+        check_idle=30,
+    ):
+        self.dsn = dsn
+        self.set_user_role = set_user_role
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.check_idle = check_idle
+
+        self._condition = threading.Condition()
+        self._idle = collections.deque()
+        self._size = 0
+        self._waiting = 0
+        self._counters = collections.Counter()
+
+    def getconn(self):
+        """Check out a healthy connection, waiting for one when the pool is exhausted."""
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                self._reap()
+                if self._idle:
+                    connection = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    connection = None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No connection available within {self.timeout} seconds "
+                        f"(pool size {self.max_size})"
+                    )
+                self._waiting += 1
+                try:
+                    self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        try:
+            if connection is None:
+                connection = self._open()
+            else:
+                connection.check(ping=time.monotonic() - connection.last_used > self.check_idle)
+        except Psycopg2Error:
+            self._discard(connection)
+            raise
+
+        with self._condition:
+            self._counters["checkouts"] += 1
+        return connection
+
+    def putconn(self, connection):
+        """Return a connection to the pool, closing it when it can not be reused."""
+        if connection._active_user:
+            connection.deactivate_end_user()
+
+        if not connection.reset() or connection.age > self.max_lifetime:
+            self._discard(connection)
+            return
+
+        connection.last_used = time.monotonic()
+        with self._condition:
+            self._idle.append(connection)
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Yields a connection from the pool, and returns it on exit."""
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def ping(self) -> bool:
+        """Whether a connection of the pool can query the database."""
+        try:
+            with self.connection() as connection:
+                connection.check()
+                return connection._is_usable()
+        except Psycopg2Error:
+            return False
+
+    def fill(self):
+        """Open connections until the pool holds `min_size` connections."""
+        while True:
+            with self._condition:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._open()
+            except Psycopg2Error:
+                self._discard(None)
+                raise
+            self.putconn(connection)
+
+    def close(self):
+        """Close all idle connections. Checked out connections are closed on return."""
+        with self._condition:
+            idle, self._idle = list(self._idle), collections.deque()
+            self._size -= len(idle)
+            self._counters["closed"] += len(idle)
+        for connection in idle:
+            connection.close()
+
+    def stats(self):
+        """Return the usage numbers of the pool, to monitor its saturation."""
+        with self._condition:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "checkouts": self._counters["checkouts"],
+                "timeouts": self._counters["timeouts"],
+                "opened": self._counters["opened"],
+                "closed": self._counters["closed"],
+            }
+
+    def _open(self):
+        connection = _DBConnection(self.dsn, self.set_user_role)
+        with self._condition:
+            self._counters["opened"] += 1
+        return connection
+
+    def _discard(self, connection):
+        """Close a connection that will not return to the pool, freeing its slot."""
+        if connection is not None:
+            connection.close()
+        with self._condition:
+            self._size -= 1
+            self._counters["closed"] += 1
+            self._condition.notify()
+
+    def _reap(self):
+        """Close expired idle connections. Must be called with the lock held."""
+        now = time.monotonic()
+        keep = collections.deque()
+        # The least recently used connections are at the left.
+        for connection in self._idle:
+            expired = connection.age > self.max_lifetime
+            stale = now - connection.last_used > self.max_idle and self._size > self.min_size
+            if expired or stale:
+                connection.close()
+                self._size -= 1
+                self._counters["closed"] += 1
+            else:
+                keep.append(connection)
+        self._idle = keep
+
+
+connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+
+def get_pool(dsn, set_user_role=False) -> ConnectionPool:
+    """Returns the connection pool for a DSN, creating it on first use."""
+    key = (dsn, set_user_role)
+    with _connection_pools_lock:
+        if key not in connection_pools:
+            connection_pools[key] = ConnectionPool(
+                dsn,
+                set_user_role=set_user_role,
+                min_size=app.config.get("DB_POOL_MIN_SIZE", 1),
+                max_size=app.config.get("DB_POOL_MAX_SIZE", 10),
+                max_lifetime=app.config.get("DB_POOL_MAX_LIFETIME", 3600),
+                max_idle=app.config.get("DB_POOL_MAX_IDLE", 600),
+                timeout=app.config.get("DB_POOL_TIMEOUT", 5),
+                check_idle=app.config.get("DB_POOL_CHECK_IDLE", 30),
+            )
+        return connection_pools[key]
+
+
+def pool_stats():
+    """Return the statistics of all connection pools, by database (without credentials)."""
+    stats = {}
+    for (dsn, set_user_role), pool in list(connection_pools.items()):
+        info = psycopg2.extensions.parse_dsn(dsn)
+        name = "{}@{}:{}/{}".format(
+            info.get("user"), info.get("host"), info.get("port", 5432), info.get("dbname")
+        )
+        if set_user_role:
+            name += " (role switching)"
+        stats[name] = pool.stats()
+    return stats
 
 
-@cached(cache=connection_cache)
 def dbconnection(dsn, set_user_role=False):
-    """Creates and caches instances of _DBConnection by DSN"""
-    return _DBConnection(dsn, set_user_role)
+    """Returns the _DBConnection for a DSN that is used by the current request.
+
+    The connection is checked out from the pool of the DSN on first use and
+    stays with the request, so the end user role only has to be activated once.
+    `release_connections` returns it to the pool when the request is torn down.
+    """
+    connections = g.setdefault("_db_connections", {})
+    key = (dsn, set_user_role)
+    if key not in connections:
+        connections[key] = get_pool(dsn, set_user_role).getconn()
+    return connections[key]
+
+
+def release_connections():
+    """Return the connections of the current request to their pools.
+
+    The end user context is rolled back when it was activated.
+    """
+    connections = g.pop("_db_connections", {})
+    for (dsn, set_user_role), connection in connections.items():
+        get_pool(dsn, set_user_role).putconn(connection)
+
+
+@contextlib.contextmanager
+def dedicated_connection(dsn, set_user_role=False):
+    """Yields a _DBConnection from the pool that is not shared with the request.
+
+    The connection goes back to the pool on exit, after rolling back the end user
+    context. This is meant for queries that run concurrently in worker threads.
+    """
+    with get_pool(dsn, set_user_role).connection() as connection:
+        yield connection
 
 
 class _DBConnection:
@@ -70,6 +352,8 @@ class _DBConnection:
         self.dsn = dsn
         self._conn = None
         self._active_user = None
+        self.created_at = None
+        self.last_used = time.monotonic()
         self._connect()
 
     def _connect(self):
@@ -77,6 +361,53 @@ class _DBConnection:
             self._conn = psycopg2.connect(self.dsn)
             # Cursors will not run inside their own transactions
             self._conn.autocommit = True
+            self.created_at = time.monotonic()
+            # Server side prepared statements only live as long as the connection
+            self.prepared_statements = set()
+            self.prepared_generation = None
+            self.prepared_evictions = None
+
+    @property
+    def age(self):
+        """Seconds since the underlying database connection was opened."""
+        if self.created_at is None:
+            return 0
+        return time.monotonic() - self.created_at
+
+    def check(self, ping=False):
+        """Make sure the connection can be used, reconnecting when it is broken.
+
+        The (closed) state of the connection is always checked, `ping` also
+        executes a query to detect connections that were dropped by the server.
+        """
+        if self._conn is not None and (self._conn.closed or (ping and not self._is_usable())):
+            _logger.warning("Replacing broken database connection")
+            self.close()
+        self._connect()
+
+    def reset(self):
+        """Roll back any transaction that is still open, so the connection can be reused.
+
+        :returns boolean: True if the connection is ready for reuse, False otherwise
+        """
+        if self._conn is None or self._conn.closed:
+            return False
+        if self._conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return True
+        try:
+            with self._conn.cursor() as c:
+                c.execute("ROLLBACK;")
+        except Psycopg2Error:
+            return False
+        self._active_user = None
+        return True
+
+    def close(self):
+        """Close the underlying database connection."""
+        if self._conn is not None:
+            with contextlib.suppress(psycopg2.Error):
+                self._conn.close()
+            self._conn = None
 
     def _is_usable(self):
         """Checks whether the connection is usable.
@@ -91,8 +422,13 @@ class _DBConnection:
             return True
 
     def activate_end_user(self):
-        """Switch to the end-user role in the database."""
-        if not app.config["DATABASE_SET_ROLE"] or not self.set_user_role:
+        """Switch to the end-user role in the database, see `end_user_context`."""
+        try:
+            context = end_user_context(self.set_user_role)
+        except PermissionError:
+            _logger.exception("External user %s has no database role", g.get("email"))
+            raise
+        if context is None:
             _logger.debug(
                 "End-user feature disabled (DATABASE_SET_ROLE=%s, set_user_role=%s)",
                 app.config["DATABASE_SET_ROLE"],
@@ -100,25 +436,13 @@ class _DBConnection:
             )
             return
 
-        user_email = g.get("email")
-        if not user_email:
-            _logger.debug("No end-user email, switching to anonymous role")
-            self._set_role(ANONYMOUS_ROLE, ANONYMOUS_APP_NAME)
-            return
-
-        if self._active_user == user_email:
+        role_name, app_name = context
+        if self._active_user == role_name:
             _logger.debug("End-user already set, no need to switch roles again")
             return
 
-        _logger.debug("%s: Activating end-user context for %s", user_email)
-
-        role_name = USER_ROLE.format(user_email=user_email)
-        if is_internal(user_email):
-            # BBN1: Internal employee, no specific account
-            self._set_role(INTERNAL_ROLE, user_email)
-        else:
-            _logger.exception("External user %s has no database role %s", user_email, role_name)
-            raise PermissionError(f"User {user_email} is not available in database")
+        _logger.debug("Activating end-user context %s for %s", role_name, app_name)
+        self._set_role(role_name, app_name)
 
     def _set_role(self, role_name, app_name):
         # By starting a transaction, any connection pooling (e.g. PgBouncer)
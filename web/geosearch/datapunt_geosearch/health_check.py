@@ -0,0 +1,152 @@
+"""Health checks for the liveness and readiness probes.
+
+Probes must not put queries on the database: there are several probers per
+pod, and they probe every few seconds. The readiness check therefore pings the
+pool of the dataservices database, at most once per `HEALTH_CHECK_CACHE_SECONDS`
+whatever the number of probes, and uses the result of the last deep check.
+While one probe pings, the others get the result of the previous ping.
+
+The deep check runs a real spatial query on a dataset, in a background thread
+that is started on first use (so after uwsgi has forked the worker processes),
+once per `HEALTH_CHECK_INTERVAL` seconds.
+"""
+import logging
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from flask import current_app as app
+
+from datapunt_geosearch.db import get_pool, release_connections
+from datapunt_geosearch.registry import registry
+
+_logger = logging.getLogger(__name__)
+
+_health_check = None
+_health_check_lock = threading.Lock()
+
+
+class CheckResult(NamedTuple):
+    ok: bool
+    message: str
+    checked_at: float
+
+
+class HealthCheck:
+    """The health of the database and the datasets, for the readiness probe.
+
+    The dataset check queries `dataset` at the RD coordinates `point`.
+    """
+
+    def __init__(
+        self, cache_seconds=10, interval=60, dataset="gebieden/buurten", point=(120993, 485919)
+    ):
+        self.cache_seconds = cache_seconds
+        self.interval = interval
+        self.dataset = dataset
+        self.point = point
+        self.ping_result: Optional[CheckResult] = None
+        self.dataset_result: Optional[CheckResult] = None
+        self.last_success: Optional[float] = None
+        self._lock = threading.Lock()
+        self._pinging = False
+        self._thread = None
+
+    def ready(self) -> CheckResult:
+        """Whether the database can be reached and the last dataset check succeeded.
+
+        Before the first dataset check has completed, only the ping counts.
+        """
+        self._start()
+        ping_result = self._cached_ping()
+        if not ping_result.ok:
+            return ping_result
+        dataset_result = self.dataset_result
+        if dataset_result is not None and not dataset_result.ok:
+            return dataset_result
+        return ping_result
+
+    def _cached_ping(self) -> CheckResult:
+        """Return the result of the last ping, pinging again when it has expired.
+
+        A single thread pings, outside the lock, the others return the previous
+        result meanwhile. Only when there is no result yet do they ping as well.
+        """
+        with self._lock:
+            ping_result = self.ping_result
+            if ping_result is not None and (
+                self._pinging or time.time() - ping_result.checked_at < self.cache_seconds
+            ):
+                return ping_result
+            pinging, self._pinging = self._pinging, True
+        try:
+            self.ping_result = ping_result = self._ping()
+        finally:
+            if not pinging:
+                with self._lock:
+                    self._pinging = False
+        return ping_result
+
+    def _ping(self) -> CheckResult:
+        pool = get_pool(app.config["DSN_DATASERVICES_DATASETS"])
+        if pool.ping():
+            return CheckResult(True, "Connectivity OK", time.time())
+        return CheckResult(False, "The dataservices database can not be reached", time.time())
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._check_worker,
+                        args=(app._get_current_object(),),
+                        name="geosearch-health",
+                        daemon=True,
+                    )
+                    self._thread.start()
+
+    def _check_worker(self, flask_app):
+        while True:
+            with flask_app.app_context():
+                self.dataset_result = self.check_dataset()
+            time.sleep(self.interval)
+
+    def check_dataset(self) -> CheckResult:
+        """Query the dataset, this is the deep check of the background thread."""
+        try:
+            datasource_class = registry.get_by_name(self.dataset)
+            if datasource_class is None:
+                return CheckResult(False, f"Dataset {self.dataset} is not available", time.time())
+            datasource = datasource_class(dsn=app.config["DSN_DATASERVICES_DATASETS"])
+            results = datasource.query(*self.point)
+        except Exception as e:
+            _logger.warning("Health check of %s failed", self.dataset, exc_info=True)
+            return CheckResult(False, repr(e), time.time())
+        finally:
+            release_connections()
+
+        if results["type"] == "Error":
+            return CheckResult(False, results["message"], time.time())
+        self.last_success = time.time()
+        if not results["features"]:
+            return CheckResult(True, f"No results from the {self.dataset} dataset", time.time())
+        return CheckResult(True, "Connectivity OK", time.time())
+
+    def stats(self):
+        return {
+            "ping": self.ping_result._asdict() if self.ping_result is not None else None,
+            "dataset": self.dataset_result._asdict() if self.dataset_result is not None else None,
+            "last_success": self.last_success,
+        }
+
+
+def get_health_check() -> HealthCheck:
+    """Return the health check of this process."""
+    global _health_check
+    with _health_check_lock:
+        if _health_check is None:
+            _health_check = HealthCheck(
+                cache_seconds=app.config.get("HEALTH_CHECK_CACHE_SECONDS", 10),
+                interval=app.config.get("HEALTH_CHECK_INTERVAL", 60),
+            )
+        return _health_check
@@ -0,0 +1,235 @@
+"""HTTP clients for the external datasources.
+
+Every base URL has a client with a `requests.Session`, so the connections
+to that host are kept alive and reused instead of paying the TCP and TLS
+setup for every request. The number of concurrent requests per base URL
+is limited, and the latency and errors are counted for the /status endpoint.
+
+A circuit breaker per base URL stops sending requests to a host that keeps
+failing, so a remote API that is down does not slow down every search.
+Responses can be cached for a short time.
+"""
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+
+_logger = logging.getLogger(__name__)
+
+http_clients = {}
+_http_clients_lock = threading.Lock()
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised when a request is not sent because the circuit of the host is open."""
+
+
+class HttpClient:
+    """A pooled HTTP client for the requests to a single base URL.
+
+    - keeps up to `max_connections` connections alive
+    - runs at most `max_connections` requests at the same time, a request
+      that can not start within `timeout` seconds fails
+    - times out requests after `timeout` seconds
+    - opens the circuit after `max_failures` consecutive failures (errors and
+      5xx responses). No requests are sent while it is open. After `reset_timeout`
+      seconds a single request is let through (half-open), which closes the
+      circuit when it succeeds and opens it again when it fails.
+    - caches JSON responses for `cache_ttl` seconds (0 disables the cache)
+    """
+
+    def __init__(
+        self,
+        base_url,
+        max_connections=10,
+        timeout=1,
+        max_failures=5,
+        reset_timeout=30,
+        cache_ttl=0,
+        cache_size=1000,
+    ):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._semaphore = threading.BoundedSemaphore(max_connections)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+        self._seconds = 0.0
+        self._max_seconds = 0.0
+
+        # Circuit breaker
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl) if cache_ttl > 0 else None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Worker threads to fetch several URLs of this client at the same time."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_connections, thread_name_prefix="geosearch-http"
+                )
+            return self._executor
+
+    @property
+    def state(self):
+        """The state of the circuit breaker."""
+        with self._lock:
+            if self._opened_at is None:
+                return CIRCUIT_CLOSED
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                return CIRCUIT_OPEN
+            return CIRCUIT_HALF_OPEN
+
+    def get(self, url, params=None) -> requests.Response:
+        """Send a GET request, raises a `requests.RequestException` when that fails."""
+        probe = self._check_circuit()
+        if not self._semaphore.acquire(timeout=self.timeout):
+            with self._lock:
+                self._counters["busy"] += 1
+                self._counters["errors"] += 1
+                if probe:
+                    self._probing = False
+            raise requests.exceptions.ConnectionError(
+                f"No connection to {self.base_url} available within {self.timeout} seconds"
+            )
+
+        start = time.monotonic()
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            self._count(time.monotonic() - start, error=True)
+            self._record(failed=True, probe=probe)
+            raise
+        finally:
+            self._semaphore.release()
+
+        self._count(time.monotonic() - start, error=not response.ok)
+        self._record(failed=response.status_code >= 500, probe=probe)
+        return response
+
+    def get_json(self, url, params=None):
+        """Return the JSON of a GET request, from the cache when possible.
+
+        The result must not be modified, as it may be shared with other requests.
+        """
+        key = (url, tuple(sorted((params or {}).items())))
+        if self._cache is not None:
+            with self._lock:
+                result = self._cache.get(key)
+                if result is not None:
+                    self._counters["cache_hits"] += 1
+                    return result
+
+        response = self.get(url, params=params)
+        result = response.json()
+        if self._cache is not None and response.ok:
+            with self._lock:
+                self._cache[key] = result
+        return result
+
+    def _check_circuit(self):
+        """Raise a CircuitOpenError when the circuit is open.
+
+        Returns True when the request is the probe of a half-open circuit.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                self._counters["rejected"] += 1
+                raise CircuitOpenError(f"Circuit of {self.base_url} is open")
+            self._probing = True
+            return True
+
+    def _record(self, failed, probe=False):
+        """Update the circuit breaker with the outcome of a request."""
+        with self._lock:
+            if probe:
+                self._probing = False
+            if not failed:
+                if self._opened_at is not None:
+                    _logger.info("Closing the circuit of %s", self.base_url)
+                self._failures = 0
+                self._opened_at = None
+                return
+
+            self._failures += 1
+            if self._opened_at is None and self._failures >= self.max_failures:
+                _logger.warning(
+                    "Opening the circuit of %s after %d failures", self.base_url, self._failures
+                )
+                self._opened_at = time.monotonic()
+            elif probe:
+                self._opened_at = time.monotonic()
+
+    def _count(self, seconds, error=False):
+        with self._lock:
+            self._counters["requests"] += 1
+            if error:
+                self._counters["errors"] += 1
+            self._seconds += seconds
+            self._max_seconds = max(self._max_seconds, seconds)
+
+    def stats(self):
+        """Return the number of requests and errors, and the latency in milliseconds.
+
+        `busy` counts the requests that could not start because the maximum number
+        of connections was in use, they are included in the `errors`. `rejected`
+        counts the requests that were not sent because the circuit was open.
+        """
+        state = self.state
+        with self._lock:
+            requests_count = self._counters["requests"]
+            return {
+                "requests": requests_count,
+                "errors": self._counters["errors"],
+                "busy": self._counters["busy"],
+                "rejected": self._counters["rejected"],
+                "cache_hits": self._counters["cache_hits"],
+                "circuit": state,
+                "latency_ms_avg": (
+                    round(self._seconds / requests_count * 1000, 1) if requests_count else None
+                ),
+                "latency_ms_max": round(self._max_seconds * 1000, 1),
+            }
+
+
+def get_http_client(base_url, **settings) -> HttpClient:
+    """Returns the HTTP client for a base URL, creating it on first use.
+
+    The `settings` are the arguments of `HttpClient`, they are only used to
+    create the client.
+    """
+    with _http_clients_lock:
+        if base_url not in http_clients:
+            http_clients[base_url] = HttpClient(base_url, **settings)
+        return http_clients[base_url]
+
+
+def http_stats():
+    """Return the statistics of all HTTP clients, by base URL."""
+    with _http_clients_lock:
+        clients = list(http_clients.values())
+    return {client.base_url: client.stats() for client in clients}
@@ -0,0 +1,298 @@
+"""Metrics of the search queries, by dataset and DSN.
+
+The dataset label is the "<dataset>/<table>" key of a table, the combined query
+of the union query mode is labeled "union".
+
+The measurements are recorded with the meter provider that is configured in
+`base_config` (Azure Monitor or the console). They are also aggregated in the
+process, and served in the Prometheus text format on /status/metrics.
+
+A scrape is handled by one of the uwsgi worker processes. With a `METRICS_DIR`,
+every process writes its metrics to a file in that directory (every
+WRITE_INTERVAL seconds, from a background thread that is started on first use),
+and /status/metrics serves the sum of the metrics of all processes. The files are
+named after the process id and start time, and the files of workers that have been
+replaced are kept, so the counters do not go down (not even when a new worker gets
+the process id of a previous one).
+"""
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import List, Optional
+
+from opentelemetry import metrics
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import Histogram, InMemoryMetricReader, Sum
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+ROWS_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+# Suffixes of the Prometheus metric names, by OpenTelemetry unit
+PROMETHEUS_UNITS = {"s": "seconds", "By": "bytes"}
+
+# Seconds between writes of the metrics of a process to the METRICS_DIR
+WRITE_INTERVAL = 1
+
+_logger = logging.getLogger(__name__)
+
+_local_reader = InMemoryMetricReader()
+_local_provider = MeterProvider(metric_readers=[_local_reader])
+
+_metrics_dir = None
+_writer_pid = None
+# (process id, file name) of the metrics file of this process
+_process_file = None
+_writer_lock = threading.Lock()
+
+
+class Instruments:
+    """The instruments of the search metrics, created with `meter`."""
+
+    def __init__(self, meter: metrics.Meter):
+        self.execution_duration = meter.create_histogram(
+            "geosearch.query.execution.duration",
+            unit="s",
+            description="Time to execute the query of a table",
+            explicit_bucket_boundaries_advisory=DURATION_BUCKETS,
+        )
+        self.fetch_duration = meter.create_histogram(
+            "geosearch.query.fetch.duration",
+            unit="s",
+            description="Time to fetch the result rows of a table",
+            explicit_bucket_boundaries_advisory=DURATION_BUCKETS,
+        )
+        self.rows = meter.create_histogram(
+            "geosearch.query.rows",
+            unit="{row}",
+            description="Number of result rows of a table",
+            explicit_bucket_boundaries_advisory=ROWS_BUCKETS,
+        )
+        self.serialization_duration = meter.create_histogram(
+            "geosearch.serialization.duration",
+            unit="s",
+            description="Time to serialize the features of a datasource",
+            explicit_bucket_boundaries_advisory=DURATION_BUCKETS,
+        )
+        self.streamed = meter.create_counter(
+            "geosearch.streamed",
+            unit="By",
+            description="Bytes of features streamed in search responses",
+        )
+
+
+_instruments = (
+    Instruments(metrics.get_meter(__name__)),
+    Instruments(_local_provider.get_meter(__name__)),
+)
+
+
+def setup_metrics_dir(directory):
+    """Share the metrics of the processes in `directory`, see the module docstring.
+
+    The files of a previous run are removed, so this is called before the
+    worker processes are forked.
+    """
+    global _metrics_dir
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
+    _metrics_dir = directory
+
+
+def _start_writer():
+    """Start the thread that writes the metrics of this process, once per process."""
+    global _writer_pid
+    if _metrics_dir is None or _writer_pid == os.getpid():
+        return
+    with _writer_lock:
+        if _writer_pid != os.getpid():
+            _writer_pid = os.getpid()
+            threading.Thread(target=_write_worker, name="geosearch-metrics", daemon=True).start()
+
+
+def _write_worker():
+    while True:
+        time.sleep(WRITE_INTERVAL)
+        try:
+            write_process_metrics()
+        except OSError:
+            _logger.warning("Failed to write the metrics of this process", exc_info=True)
+
+
+def _process_file_name():
+    """Return the name of the metrics file of this process, unique per process
+    also when the process id is reused."""
+    global _process_file
+    pid = os.getpid()
+    with _writer_lock:
+        if _process_file is None or _process_file[0] != pid:
+            _process_file = (pid, f"{pid}-{time.time_ns()}.json")
+        return _process_file[1]
+
+
+def write_process_metrics():
+    """Write the metrics of this process to its file in the METRICS_DIR."""
+    path = os.path.join(_metrics_dir, _process_file_name())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(_collect(), f)
+    os.replace(tmp_path, path)
+
+
+def record_query(dataset, dsn, execution_seconds, fetch_seconds, rows):
+    """Record the execution and fetch time and the number of rows of a table query."""
+    _start_writer()
+    attributes = {"dataset": dataset, "dsn": dsn or "external"}
+    for instruments in _instruments:
+        instruments.execution_duration.record(execution_seconds, attributes)
+        instruments.fetch_duration.record(fetch_seconds, attributes)
+        instruments.rows.record(rows, attributes)
+
+
+def record_serialization(dataset, dsn, seconds):
+    """Record the time to serialize the features of a datasource."""
+    _start_writer()
+    attributes = {"dataset": dataset, "dsn": dsn or "external"}
+    for instruments in _instruments:
+        instruments.serialization_duration.record(seconds, attributes)
+
+
+def record_streamed(dataset, dsn, size):
+    """Record the bytes of the features of a datasource in a search response."""
+    _start_writer()
+    attributes = {"dataset": dataset, "dsn": dsn or "external"}
+    for instruments in _instruments:
+        instruments.streamed.add(size, attributes)
+
+
+def _prometheus_name(name: str, unit: str, suffix: Optional[str] = None) -> str:
+    name = re.sub(r"[^a-zA-Z0-9_]", "_", name)
+    unit = PROMETHEUS_UNITS.get(unit)
+    if unit and not name.endswith(f"_{unit}"):
+        name = f"{name}_{unit}"
+    return f"{name}_{suffix}" if suffix else name
+
+
+def _prometheus_labels(attributes, **extra) -> str:
+    labels = {**attributes, **extra}
+    if not labels:
+        return ""
+    values = ",".join(
+        '{}="{}"'.format(
+            key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for key, value in labels.items()
+    )
+    return f"{{{values}}}"
+
+
+def _collect() -> List[dict]:
+    """Return the histograms and counters of this process, as JSON serializable data."""
+    collected = []
+    data = _local_reader.get_metrics_data()
+    for resource_metrics in data.resource_metrics if data is not None else ():
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                if isinstance(metric.data, Histogram):
+                    kind = "histogram"
+                    points = [
+                        {
+                            "attributes": dict(point.attributes),
+                            "bounds": list(point.explicit_bounds),
+                            "bucket_counts": list(point.bucket_counts),
+                            "sum": point.sum,
+                            "count": point.count,
+                        }
+                        for point in metric.data.data_points
+                    ]
+                elif isinstance(metric.data, Sum) and metric.data.is_monotonic:
+                    kind = "counter"
+                    points = [
+                        {"attributes": dict(point.attributes), "value": point.value}
+                        for point in metric.data.data_points
+                    ]
+                else:
+                    continue
+                collected.append(
+                    {
+                        "name": metric.name,
+                        "unit": metric.unit,
+                        "description": metric.description,
+                        "kind": kind,
+                        "points": points,
+                    }
+                )
+    return collected
+
+
+def _read_process_metrics() -> List[List[dict]]:
+    collections = []
+    for path in glob.glob(os.path.join(_metrics_dir, "*.json")):
+        try:
+            with open(path) as f:
+                collections.append(json.load(f))
+        except (OSError, ValueError):
+            _logger.warning("Skipping the metrics in %s", path, exc_info=True)
+    return collections
+
+
+def _merge(collections: List[List[dict]]) -> List[dict]:
+    """Sum the metrics of several processes, by metric name and attributes."""
+    merged = {}
+    for collected in collections:
+        for metric in collected:
+            points = merged.setdefault(metric["name"], dict(metric, points={}))["points"]
+            for point in metric["points"]:
+                key = tuple(sorted(point["attributes"].items()))
+                current = points.get(key)
+                if current is None:
+                    points[key] = dict(point)
+                elif metric["kind"] == "histogram":
+                    current["bucket_counts"] = [
+                        a + b for a, b in zip(current["bucket_counts"], point["bucket_counts"])
+                    ]
+                    current["sum"] += point["sum"]
+                    current["count"] += point["count"]
+                else:
+                    current["value"] += point["value"]
+    return [dict(metric, points=list(metric["points"].values())) for metric in merged.values()]
+
+
+def render_prometheus() -> str:
+    """Return the metrics in the Prometheus text format: of all processes when
+    there is a METRICS_DIR, else of this process."""
+    if _metrics_dir is None:
+        return _render(_collect())
+    write_process_metrics()
+    return _render(_merge(_read_process_metrics()))
+
+
+def _render(collected: List[dict]) -> str:
+    lines = []
+    for metric in collected:
+        if metric["kind"] == "histogram":
+            name = _prometheus_name(metric["name"], metric["unit"])
+            lines.append(f"# HELP {name} {metric['description']}")
+            lines.append(f"# TYPE {name} histogram")
+            for point in metric["points"]:
+                cumulative = 0
+                for bound, count in zip(point["bounds"], point["bucket_counts"]):
+                    cumulative += count
+                    labels = _prometheus_labels(point["attributes"], le=float(bound))
+                    lines.append(f"{name}_bucket{labels} {cumulative}")
+                labels = _prometheus_labels(point["attributes"], le="+Inf")
+                lines.append(f"{name}_bucket{labels} {point['count']}")
+                labels = _prometheus_labels(point["attributes"])
+                lines.append(f"{name}_sum{labels} {point['sum']}")
+                lines.append(f"{name}_count{labels} {point['count']}")
+        else:
+            name = _prometheus_name(metric["name"], metric["unit"], suffix="total")
+            lines.append(f"# HELP {name} {metric['description']}")
+            lines.append(f"# TYPE {name} counter")
+            for point in metric["points"]:
+                lines.append(f"{name}{_prometheus_labels(point['attributes'])} {point['value']}")
+    return "\n".join(lines) + "\n"
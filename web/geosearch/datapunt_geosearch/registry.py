@@ -1,8 +1,10 @@
+import hashlib
 import json
 import logging
+import threading
 import time
 from collections import defaultdict
-from typing import Dict, List, Optional, Set
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
 
 import psycopg2.extras
 from flask import current_app as app
@@ -12,8 +14,11 @@ from schematools.naming import to_snake_case, toCamelCase
 from schematools.types import DatasetSchema, DatasetTableSchema
 
 from datapunt_geosearch.datasource import DataSourceBase
-from datapunt_geosearch.db import dbconnection
+from datapunt_geosearch.db import dbconnection, release_connections
 from datapunt_geosearch.exceptions import DataSourceException
+from datapunt_geosearch.registry_snapshot import get_registry_snapshot
+from datapunt_geosearch.spatial_index import build_spatial_indexes
+from datapunt_geosearch.statements import statement_cache
 
 _logger = logging.getLogger(__name__)
 
@@ -32,28 +37,69 @@ class DatasetRegistry:
 
     # Determines the refresh interval for dynamic datasources
     INITIALIZE_DELAY_SECONDS = 300
+    # Seconds before a failed background refresh is retried
+    REFRESH_RETRY_SECONDS = 30
+    # Seconds between checks for a new generation of the shared registry snapshot
+    SNAPSHOT_CHECK_SECONDS = 1
 
     def __init__(self):
         # Datasets is a mapping of conn string => Datasources.
         self.datasets: Dict[str, List[DataSourceBase]] = defaultdict(list)
         self.providers: Dict[str, DataSourceBase] = dict()
+        # The scopes that each registered class requires, next to OPENBAAR.
+        self._required_scopes: Dict[DataSourceBase, FrozenSet[str]] = dict()
+        # Incremented whenever the providers change, to invalidate derived data.
+        self.generation = 0
         self._datasets_initialized = None
+        # Per dataservices dataset: the fingerprint of its rows and its generated
+        # datasource classes (by "<dataset>/<table>"), reused when nothing changed.
+        self._dataservices_datasets: Dict[str, Tuple[str, Dict[str, DataSourceBase]]] = {}
+        # Per dataservices dataset: the hash of its schema_data and the parsed schema.
+        self._schemas: Dict[str, Tuple[str, DatasetSchema]] = {}
+        # Number of datasets reused, rebuilt and removed by the last refresh.
+        self.refresh_stats = {"reused": 0, "rebuilt": 0, "removed": 0}
+        # Only one refresh runs at a time (the initial one or a background refresh).
+        self._refresh_lock = threading.Lock()
+        # Background refreshes: every trigger takes a ticket, a refresh completes
+        # the tickets that were taken before it started.
+        self._refresh_condition = threading.Condition()
+        self._refresh_thread = None
+        self._refresh_requested = 0
+        self._refresh_completed = 0
+        self._refresh_attempted = None
+        self._refresh_forced = False
+        # The generation of the shared snapshot that the datasets were built from.
+        self._snapshot_generation = None
+        self._snapshot_checked = None
 
     def register_datasource(self, dsn, datasource_class):
         """Register a Datasource class with a dsn (synonymous to connection string)"""
-        self.datasets[dsn].append(datasource_class)
+        self._add_datasource(self.datasets, self.providers, dsn, datasource_class)
+        self._required_scopes = self._index_scopes(self.providers)
+        self.generation += 1
+
+    @staticmethod
+    def _add_datasource(datasets, providers, dsn, datasource_class):
+        datasets[dsn].append(datasource_class)
 
         for dataset in datasource_class.metadata["datasets"]:
-            self.providers[dataset] = datasource_class
+            providers[dataset] = datasource_class
             for table in datasource_class.metadata["datasets"][dataset]:
                 key = f"{dataset}/{table}"
-                if table in self.providers and self.providers[table] != datasource_class:
+                if table in providers and providers[table] != datasource_class:
                     _logger.debug(
                         "Provider for {} already defined {} and will be overwritten by {}.".format(  # noqa: E501
-                            table, self.providers[table], datasource_class
+                            table, providers[table], datasource_class
                         )
                     )
-                self.providers[key] = datasource_class
+                providers[key] = datasource_class
+
+    @staticmethod
+    def _index_scopes(providers):
+        return {
+            datasource_class: frozenset(datasource_class.metadata.get("scopes", ()))
+            for datasource_class in set(providers.values())
+        }
 
     def register_external_dataset(self, name, base_url, path, field_mapping=None):
         from datapunt_geosearch.datasource import ExternalDataSource
@@ -88,14 +134,41 @@ class DatasetRegistry:
         The result is deduplicated because it is not guaranteed that the searched keys
         return a unique set of datasources. This occurs for example when two datasets
         from hosted by the same datsource are used as search keys.
+
+        The names are looked up in the providers and the required scopes per class
+        are indexed when the registry is refreshed, so this only costs a lookup
+        per requested name.
         """
-        return set(
-            [
-                datasource_cls
-                for name, datasource_cls in self.get_all_datasources().items()
-                if name in names and datasource_cls.check_scopes(scopes=scopes)
-            ]
-        )
+        providers = self.get_all_datasources()
+        granted_scopes = self._granted_scopes(scopes)
+
+        datasources = set()
+        for name in names:
+            datasource_cls = providers.get(name)
+            if datasource_cls is not None and self._is_granted(datasource_cls, granted_scopes):
+                datasources.add(datasource_cls)
+        return datasources
+
+    def get_dataset_table_names(self, scopes: Optional[List[str]] = None) -> List[str]:
+        """Return the "<dataset>/<table>" names that are accessible with `scopes`."""
+        granted_scopes = self._granted_scopes(scopes)
+        return [
+            name
+            for name, datasource_cls in self.get_all_datasources().items()
+            if "/" in name and self._is_granted(datasource_cls, granted_scopes)
+        ]
+
+    @staticmethod
+    def _granted_scopes(scopes=None):
+        # OPENBAAR is always granted, see `DataSourceBase.check_scopes`.
+        return {"OPENBAAR"}.union(scopes or ())
+
+    def _is_granted(self, datasource_cls, granted_scopes):
+        required = self._required_scopes.get(datasource_cls)
+        if required is None:
+            # Not (yet) in the index, e.g. during a refresh.
+            required = frozenset(datasource_cls.metadata.get("scopes", ()))
+        return required <= granted_scopes
 
     def init_dataset(
         self,
@@ -109,6 +182,7 @@ class DatasetRegistry:
         crs=None,
         set_user_role=False,
         dataset_field_names=None,
+        register=True,
     ):
         """
         Initialize dataset class and register it in registry based on row data
@@ -128,6 +202,7 @@ class DatasetRegistry:
           dsn_name: DSN for namespacing
           scopes: Optional comma separated list of Authentication scopes for dataset.
           field_name_transformation: Optional function that will transform field names.
+          register: Whether to register the class in the registry right away.
 
         Returns:
           DataSourceBase subclass for given dataset.
@@ -190,6 +265,7 @@ class DatasetRegistry:
                 field_name_transformation(temporal_dimension.end.db_name),
             )
             fields += list(temporal_bounds)
+        columns = ["display", "type", "uri", "geometrie", "id", *(temporal_bounds or ())]
 
         datasource_class = type(
             class_name,
@@ -201,6 +277,7 @@ class DatasetRegistry:
                     "datasets": {dataset_name: {name: schema_table}},
                     "scopes": scopes or set(),
                     "fields": fields,
+                    "columns": columns,
                 },
                 "dsn_name": dsn_name,
                 "temporal_bounds": temporal_bounds,
@@ -210,19 +287,132 @@ class DatasetRegistry:
             },
         )
 
-        self.register_datasource(dsn_name, datasource_class)
+        if register:
+            self.register_datasource(dsn_name, datasource_class)
         return datasource_class
 
     def init_datasets(self):
         """Initialize dynamic datasources. In this case a
         Datasource class is generated for each dataset in vsd and
-        in the dataservices database."""
+        in the dataservices database.
+
+        The first initialization is done right away. After that, expired datasources
+        are refreshed in the background while the current ones keep being served.
+        """
+        if self._datasets_initialized is None:
+            with self._refresh_lock:
+                if self._datasets_initialized is None:
+                    self._refresh()
+        elif self._refresh_due() or self._snapshot_due():
+            self.refresh()
+
+    @property
+    def refreshing(self):
+        return self._refresh_thread is not None
+
+    def _refresh_due(self):
+        now = time.time()
+        return (
+            now - self._datasets_initialized > self.INITIALIZE_DELAY_SECONDS
+            and not self.refreshing
+            and (
+                self._refresh_attempted is None
+                or now - self._refresh_attempted > self.REFRESH_RETRY_SECONDS
+            )
+        )
+
+    def _snapshot_due(self):
+        """Whether another process has written a new generation of the shared
+        registry snapshot.
+
+        The snapshot is checked at most once per SNAPSHOT_CHECK_SECONDS. An expired
+        snapshot is left to `_refresh_due`, so the processes do not all refresh while
+        one of them holds the lock to write the next generation.
+        """
+        snapshot = get_registry_snapshot()
+        now = time.time()
         if (
-            self._datasets_initialized is None
-            or time.time() - self._datasets_initialized > self.INITIALIZE_DELAY_SECONDS
+            snapshot is None
+            or self.refreshing
+            or (
+                self._snapshot_checked is not None
+                and now - self._snapshot_checked < self.SNAPSHOT_CHECK_SECONDS
+            )
         ):
-            self.init_dataservices_datasets()
-            self._datasets_initialized = time.time()
+            return False
+        self._snapshot_checked = now
+
+        header = snapshot.read_header()
+        return header is not None and header.generation != self._snapshot_generation
+
+    def refresh(self, wait=False, timeout=None, force=False):
+        """Refresh the dynamic datasources in a background thread.
+
+        Triggers that arrive while a refresh is running are coalesced into
+        a single follow-up refresh. With `wait`, this blocks until a refresh
+        that started after the call has completed (or `timeout` has passed).
+        With `force`, the datasets are read from the database even when the
+        shared registry snapshot has not expired.
+
+        Returns False when waiting timed out.
+        """
+        flask_app = app._get_current_object()
+        with self._refresh_condition:
+            if force:
+                self._refresh_forced = True
+            self._refresh_requested += 1
+            ticket = self._refresh_requested
+            if self._refresh_thread is None:
+                self._refresh_thread = threading.Thread(
+                    target=self._refresh_worker,
+                    args=(flask_app,),
+                    name="geosearch-registry-refresh",
+                    daemon=True,
+                )
+                self._refresh_thread.start()
+            if wait:
+                return self._refresh_condition.wait_for(
+                    lambda: self._refresh_completed >= ticket, timeout
+                )
+        return True
+
+    def _refresh_worker(self, flask_app):
+        with flask_app.app_context():
+            while True:
+                with self._refresh_condition:
+                    if self._refresh_completed >= self._refresh_requested:
+                        self._refresh_thread = None
+                        return
+                    ticket = self._refresh_requested
+
+                try:
+                    with self._refresh_lock:
+                        self._refresh()
+                except Exception:
+                    _logger.error("Failed to refresh the dataset registry", exc_info=True)
+                finally:
+                    release_connections()
+                    with self._refresh_condition:
+                        self._refresh_completed = ticket
+                        self._refresh_condition.notify_all()
+
+    def _refresh(self):
+        """Build the dynamic datasources and swap them in. The previous
+        datasources are served until the new ones are complete."""
+        self._refresh_attempted = time.time()
+        self.init_dataservices_datasets()
+        self._datasets_initialized = time.time()
+        # The statements of replaced and removed datasource classes are deallocated,
+        # those of the datasets that did not change are kept.
+        statement_cache.retain(set(self.providers.values()))
+        build_spatial_indexes(
+            self.providers.values(),
+            fingerprints={
+                datasource_class: fingerprint
+                for fingerprint, classes in self._dataservices_datasets.values()
+                for datasource_class in classes.values()
+            },
+        )
 
     def _fetch_temporal_dimensions(self, dataset_table: DatasetTableSchema):
         temporal = dataset_table.temporal
@@ -252,7 +442,8 @@ class DatasetRegistry:
             return new_row
         return row
 
-    def init_dataservices_datasets(self, dsn=None):
+    def _fetch_dataservices_rows(self):
+        """Query the dataservices database for the geosearch tables of the datasets."""
         try:
             dbconn = dbconnection(app.config["DSN_DATASERVICES_DATASETS"])
         except psycopg2.Error as e:
@@ -284,21 +475,131 @@ class DatasetRegistry:
       AND d.default_version = dv.version
       AND geometry_field_type is not null
         """
+        return dbconn.fetch_all(sql)
+
+    def init_dataservices_datasets(self, dsn=None):
+        """Generate the datasource classes for the geosearch tables of the dataservices
+        database and register them, replacing those of the previous refresh.
+
+        The rows are fingerprinted per dataset. Datasets that did not change since
+        the previous refresh keep their datasource classes, only new and changed
+        datasets are rebuilt.
+
+        With a REGISTRY_SNAPSHOT_PATH, the rows are read from the snapshot that is shared
+        by the processes of the host, see `registry_snapshot`.
+
+        Returns a mapping of "<dataset>/<table>" to datasource class.
+        """
+        snapshot = get_registry_snapshot()
+        if snapshot is None:
+            rows = self._fetch_dataservices_rows()
+        else:
+            force, self._refresh_forced = self._refresh_forced, False
+            shared = snapshot.load(
+                self._fetch_dataservices_rows, max_age=self.INITIALIZE_DELAY_SECONDS, force=force
+            )
+            self._snapshot_generation = shared.generation
+            rows = shared.rows
+
+        rows_per_dataset = defaultdict(list)
+        for row in rows:
+            rows_per_dataset[row["dataset_name"]].append(row)
+
+        dataservices_datasets = {}
+        stats = {"reused": 0, "rebuilt": 0, "removed": 0}
+        for dataset_name, rows in rows_per_dataset.items():
+            fingerprint = self._fingerprint(rows)
+            previous = self._dataservices_datasets.get(dataset_name)
+            if previous is not None and previous[0] == fingerprint:
+                dataservices_datasets[dataset_name] = previous
+                stats["reused"] += 1
+            else:
+                dataservices_datasets[dataset_name] = (
+                    fingerprint,
+                    self._init_dataservices_dataset(dataset_name, rows),
+                )
+                stats["rebuilt"] += 1
+        stats["removed"] = len(self._dataservices_datasets.keys() - dataservices_datasets.keys())
+
+        # Replace the classes of the previous refresh, without touching the
+        # datasources that have been registered otherwise.
+        previous_classes = {
+            datasource_class
+            for _fingerprint, classes in self._dataservices_datasets.values()
+            for datasource_class in classes.values()
+        }
+        datasets = defaultdict(list)
+        for registered_dsn, classes in self.datasets.items():
+            datasets[registered_dsn] = [cls for cls in classes if cls not in previous_classes]
+        providers = {
+            name: datasource_class
+            for name, datasource_class in self.providers.items()
+            if datasource_class not in previous_classes
+        }
+        result = {}
+        for _fingerprint, classes in dataservices_datasets.values():
+            for key, datasource_class in classes.items():
+                self._add_datasource(
+                    datasets, providers, datasource_class.dsn_name, datasource_class
+                )
+                result[key] = datasource_class
+
+        self.datasets = datasets
+        self._required_scopes = self._index_scopes(providers)
+        if list(providers.items()) != list(self.providers.items()):
+            self.providers = providers
+            self.generation += 1
+        self._dataservices_datasets = dataservices_datasets
+        self._schemas = {
+            name: schema for name, schema in self._schemas.items() if name in dataservices_datasets
+        }
+        self.refresh_stats = stats
+        _logger.info(
+            "Refreshed dataservices datasets: %(reused)d reused, %(rebuilt)d rebuilt,"
+            " %(removed)d removed",
+            stats,
+        )
+        return result
+
+    @staticmethod
+    def _fingerprint(rows) -> str:
+        """Return a fingerprint of the rows of a dataset (which share the schema_data)."""
+        digest = hashlib.sha1((rows[0]["schema_data"] or "").encode(), usedforsecurity=False)
+        for row in sorted(rows, key=lambda row: row["name"] or ""):
+            digest.update(
+                json.dumps(
+                    {key: value for key, value in row.items() if key != "schema_data"},
+                    sort_keys=True,
+                    default=str,
+                ).encode()
+            )
+        return digest.hexdigest()
+
+    def _get_dataset_schema(self, dataset_name, schema_data) -> DatasetSchema:
+        """Parse the schema_data of a dataset, once for all of its tables and
+        only again when it changes."""
+        schema_hash = hashlib.sha1(schema_data.encode(), usedforsecurity=False).hexdigest()
+        cached = self._schemas.get(dataset_name)
+        if cached is None or cached[0] != schema_hash:
+            # TODO: Remove schematools as a dependency or use a proper loader
+            # object so that relations can be resolved. Dataset* objs are not
+            # ready to be a public API.
+            # For now we use a URL schema loader that is created at module load time.
+            cached = (schema_hash, DatasetSchema.from_dict(json.loads(schema_data)))
+            self._schemas[dataset_name] = cached
+        return cached[1]
+
+    def _init_dataservices_dataset(self, dataset_name, rows) -> Dict[str, DataSourceBase]:
+        """Generate the (unregistered) datasource classes for the tables of a dataset."""
         datasets = dict()
-        for row in dbconn.fetch_all(sql):
+        for row in rows:
             # TODO: Remove all code assuming that schema_data can be inconsistent
             crs = DEFAULT_CRS
             temporal_dimension = None
             dataset_field_names = None
             if row["schema_data"]:
                 try:
-                    # TODO: Remove schematools as a dependency or use a proper loader
-                    # object so that relations can be resolved. Dataset* objs are not
-                    # ready to be a public API.
-                    # For now we use a URL schema loader that is created at module load time.
-                    dataset_schema = DatasetSchema.from_dict(
-                        json.loads(row["schema_data"]),
-                    )
+                    dataset_schema = self._get_dataset_schema(dataset_name, row["schema_data"])
                     dataset_table = dataset_schema.get_table_by_id(
                         toCamelCase(row["name"]), include_nested=False, include_through=False
                     )
@@ -337,6 +638,7 @@ class DatasetRegistry:
                 # on Azure.
                 set_user_role=True,
                 dataset_field_names=dataset_field_names,
+                register=False,
             )
             if dataset is not None:
                 key = f"{row['dataset_name']}/{row['name']}"
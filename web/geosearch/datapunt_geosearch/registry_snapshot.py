@@ -0,0 +1,166 @@
+"""A snapshot of the dataservices datasets, shared by the processes of a host.
+
+Without a snapshot, every uwsgi process queries the dataservices database for
+its dataset registry. With `REGISTRY_SNAPSHOT_PATH`, the process that finds the
+snapshot missing or expired takes a file lock, queries the database and writes
+a new snapshot. The other processes read the rows of the datasets from it,
+and refresh their registry as soon as they see a new generation.
+
+The file has a fixed size header (magic, payload length, generation and
+creation time) followed by the zlib-compressed JSON of the rows, with the
+schema_data once per dataset. It is replaced atomically, and read with mmap.
+"""
+import contextlib
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, List, NamedTuple, Optional
+
+from flask import current_app as app
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = b"GSR1"
+HEADER = struct.Struct("<4sIQd")
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+class SnapshotHeader(NamedTuple):
+    generation: int
+    created_at: float
+
+    @property
+    def age(self):
+        return time.time() - self.created_at
+
+
+class Snapshot(NamedTuple):
+    generation: Optional[int]  # None when the rows were not shared
+    created_at: float
+    rows: List[dict]
+
+
+def _pack_rows(rows) -> bytes:
+    datasets = {}
+    for row in rows:
+        dataset = datasets.setdefault(
+            row["dataset_name"], {"schema_data": row["schema_data"], "rows": []}
+        )
+        dataset["rows"].append({key: value for key, value in row.items() if key != "schema_data"})
+    return zlib.compress(json.dumps(datasets, default=str).encode())
+
+
+def _unpack_rows(payload: bytes) -> List[dict]:
+    return [
+        dict(row, schema_data=dataset["schema_data"])
+        for dataset in json.loads(zlib.decompress(payload)).values()
+        for row in dataset["rows"]
+    ]
+
+
+class RegistrySnapshot:
+    """The snapshot file at `path`, with a lock file next to it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    def read_header(self) -> Optional[SnapshotHeader]:
+        """Return the generation and creation time, or None when there is no snapshot."""
+        return self._read(header_only=True)
+
+    def read(self) -> Optional[Snapshot]:
+        """Return the snapshot, or None when there is none."""
+        return self._read(header_only=False)
+
+    def _read(self, header_only):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, length, generation, created_at = HEADER.unpack_from(mm)
+                if magic != MAGIC or HEADER.size + length > size:
+                    _logger.warning("Ignoring invalid registry snapshot %s", self.path)
+                    return None
+                if header_only:
+                    return SnapshotHeader(generation, created_at)
+                rows = _unpack_rows(mm[HEADER.size : HEADER.size + length])
+                return Snapshot(generation, created_at, rows)
+
+    def write(self, rows) -> Snapshot:
+        """Write the rows as the next generation of the snapshot."""
+        header = self.read_header()
+        generation = header.generation + 1 if header is not None else 1
+        created_at = time.time()
+        payload = _pack_rows(rows)
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(payload), generation, created_at))
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+        _logger.info("Wrote registry snapshot generation %d (%d bytes)", generation, len(payload))
+        return Snapshot(generation, created_at, list(rows))
+
+    @contextlib.contextmanager
+    def lock(self, blocking=False):
+        """Yields whether the lock of the refresher was acquired."""
+        with open(self.lock_path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self, fetch: Callable[[], List[dict]], max_age, force=False) -> Snapshot:
+        """Return the snapshot, refreshing it when it is missing or older than `max_age`
+        seconds (or `force`) with the rows returned by `fetch`.
+
+        Only the process that holds the lock refreshes the snapshot, the others keep
+        using the current one. When there is none yet, they fetch the rows themselves.
+        """
+        header = self.read_header()
+        if force or header is None or header.age >= max_age:
+            with self.lock(blocking=force) as locked:
+                if locked:
+                    header = self.read_header()
+                    if force or header is None or header.age >= max_age:
+                        rows = fetch()
+                        try:
+                            return self.write(rows)
+                        except OSError:
+                            _logger.error("Failed to write the registry snapshot", exc_info=True)
+                            return Snapshot(None, time.time(), rows)
+
+        snapshot = self.read()
+        if snapshot is None:
+            return Snapshot(None, time.time(), fetch())
+        return snapshot
+
+
+def get_registry_snapshot() -> Optional[RegistrySnapshot]:
+    """Return the registry snapshot, or None when it is disabled (no REGISTRY_SNAPSHOT_PATH)."""
+    path = app.config.get("REGISTRY_SNAPSHOT_PATH")
+    if not path:
+        return None
+    with _snapshots_lock:
+        if path not in _snapshots:
+            _snapshots[path] = RegistrySnapshot(path)
+        return _snapshots[path]
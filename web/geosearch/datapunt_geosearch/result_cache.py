@@ -0,0 +1,85 @@
+"""In-process cache for the results of the database datasources.
+
+The same map clicks (the city centre, popular addresses) are repeated all the
+time. The serialized features of a datasource are kept here, by a key that is
+built by the engine from the (quantised) coordinates and all other request
+parameters that make a difference, see `engine.result_cache_key`.
+"""
+import threading
+
+from cachetools import TTLCache
+from flask import current_app as app
+
+from datapunt_geosearch.registry import DatasetRegistry
+
+# Estimate of the memory used by a cache entry, apart from the features
+ENTRY_OVERHEAD_BYTES = 256
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def _sizeof(features):
+    return ENTRY_OVERHEAD_BYTES + sum(len(feature) for feature in features)
+
+
+class ResultCache:
+    """A cache of serialized features, bounded by their size in bytes.
+
+    Entries expire after `ttl` seconds, the least recently used entries are
+    evicted when the cache is full.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=_sizeof)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached features for `key`, or None."""
+        with self._lock:
+            features = self._cache.get(key)
+            if features is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return features
+
+    def set(self, key, features):
+        with self._lock:
+            try:
+                self._cache[key] = features
+            except ValueError:
+                # Too large to cache at all
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._cache),
+                "bytes": self._cache.currsize,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+            }
+
+
+def get_result_cache():
+    """Return the result cache, or None when it is disabled (RESULT_CACHE_MAX_BYTES = 0)."""
+    global _result_cache
+    max_bytes = app.config.get("RESULT_CACHE_MAX_BYTES", 0)
+    if not max_bytes:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None or _result_cache.max_bytes != max_bytes:
+            ttl = app.config.get("RESULT_CACHE_TTL") or DatasetRegistry.INITIALIZE_DELAY_SECONDS
+            _result_cache = ResultCache(max_bytes=max_bytes, ttl=ttl)
+        return _result_cache
@@ -0,0 +1,218 @@
+"""In-memory spatial index for small polygon tables.
+
+Most of the traffic consists of containment lookups in small administrative
+layers (stadsdelen, wijken, buurten). Those tables are loaded in an STR-tree
+on registry refresh, so that their `contains` queries can be answered without
+a database round trip.
+
+The tables of a dataset are only loaded again when the fingerprint of the
+dataset changed, or when they were loaded more than SPATIAL_INDEX_MAX_AGE
+seconds ago (to pick up changes in the data itself).
+"""
+import logging
+import time
+from typing import Dict, NamedTuple, Optional
+
+import psycopg2
+import psycopg2.extras
+import shapely
+from flask import current_app as app
+from psycopg2 import sql
+
+from datapunt_geosearch.db import dbconnection
+
+_logger = logging.getLogger(__name__)
+
+# Per datasource class and table: the index for its polygon queries.
+# Replaced as a whole on every registry refresh.
+spatial_indexes = {}
+
+
+class LoadedTables(NamedTuple):
+    fingerprint: Optional[str]
+    loaded_at: float
+    indexes: Dict[str, Optional["SpatialIndex"]]  # None for tables above the threshold
+
+
+# Per datasource class: the tables that were loaded, to reuse them on the next refresh.
+_loaded_tables: Dict[type, LoadedTables] = {}
+
+
+class SpatialIndex:
+    """The polygons of a table with their result rows.
+
+    Rows are the default properties of a feature. The validity of temporal
+    rows is kept as epoch seconds, so it can be checked at query time.
+    """
+
+    def __init__(self, rows, geometries, valid_from=None, valid_to=None):
+        self.rows = rows
+        self.geometries = geometries
+        self.centroids = shapely.centroid(geometries)
+        self.valid_from = valid_from
+        self.valid_to = valid_to
+        shapely.prepare(geometries)
+        self.tree = shapely.STRtree(geometries)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def is_valid(self, index, now):
+        if self.valid_from is None:
+            return True
+        start, end = self.valid_from[index], self.valid_to[index]
+        return (start is None or start < now) and (end is None or end > now)
+
+    def contains(self, x, y, now=None):
+        """Return the rows of the polygons that contain `(x, y)`, ordered by
+        the distance from their centroid (like the polygon query)."""
+        now = time.time() if now is None else now
+        point = shapely.Point(x, y)
+        matches = [
+            index
+            for index in self.tree.query(point, predicate="within")
+            if self.is_valid(index, now)
+        ]
+        distances = shapely.distance(self.centroids[matches], point)
+        return [
+            {**self.rows[index], "distance": float(distance)}
+            for distance, index in sorted(zip(distances, matches))
+        ]
+
+
+def is_indexable(datasource_class):
+    """Only polygon tables that are accessible without extra scopes are indexed,
+    all other authorization stays with the database."""
+    return (
+        datasource_class.dsn_name is not None
+        and datasource_class.metadata.get("operator") == "contains"
+        and datasource_class.metadata.get("scopes", set()) <= {"OPENBAAR"}
+        and not datasource_class.extra_where
+    )
+
+
+def load_spatial_index(datasource, table, max_rows, max_bytes):
+    """Load `table` of `datasource` into a `SpatialIndex`.
+
+    Returns None when the table exceeds `max_rows` or `max_bytes` of geometry data.
+    """
+    variables = datasource.get_variable_sql(table)
+    with datasource.dbconn.cursor() as cur:
+        cur.execute(
+            sql.SQL(
+                "SELECT count(*), sum(ST_MemSize({geo_field}))"
+                " FROM (SELECT {geo_field} FROM {schema}.{table_name} LIMIT %(limit)s) AS t"
+            ).format(**variables),
+            {"limit": max_rows + 1},
+        )
+        count, size = cur.fetchone()
+        if count > max_rows or (size or 0) > max_bytes:
+            return None
+
+    temporal = sql.SQL("")
+    if datasource.temporal_bounds is not None:
+        # Compared with the current time at query time. The database converts
+        # the bounds, so they are interpreted just like in the polygon query.
+        start, end = datasource.temporal_bounds
+        temporal = sql.SQL(
+            ", extract(epoch FROM {start}::timestamptz) AS valid_from"
+            ", extract(epoch FROM {end}::timestamptz) AS valid_to"
+        ).format(start=sql.Identifier(start), end=sql.Identifier(end))
+
+    with datasource.dbconn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(
+            sql.SQL(
+                "SELECT {fields}, ST_AsBinary({geo_field}) AS wkb{temporal}"
+                " FROM {schema}.{table_name}"
+            ).format(temporal=temporal, **variables)
+        )
+        result = cur.fetchall()
+
+    rows = [
+        {prop: row[prop] for prop in datasource.default_properties if prop in row}
+        for row in result
+    ]
+    geometries = shapely.from_wkb([bytes(row["wkb"]) for row in result])
+    if datasource.temporal_bounds is None:
+        return SpatialIndex(rows, geometries)
+    return SpatialIndex(
+        rows,
+        geometries,
+        valid_from=[row["valid_from"] for row in result],
+        valid_to=[row["valid_to"] for row in result],
+    )
+
+
+def build_spatial_indexes(source_classes, fingerprints=None):
+    """Build the indexes for the small polygon tables of `source_classes`.
+
+    Tables are indexed when they have at most SPATIAL_INDEX_MAX_ROWS rows and
+    SPATIAL_INDEX_MAX_BYTES of geometry data. The index is disabled when
+    SPATIAL_INDEX_MAX_ROWS is 0.
+
+    `fingerprints` maps datasource classes to the fingerprint of their dataset,
+    the tables of classes whose fingerprint did not change are not loaded again.
+    """
+    global spatial_indexes, _loaded_tables
+    fingerprints = fingerprints or {}
+    max_rows = app.config.get("SPATIAL_INDEX_MAX_ROWS", 0)
+    max_bytes = app.config.get("SPATIAL_INDEX_MAX_BYTES", 0)
+    max_age = app.config.get("SPATIAL_INDEX_MAX_AGE", 3600)
+    now = time.time()
+    loaded_tables = {}
+    reused = 0
+    for datasource_class in set(source_classes):
+        if not max_rows or not is_indexable(datasource_class):
+            continue
+        fingerprint = fingerprints.get(datasource_class)
+        previous = _loaded_tables.get(datasource_class)
+        if (
+            previous is not None
+            and previous.fingerprint == fingerprint
+            and now - previous.loaded_at < max_age
+        ):
+            loaded_tables[datasource_class] = previous
+            reused += 1
+            continue
+        try:
+            datasource = datasource_class(
+                connection=dbconnection(app.config[datasource_class.dsn_name])
+            )
+            loaded_tables[datasource_class] = LoadedTables(
+                fingerprint,
+                now,
+                {
+                    table: load_spatial_index(datasource, table, max_rows, max_bytes)
+                    for _dataset_key, table in datasource.iter_tables()
+                },
+            )
+        except (KeyError, psycopg2.Error, shapely.errors.ShapelyError):
+            _logger.warning(
+                "Failed to build a spatial index for %s" % datasource_class.__name__,
+                exc_info=True,
+            )
+
+    _loaded_tables = loaded_tables
+    spatial_indexes = {
+        (datasource_class, table): index
+        for datasource_class, loaded in loaded_tables.items()
+        for table, index in loaded.indexes.items()
+        if index is not None
+    }
+    _logger.info(
+        "Spatial indexes for %d tables, %d datasources reused",
+        len(spatial_indexes),
+        reused,
+    )
+
+
+def get_spatial_index(datasource, table):
+    """Return the index that can answer the polygon query of `datasource`
+    on `table`, or None when the query should go to the database.
+
+    Extra fields are not kept in the index and WGS84 coordinates have to be
+    projected by the database.
+    """
+    if not datasource.use_rd or datasource.extra_field_names:
+        return None
+    return spatial_indexes.get((type(datasource), table))
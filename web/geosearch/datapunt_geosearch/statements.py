@@ -0,0 +1,153 @@
+"""Server side prepared statements for the datasource queries.
+
+Postgres parses and plans a statement every time its text is sent.
+For the (fast) geosearch queries, that is a considerable part of the
+execution time. The rendered statement texts are cached here per
+datasource class and query shape, every connection prepares a statement
+once and executes it with the coordinates as parameters after that.
+
+The cache holds at most `maxsize` statements (the query shape depends on the
+requested `_fields`), the least recently used statements are evicted and
+deallocated on the connections that prepared them.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Tuple
+
+from psycopg2 import sql
+
+# Types of the query parameters in the prepared statements
+PARAMETER_TYPES = {
+    "x": "float8",
+    "y": "float8",
+    "radius": "float8",
+    "limit": "bigint",
+}
+
+_placeholder_re = re.compile(r"%\((\w+)\)s")
+
+
+class PreparedStatement(NamedTuple):
+    name: str
+    text: str
+    parameters: Tuple[str, ...]
+
+
+class StatementCache:
+    """Cache of statements to prepare, keyed by datasource class and query shape.
+
+    The `generation` changes when the cache is cleared, connections use it to
+    deallocate the statements they prepared before. `evictions` changes when
+    statements are evicted (or removed on a registry refresh), connections then
+    deallocate the statements that are no longer cached.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._statements: Dict[tuple, PreparedStatement] = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._statements)
+
+    def get(self, key, build_query: Callable[[], sql.Composable], context) -> PreparedStatement:
+        """Return the statement for `key`, rendering the query from `build_query` on a miss.
+
+        `context` is a connection or cursor, needed to render the query text.
+        """
+        with self._lock:
+            statement = self._statements.get(key)
+            if statement is not None:
+                self._statements.move_to_end(key)
+                return statement
+
+        statement = to_prepared_statement(build_query().as_string(context))
+        with self._lock:
+            self._statements[key] = statement
+            while len(self._statements) > self.maxsize:
+                self._statements.popitem(last=False)
+                self.evictions += 1
+        return statement
+
+    def names(self):
+        """Return the names of the cached statements."""
+        with self._lock:
+            return {statement.name for statement in self._statements.values()}
+
+    def retain(self, datasource_classes):
+        """Remove the statements of the datasource classes that are not in
+        `datasource_classes`, such as those replaced by a registry refresh."""
+        with self._lock:
+            removed = [key for key in self._statements if key[0] not in datasource_classes]
+            for key in removed:
+                del self._statements[key]
+            self.evictions += len(removed)
+
+    def clear(self):
+        with self._lock:
+            self._statements = OrderedDict()
+            self.generation += 1
+
+
+def to_prepared_statement(query: str) -> PreparedStatement:
+    """Convert a query with named (pyformat) placeholders into a statement
+    with numbered parameters, as needed for PREPARE."""
+    parameters = []
+
+    def _numbered(match):
+        name = match.group(1)
+        if name not in parameters:
+            parameters.append(name)
+        return f"${parameters.index(name) + 1}"
+
+    text = _placeholder_re.sub(_numbered, query).replace("%%", "%")
+    name = "geosearch_" + hashlib.sha1(text.encode(), usedforsecurity=False).hexdigest()[:20]
+    return PreparedStatement(name=name, text=text, parameters=tuple(parameters))
+
+
+def execute_prepared(dbconn, cur, statement: PreparedStatement, params: dict):
+    """Execute `statement` on the cursor, preparing it first when
+    the connection has not seen it before. The rows are left on the cursor.
+
+    The connection keeps track of its prepared statements. These are
+    deallocated when the statement cache has been cleared in the meantime,
+    or when they have been evicted from it.
+    """
+    evictions = statement_cache.evictions
+    if dbconn.prepared_generation != statement_cache.generation:
+        if dbconn.prepared_statements:
+            cur.execute("DEALLOCATE ALL")
+        dbconn.prepared_statements = set()
+        dbconn.prepared_generation = statement_cache.generation
+    elif dbconn.prepared_evictions != evictions:
+        evicted = dbconn.prepared_statements - statement_cache.names()
+        for name in evicted:
+            cur.execute(sql.SQL("DEALLOCATE {name}").format(name=sql.Identifier(name)))
+        dbconn.prepared_statements -= evicted
+    dbconn.prepared_evictions = evictions
+
+    if statement.name not in dbconn.prepared_statements:
+        cur.execute(
+            sql.SQL("PREPARE {name} ({types}) AS ").format(
+                name=sql.Identifier(statement.name),
+                types=sql.SQL(", ").join(
+                    sql.SQL(PARAMETER_TYPES[parameter]) for parameter in statement.parameters
+                ),
+            )
+            + sql.SQL(statement.text)
+        )
+        dbconn.prepared_statements.add(statement.name)
+
+    stmt = sql.SQL("EXECUTE {name}").format(name=sql.Identifier(statement.name))
+    if statement.parameters:
+        stmt += sql.SQL(" ({})").format(
+            sql.SQL(", ").join(sql.Placeholder(parameter) for parameter in statement.parameters)
+        )
+    cur.execute(stmt, params)
+
+
+statement_cache = StatementCache()
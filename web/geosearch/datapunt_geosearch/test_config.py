@@ -1,10 +1,41 @@
 import logging
 
 from datapunt_geosearch.base_config import (  # noqa, this is imported from config.py and essential; noqa: F401
+    DATABASE_JSON,
     DATABASE_SET_ROLE,
     DATAPUNT_API_URL,
+    DB_POOL_CHECK_IDLE,
+    DB_POOL_MAX_IDLE,
+    DB_POOL_MAX_LIFETIME,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_TIMEOUT,
+    EXTERNAL_CACHE_TTL,
+    EXTERNAL_MAX_CONNECTIONS,
+    EXTERNAL_MAX_FAILURES,
+    EXTERNAL_RESET_TIMEOUT,
+    EXTERNAL_TIMEOUT,
+    HEALTH_CHECK_CACHE_SECONDS,
+    HEALTH_CHECK_INTERVAL,
     JW_KEYSET,
     JWKS,
+    JWKS_MIN_RELOAD_INTERVAL,
+    JWKS_REFRESH_INTERVAL,
+    JWT_CLAIMS_CACHE_SIZE,
+    METRICS_DIR,
+    PREPARED_STATEMENTS,
+    QUERY_MODE,
+    QUERY_WORKERS,
+    REGISTRY_SNAPSHOT_PATH,
+    RESULT_CACHE_MAX_BYTES,
+    RESULT_CACHE_PRECISION_RD,
+    RESULT_CACHE_PRECISION_WGS84,
+    RESULT_CACHE_TTL,
+    SPATIAL_INDEX_MAX_AGE,
+    SPATIAL_INDEX_MAX_BYTES,
+    SPATIAL_INDEX_MAX_ROWS,
+    STREAM_CHUNK_SIZE,
+    WARMUP,
     db_connection_string,
     get_db_settings,
 )
@@ -0,0 +1,111 @@
+"""Warm-up of the worker processes.
+
+Without a warm-up, the first requests of every worker (after a deploy or a
+harakiri recycle) pay for building the dataset registry, loading the keys to
+verify tokens with and opening the database connections. With `WARMUP`:
+
+- the dataset registry and the keys are loaded in the uwsgi master, before the
+  workers are forked, so every worker starts with them. The database connections
+  that were used for that are closed, as processes must not share connections.
+- every worker opens its connection pools (`DB_POOL_MIN_SIZE` connections per
+  database) right after the fork, in a background thread.
+
+Until the warm-up of a worker is done, `/status/ready` reports it as not
+ready. Without uwsgi (or with `lazy-apps`) everything is done in the worker.
+"""
+import logging
+import threading
+
+from flask import Flask
+
+from datapunt_geosearch.authz import KeysetManager
+from datapunt_geosearch.db import connection_pools, get_pool, release_connections
+from datapunt_geosearch.registry import registry
+
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+_logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_ready.set()
+
+
+def is_ready() -> bool:
+    """Whether the warm-up of this process is done, or was not started."""
+    return _ready.is_set()
+
+
+def warm_up(app: Flask):
+    """Warm up the application, see the module docstring."""
+    if not app.config.get("WARMUP"):
+        return
+    if uwsgi is not None and uwsgi.worker_id() == 0:
+        from uwsgidecorators import postfork
+
+        _ready.clear()
+        warm_up_master(app)
+        postfork(lambda: start_worker_warm_up(app))
+    else:
+        start_worker_warm_up(app)
+
+
+def warm_up_master(app: Flask):
+    """Load the dataset registry and the keys before the workers are forked."""
+    with app.app_context():
+        try:
+            registry.init_datasets()
+            _load_keys(app)
+        except Exception:
+            _logger.error("Failed to warm up before forking the workers", exc_info=True)
+        finally:
+            release_connections()
+            for pool in connection_pools.values():
+                pool.close()
+            connection_pools.clear()
+
+
+def start_worker_warm_up(app: Flask) -> threading.Thread:
+    """Warm up this worker in a background thread, it is ready when that is done."""
+    _ready.clear()
+    thread = threading.Thread(
+        target=_warm_up_worker, args=(app,), name="geosearch-warmup", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def _warm_up_worker(app: Flask):
+    with app.app_context():
+        try:
+            # Only does something when that failed in the master.
+            registry.init_datasets()
+            _load_keys(app)
+            for dsn, set_user_role in _database_pools(app):
+                get_pool(dsn, set_user_role).fill()
+            _logger.info("Warm-up done")
+        except Exception:
+            _logger.error("Failed to warm up the worker", exc_info=True)
+        finally:
+            release_connections()
+            _ready.set()
+
+
+def _load_keys(app):
+    """Load the keys of the JWKS URL, when that was not done yet."""
+    keys = app.config.get("JW_KEYSET")
+    if isinstance(keys, KeysetManager) and keys.jwks_url and keys.loaded_at is None:
+        if not keys.reload():
+            _logger.warning("No keys loaded from %s", keys.jwks_url)
+
+
+def _database_pools(app):
+    """Return the (dsn, set_user_role) of the pools that the datasources use."""
+    pools = set()
+    for datasource_class in registry.providers.values():
+        dsn_name = getattr(datasource_class, "dsn_name", None)
+        if dsn_name and app.config.get(dsn_name):
+            pools.add((app.config[dsn_name], datasource_class.set_user_role))
+    return pools
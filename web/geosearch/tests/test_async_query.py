@@ -0,0 +1,152 @@
+import asyncio
+import json
+import threading
+import unittest
+import unittest.mock
+
+import pytest
+from flask import current_app as app
+from psycopg2 import sql
+
+from datapunt_geosearch import aio
+from datapunt_geosearch.blueprints import engine
+from datapunt_geosearch.datasource import DataSourceBase, ExternalDataSource
+from datapunt_geosearch.registry import registry
+
+
+class SlowDataSource(DataSourceBase):
+    dsn_name = "DSN_DATASERVICES_DATASETS"
+    metadata = {"datasets": {"slow": {"slow": "public.slow"}}}
+
+    async def execute_queries_async(self, datasets=None):
+        await asyncio.sleep(0.2)
+        return [{"properties": {"type": type(self).__name__}}]
+
+
+class FastDataSource(SlowDataSource):
+    metadata = {"datasets": {"fast": {"fast": "public.fast"}}}
+
+    async def execute_queries_async(self, datasets=None):
+        return [{"properties": {"type": type(self).__name__}}]
+
+
+class FailingDataSource(SlowDataSource):
+    async def execute_queries_async(self, datasets=None):
+        raise RuntimeError("Failed")
+
+
+class ToAsyncSqlTestCase(unittest.TestCase):
+    def test_queries_are_converted_to_psycopg3(self):
+        query = sql.SQL("SELECT {fields} FROM {table} WHERE id = {id} LIMIT {limit}").format(
+            fields=sql.SQL(", ").join([sql.SQL("id"), sql.SQL("name")]),
+            table=sql.Identifier("public", "fake"),
+            id=sql.Literal("a'b"),
+            limit=sql.Placeholder("limit"),
+        )
+        self.assertEqual(
+            aio.to_async_sql(query).as_string(None),
+            "SELECT id, name FROM \"public\".\"fake\" WHERE id = 'a''b' LIMIT %(limit)s",
+        )
+
+
+class AsyncFetchTestCase(unittest.TestCase):
+    request_args = {"x": "123282.6", "y": "487684.8", "rd": True, "limit": None}
+
+    def test_features_are_streamed_as_datasources_complete(self):
+        with unittest.mock.patch.object(engine, "AsyncDBConnection"):
+            results = list(
+                engine.fetch_data_async(
+                    [SlowDataSource, FastDataSource, FailingDataSource],
+                    self.request_args,
+                    ["slow", "fast"],
+                )
+            )
+
+        results = {
+            sourceClass: features and features[0]["properties"]["type"]
+            for sourceClass, features in results
+        }
+        self.assertEqual(
+            results,
+            {
+                SlowDataSource: "SlowDataSource",
+                FastDataSource: "FastDataSource",
+                FailingDataSource: None,
+            },
+        )
+        # The slow datasource does not hold back the others.
+        self.assertIs(list(results)[-1], SlowDataSource)
+
+    def test_external_datasources_fetch_their_datasets_concurrently(self):
+        datasource = ExternalDataSource(
+            meta={
+                "base_url": "http://external/",
+                "datasets": {"ext": {"one": "one/", "two": "two/"}},
+            }
+        )
+        barrier = threading.Barrier(2, timeout=1)
+
+        def fake_fetch_data(dataset_name, subset_url, request_params=None):
+            # Both datasets have to be fetched at the same time to pass the barrier.
+            barrier.wait()
+            return [{"properties": {"type": dataset_name}}]
+
+        with unittest.mock.patch.object(datasource, "fetch_data", side_effect=fake_fetch_data):
+            features = asyncio.run(datasource.execute_queries_async())
+
+        self.assertEqual(
+            [feature["properties"]["type"] for feature in features], ["ext/one", "ext/two"]
+        )
+
+
+@pytest.mark.usefixtures("dataservices_db", "dataservices_fake_data", "role_configuration")
+class AsyncQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        # Force registry to reload dataservices datasources
+        registry._datasets_initialized = None
+        app.config["QUERY_MODE"] = "async"
+
+    def tearDown(self):
+        app.config["QUERY_MODE"] = "sequential"
+        app.config["DATABASE_JSON"] = False
+
+    def _search(self, query):
+        with app.test_client() as client:
+            response = client.get(query)
+            return json.loads(response.data)
+
+    def _assert_same_features(self, query, count=7):
+        async_response = self._search(query)
+        app.config["QUERY_MODE"] = "sequential"
+        sequential_response = self._search(query)
+
+        self.assertEqual(async_response["type"], "FeatureCollection")
+        self.assertEqual(len(async_response["features"]), count)
+        self.assertCountEqual(async_response["features"], sequential_response["features"])
+
+    def test_async_query_returns_same_features_as_sequential_queries(self):
+        self._assert_same_features(
+            "/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag&_fields=volgnummer"
+        )
+
+    def test_async_query_with_database_json(self):
+        app.config["DATABASE_JSON"] = True
+        self._assert_same_features(
+            "/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag&limit=1", count=2
+        )
+
+    def test_async_query_switches_to_the_end_user_role(self):
+        app.config["DATABASE_SET_ROLE"] = True
+        self.addCleanup(app.config.update, DATABASE_SET_ROLE=False)
+        roles = []
+        cursor = aio.AsyncDBConnection.cursor
+
+        def fake_cursor(connection):
+            roles.append(connection.end_user)
+            return cursor(connection)
+
+        with unittest.mock.patch.object(aio.AsyncDBConnection, "cursor", fake_cursor):
+            response = self._search("/?x=123282.6&y=487684.8&radius=20&datasets=fake")
+
+        self.assertTrue(response["features"])
+        self.assertIn(("anonymous_role", "geosearch-openbaar"), roles)
@@ -0,0 +1,100 @@
+import unittest
+
+from benchmarks import load, replay
+
+
+class LoadStatisticsTestCase(unittest.TestCase):
+    def test_nearest_rank_percentiles(self):
+        values = list(range(1, 101))
+        self.assertEqual(load.percentile(values, 50), 50)
+        self.assertEqual(load.percentile(values, 95), 95)
+        self.assertEqual(load.percentile(values, 99), 99)
+        self.assertEqual(load.percentile([7], 99), 7)
+        self.assertIsNone(load.percentile([], 50))
+
+    def test_summary_counts_failed_requests(self):
+        samples = [
+            load.Sample("search", 200, 0.010, 100),
+            load.Sample("search", 200, 0.020, 100),
+            load.Sample("search", 500, 0.030, 10),
+            load.Sample("search", 0, 0.040, 0),
+        ]
+        summary = load.summarize(samples, 2.0)
+
+        self.assertEqual(summary["count"], 4)
+        self.assertEqual(summary["errors"], 2)
+        self.assertEqual(summary["error_rate"], 0.5)
+        self.assertEqual(summary["throughput"], 2.0)
+        self.assertEqual(summary["bytes"], 210)
+        self.assertEqual(summary["latency_ms"]["p50"], 20.0)
+        self.assertEqual(summary["latency_ms"]["max"], 40.0)
+
+
+class ReplayParsingTestCase(unittest.TestCase):
+    def test_search_requests_are_read_from_several_formats(self):
+        lines = [
+            '10.0.0.1 - - [18/Oct/2026:10:00:00 +0200] "GET /?x=1&y=2&datasets=a/b HTTP/1.1"'
+            " 200 512",
+            "/?lat=52.3&lon=4.9",
+            "x=3&y=4",
+            '{"query": "x=5&y=6"}',
+            '{"path": "/?x=7&y=8"}',
+            '10.0.0.1 - - "GET /catalogus/ HTTP/1.1" 200 100',
+            "# comment",
+            "",
+        ]
+        self.assertEqual(
+            list(replay.read_paths(lines)),
+            [
+                "/?x=1&y=2&datasets=a/b",
+                "/?lat=52.3&lon=4.9",
+                "/?x=3&y=4",
+                "/?x=5&y=6",
+                "/?x=7&y=8",
+            ],
+        )
+
+    def test_uwsgi_request_log_lines_are_read(self):
+        lines = [
+            "[pid: 12|app: 0|req: 1/1] 10.0.0.1 () {34 vars in 512 bytes}"
+            " [Sun Oct 18 10:00:00 2026]"
+            " GET /?x=1&y=2 => generated 512 bytes in 10 msecs (HTTP/1.1 200)",
+            "[pid: 12|app: 0|req: 2/2] 10.0.0.1 () {34 vars in 512 bytes}"
+            " [Sun Oct 18 10:00:01 2026]"
+            " HEAD /?x=3&y=4 => generated 0 bytes in 5 msecs (HTTP/1.1 200)",
+            "[pid: 12|app: 0|req: 3/3] 10.0.0.1 () {34 vars in 512 bytes}"
+            " [Sun Oct 18 10:00:02 2026]"
+            " GET /metrics => generated 2048 bytes in 1 msecs (HTTP/1.1 200)",
+        ]
+        self.assertEqual(list(replay.read_paths(lines)), ["/?x=1&y=2", "/?x=3&y=4"])
+
+    def test_other_lines_are_skipped(self):
+        lines = [
+            '10.0.0.1 - - [18/Oct/2026:10:00:00 +0200] "POST /?x=1&y=2 HTTP/1.1" 405 100',
+            "*** Starting uWSGI 2.0.21 (64bit) on [Sun Oct 18 10:00:00 2026] ***",
+            "spawned uWSGI worker 1 (pid: 12, cores: 1)",
+            "Traceback (most recent call last):",
+            "x=1 y=2",
+            "unexpected",
+        ]
+        self.assertEqual(list(replay.read_paths(lines)), [])
+
+    def test_dataset_combinations_are_sorted(self):
+        self.assertEqual(
+            replay.dataset_combination("/?x=1&y=2&datasets=gebieden/buurten,bag,gebieden/buurten"),
+            "bag,gebieden/buurten",
+        )
+        self.assertEqual(replay.dataset_combination("/?x=1&y=2"), replay.ALL_DATASETS)
+
+    def test_summaries_per_dataset_combination(self):
+        samples = [
+            load.Sample("bag", 200, 0.01, 10),
+            load.Sample("bag", 200, 0.01, 10),
+            load.Sample("fake", 500, 0.01, 5),
+        ]
+        summaries = replay.summarize_by_combination(samples, 1.0)
+
+        self.assertEqual(list(summaries), [replay.TOTAL, "bag", "fake"])
+        self.assertEqual(summaries[replay.TOTAL]["count"], 3)
+        self.assertEqual(summaries["fake"]["error_rate"], 1.0)
+        self.assertEqual(summaries["bag"]["bytes"], 20)
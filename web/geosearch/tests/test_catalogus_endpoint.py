@@ -5,6 +5,7 @@ import unittest.mock
 import flask
 import pytest
 
+from datapunt_geosearch.datasource import DataSourceBase
 from datapunt_geosearch.registry import registry
 
 
@@ -72,6 +73,48 @@ class CatalogusEndpointTestCase(unittest.TestCase):
             json_response = json.loads(response.data)
             self.assertIn("fake/secret", json_response["datasets"])
 
+    def test_response_has_an_etag_and_is_cached_per_scope_set(self):
+        token = self.create_authz_token(subject="test@amsterdam.nl", scopes=["FAKE/SECRET"])
+        with self.client() as client:
+            public_response = client.get("/catalogus/")
+            with unittest.mock.patch.object(
+                registry, "get_dataset_table_names", wraps=registry.get_dataset_table_names
+            ) as names_mock:
+                self.assertEqual(client.get("/catalogus/").data, public_response.data)
+                names_mock.assert_not_called()
+                secret_response = client.get(
+                    "/catalogus/", headers={"Authorization": f"Bearer {token}"}
+                )
+                names_mock.assert_called_once()
+
+        self.assertTrue(public_response.headers["ETag"])
+        self.assertIn("Authorization", public_response.headers["Vary"])
+        self.assertNotEqual(public_response.headers["ETag"], secret_response.headers["ETag"])
+
+    def test_matching_etag_results_in_not_modified(self):
+        with self.client() as client:
+            etag = client.get("/catalogus/").headers["ETag"]
+            response = client.get("/catalogus/", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+
+            response = client.get("/catalogus/", headers={"If-None-Match": '"outdated"'})
+            self.assertEqual(response.status_code, 200)
+
+    def test_registry_changes_invalidate_the_cache(self):
+        class ExtraDataSource(DataSourceBase):
+            metadata = {"datasets": {"extra": {"extra": []}}}
+
+        with self.client() as client, unittest.mock.patch.multiple(
+            registry, providers=dict(registry.providers), datasets=registry.datasets.copy()
+        ):
+            etag = client.get("/catalogus/").headers["ETag"]
+            registry.register_datasource("DSN_EXTRA", ExtraDataSource)
+            response = client.get("/catalogus/", headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("extra/extra", json.loads(response.data)["datasets"])
+
 
 if __name__ == "__main__":
     unittest.main()
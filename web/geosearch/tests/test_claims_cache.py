@@ -0,0 +1,77 @@
+import json
+import time
+import unittest
+import unittest.mock
+
+import flask
+import pytest
+from flask import current_app as app
+from jwcrypto.jwt import JWT
+from werkzeug.exceptions import Unauthorized
+
+from datapunt_geosearch import authz
+from datapunt_geosearch.claims_cache import ClaimsCache
+
+
+@pytest.mark.usefixtures("create_authz_token")
+class ClaimsCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = ClaimsCache(maxsize=10)
+        patcher = unittest.mock.patch.object(authz, "get_claims_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _authenticate(self, token, keyset=None):
+        config = {"JW_KEYSET": keyset} if keyset is not None else {}
+        with unittest.mock.patch.dict(app.config, config), app.test_request_context(
+            headers={"Authorization": f"Bearer {token}"}
+        ):
+            authz.check_authentication(flask.request)
+            return flask.g.authz_scopes
+
+    def test_verified_claims_are_reused(self):
+        token = self.create_authz_token(subject="test@amsterdam.nl", scopes=["FAKE/SECRET"])
+        with unittest.mock.patch.object(authz, "JWT", wraps=JWT) as jwt_mock:
+            self.assertEqual(self._authenticate(token), {"FAKE/SECRET"})
+            self.assertEqual(self._authenticate(token), {"FAKE/SECRET"})
+
+        self.assertEqual(jwt_mock.call_count, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_entries_expire_with_the_token(self):
+        token = self.create_authz_token(subject="test@amsterdam.nl", scopes=["FAKE/SECRET"])
+        self._authenticate(token)
+        exp = json.loads(JWT(jwt=token, key=authz.get_current_keyset()).claims)["exp"]
+
+        self.assertIsNotNone(self.cache.get(token, authz.get_current_keyset()))
+        self.cache._cache.expire(exp + 1)
+        self.assertIsNone(self.cache.get(token, authz.get_current_keyset()))
+
+    def test_tokens_are_verified_again_when_the_key_is_replaced(self):
+        token = self.create_authz_token(subject="test@amsterdam.nl", scopes=["FAKE/SECRET"])
+        self._authenticate(token)
+
+        rotated = authz.get_keyset(jwks=app.config["JWKS"])
+        with unittest.mock.patch.object(authz, "JWT", wraps=JWT) as jwt_mock:
+            self.assertEqual(self._authenticate(token, keyset=rotated), {"FAKE/SECRET"})
+        self.assertEqual(jwt_mock.call_count, 1)
+
+    def test_tokens_are_rejected_when_the_key_is_revoked(self):
+        token = self.create_authz_token(subject="test@amsterdam.nl", scopes=["FAKE/SECRET"])
+        self._authenticate(token)
+
+        with self.assertRaises(Unauthorized):
+            self._authenticate(token, keyset=authz.get_keyset(jwks=None))
+
+    def test_invalid_tokens_are_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(Unauthorized):
+                self._authenticate("hash")
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_expired_tokens_are_not_cached(self):
+        token = self.create_authz_token(subject="test@amsterdam.nl", scopes=["FAKE/SECRET"])
+        jwt = JWT(jwt=token, key=authz.get_current_keyset())
+        with unittest.mock.patch("time.time", return_value=time.time() + 3600):
+            self.cache.set(token, jwt, authz.get_current_keyset(), {"scopes": set()})
+        self.assertEqual(self.cache.stats()["entries"], 0)
@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+import unittest
+import unittest.mock
+
+import pytest
+from flask import current_app as app
+
+from datapunt_geosearch.blueprints import engine
+from datapunt_geosearch.datasource import DataSourceBase
+from datapunt_geosearch.registry import registry
+
+
+class SlowDataSource(DataSourceBase):
+    metadata = {"datasets": {"slow": {"slow": "public.slow"}}}
+
+
+class FastDataSource(DataSourceBase):
+    metadata = {"datasets": {"fast": {"fast": "public.fast"}}}
+
+
+class ConcurrentFetchTestCase(unittest.TestCase):
+    def test_features_are_streamed_as_datasources_complete(self):
+        def fake_fetch_data(sourceClass, request_args, datasets, connection=None):
+            if sourceClass is SlowDataSource:
+                time.sleep(0.2)
+            return [{"properties": {"type": sourceClass.__name__}}]
+
+        with unittest.mock.patch.object(engine, "fetch_data", side_effect=fake_fetch_data):
+            results = list(
+                engine.fetch_data_concurrent(
+                    [SlowDataSource, FastDataSource], {}, ["slow", "fast"]
+                )
+            )
+
+        self.assertEqual(
+            [
+                (sourceClass, features[0]["properties"]["type"])
+                for sourceClass, features in results
+            ],
+            [(FastDataSource, "FastDataSource"), (SlowDataSource, "SlowDataSource")],
+        )
+
+    def test_datasources_are_queried_in_worker_threads(self):
+        threads = set()
+
+        def fake_fetch_data(sourceClass, request_args, datasets, connection=None):
+            threads.add(threading.current_thread().name)
+            return []
+
+        with unittest.mock.patch.object(engine, "fetch_data", side_effect=fake_fetch_data):
+            list(engine.fetch_data_concurrent([SlowDataSource, FastDataSource], {}, []))
+
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith("geosearch-query") for name in threads))
+
+
+@pytest.mark.usefixtures("dataservices_db", "dataservices_fake_data", "role_configuration")
+class ConcurrentQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        # Force registry to reload dataservices datasources
+        registry._datasets_initialized = None
+        app.config["QUERY_MODE"] = "concurrent"
+
+    def tearDown(self):
+        app.config["QUERY_MODE"] = "sequential"
+
+    def _search(self, query):
+        with app.test_client() as client:
+            response = client.get(query)
+            return json.loads(response.data)
+
+    def test_concurrent_query_returns_same_features_as_sequential_queries(self):
+        query = "/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag&_fields=volgnummer"
+        concurrent_response = self._search(query)
+        app.config["QUERY_MODE"] = "sequential"
+        sequential_response = self._search(query)
+
+        self.assertEqual(concurrent_response["type"], "FeatureCollection")
+        self.assertEqual(len(concurrent_response["features"]), 7)
+        self.assertCountEqual(concurrent_response["features"], sequential_response["features"])
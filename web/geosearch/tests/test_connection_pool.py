@@ -0,0 +1,123 @@
+import unittest
+
+import psycopg2.extensions
+import pytest
+from flask import current_app as app
+from flask import g
+
+from datapunt_geosearch import db
+
+
+@pytest.mark.usefixtures("dataservices_db")
+class ConnectionPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = db.ConnectionPool(
+            app.config["DSN_DATASERVICES_DATASETS"], min_size=1, max_size=2, timeout=0.1
+        )
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_connections_are_reused(self):
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(self.pool.stats()["opened"], 1)
+        self.assertEqual(self.pool.stats()["checkouts"], 2)
+
+    def test_checkout_times_out_when_pool_is_exhausted(self):
+        with self.pool.connection(), self.pool.connection():
+            with self.assertRaises(db.PoolTimeout):
+                self.pool.getconn()
+
+        stats = self.pool.stats()
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["in_use"], 0)
+        self.assertEqual(stats["size"], 2)
+
+    def test_broken_connection_is_repaired_on_checkout(self):
+        with self.pool.connection() as connection:
+            connection._conn.close()
+
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                self.assertEqual(cursor.fetchone()[0], 1)
+
+        self.assertEqual(self.pool.stats()["closed"], 1)
+
+    def test_expired_connection_is_replaced(self):
+        self.pool.max_lifetime = 0
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            pass
+
+        self.assertIsNot(first, second)
+        self.assertEqual(self.pool.stats()["opened"], 2)
+
+    def test_idle_connections_beyond_min_size_are_reaped(self):
+        self.pool.max_idle = 0
+        with self.pool.connection(), self.pool.connection():
+            pass
+        self.assertEqual(self.pool.stats()["size"], 2)
+
+        with self.pool.connection():
+            pass
+        self.assertEqual(self.pool.stats()["size"], 1)
+
+    def test_open_transaction_is_rolled_back_on_return(self):
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("BEGIN; SELECT 1")
+
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT now() = statement_timestamp()")
+                self.assertTrue(cursor.fetchone()[0])
+
+    def test_ping_repairs_a_broken_connection(self):
+        with self.pool.connection() as connection:
+            connection._conn.close()
+
+        self.assertTrue(self.pool.ping())
+        self.assertEqual(self.pool.stats()["idle"], 1)
+
+    def test_ping_fails_when_the_database_can_not_be_reached(self):
+        pool = db.ConnectionPool("host=localhost port=1 dbname=none connect_timeout=1")
+        self.assertFalse(pool.ping())
+        self.assertEqual(pool.stats()["size"], 0)
+
+    def test_fill_opens_min_size_connections(self):
+        self.pool.min_size = 2
+        self.pool.fill()
+        self.assertEqual(self.pool.stats()["idle"], 2)
+
+
+@pytest.mark.usefixtures("dataservices_db")
+class RequestConnectionTestCase(unittest.TestCase):
+    def test_request_keeps_its_connection_until_released(self):
+        dsn = app.config["DSN_DATASERVICES_DATASETS"]
+        db.release_connections()
+
+        connection = db.dbconnection(dsn)
+        self.assertIs(db.dbconnection(dsn), connection)
+        self.assertEqual(db.get_pool(dsn).stats()["in_use"], 1)
+
+        db.release_connections()
+        self.assertNotIn("_db_connections", g)
+        self.assertEqual(db.get_pool(dsn).stats()["in_use"], 0)
+
+    def test_pool_stats_do_not_contain_credentials(self):
+        dsn = app.config["DSN_DATASERVICES_DATASETS"]
+        db.dbconnection(dsn)
+        db.release_connections()
+
+        password = psycopg2.extensions.parse_dsn(dsn).get("password")
+        stats = db.pool_stats()
+        self.assertTrue(stats)
+        for name in stats:
+            self.assertNotIn(f":{password}@", name)
@@ -0,0 +1,78 @@
+import json
+import unittest
+import unittest.mock
+
+import pytest
+from flask import current_app as app
+
+from datapunt_geosearch.datasource import DataSourceBase
+from datapunt_geosearch.registry import registry
+
+
+class OutputColumnsTestCase(unittest.TestCase):
+    def test_output_columns_are_the_columns_of_the_fields(self):
+        datasource = DataSourceBase(connection=unittest.mock.MagicMock())
+        datasource.meta = {"columns": ["display", "type", "uri", "id", "begin_geldigheid"]}
+        datasource.dataset_field_names = ["volgnummer", "id", "begin_geldigheid"]
+        datasource.field_names_in_query = ["volgnummer", "id", "begin_geldigheid"]
+
+        self.assertEqual(
+            datasource.get_output_columns(),
+            ["display", "type", "uri", "id", "begin_geldigheid", "volgnummer", "distance"],
+        )
+
+    def test_output_columns_are_unknown_without_columns(self):
+        datasource = DataSourceBase(connection=unittest.mock.MagicMock())
+        self.assertIsNone(datasource.get_output_columns())
+
+
+@pytest.mark.usefixtures("dataservices_db", "dataservices_fake_data", "role_configuration")
+class DatabaseJsonTestCase(unittest.TestCase):
+    def setUp(self):
+        # Force registry to reload dataservices datasources
+        registry._datasets_initialized = None
+        app.config["DATABASE_JSON"] = True
+
+    def tearDown(self):
+        app.config["DATABASE_JSON"] = False
+        app.config["QUERY_MODE"] = "sequential"
+
+    def _search(self, query):
+        with app.test_client() as client:
+            response = client.get(query)
+            return json.loads(response.data)
+
+    def _assert_same_features(self, query):
+        database_response = self._search(query)
+        app.config["DATABASE_JSON"] = False
+        python_response = self._search(query)
+        app.config["DATABASE_JSON"] = True
+
+        self.assertEqual(len(database_response["features"]), 7)
+        self.assertCountEqual(database_response["features"], python_response["features"])
+
+    def test_database_json_returns_same_features(self):
+        self._assert_same_features(
+            "/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag&_fields=volgnummer"
+        )
+
+    def test_database_json_with_extra_fields_that_are_selected_already(self):
+        self._assert_same_features(
+            "/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag&_fields=id,volgnummer"
+        )
+
+    def test_database_json_with_union_query(self):
+        app.config["QUERY_MODE"] = "union"
+        self._assert_same_features("/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag")
+
+    def test_features_are_not_built_in_python(self):
+        with unittest.mock.patch.object(
+            DataSourceBase, "build_features"
+        ) as build_features_mock, unittest.mock.patch.object(
+            DataSourceBase, "build_feature"
+        ) as build_feature_mock:
+            response = self._search("/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag")
+
+        self.assertEqual(len(response["features"]), 7)
+        build_features_mock.assert_not_called()
+        build_feature_mock.assert_not_called()
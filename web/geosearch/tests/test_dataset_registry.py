@@ -1,10 +1,31 @@
+import threading
 import time
 import unittest
 import unittest.mock
 
-from datapunt_geosearch import datasource
+from datapunt_geosearch import datasource, registry
 from datapunt_geosearch.datasource import DataSourceBase
 from datapunt_geosearch.registry import DatasetRegistry
+from tests.conftest import FAKE_SCHEMA
+
+
+def dataservices_row(name, dataset_name="test_dataset", schema_data=None, **kwargs):
+    row = dict(
+        schema=None,
+        table_name=f"{dataset_name}_{name}",
+        name=name,
+        name_field="description",
+        geometry_field="geometry",
+        geometry_type="Point",
+        id_field="id",
+        dataset_name=dataset_name,
+        dataset_path=f"test_schema/{dataset_name}",
+        schema_data=schema_data,
+        dataset_authorization=None,
+        datasettable_authorization=None,
+    )
+    row.update(kwargs)
+    return row
 
 
 class TestDatasetRegistry(unittest.TestCase):
@@ -164,6 +185,31 @@ class TestDatasetRegistry(unittest.TestCase):
             {TestDataSource},
         )
 
+    def test_filter_datasources_by_dataset_and_table_names(self):
+        class PublicDataSource(DataSourceBase):
+            metadata = {"datasets": {"magic": {"test1": []}}, "scopes": {"OPENBAAR"}}
+
+        class SecretDataSource(DataSourceBase):
+            metadata = {"datasets": {"secret": {"test2": []}}, "scopes": {"TEST/WRITE"}}
+
+        test_registry = DatasetRegistry()
+        test_registry._datasets_initialized = time.time()
+        test_registry.register_datasource("DSN_TEST_DATASET", PublicDataSource)
+        test_registry.register_datasource("DSN_TEST_DATASET", SecretDataSource)
+
+        with unittest.mock.patch.object(DataSourceBase, "check_scopes") as check_scopes_mock:
+            self.assertEqual(
+                test_registry.filter_datasources(
+                    names=["magic", "magic/test1", "secret/test2", "unknown"]
+                ),
+                {PublicDataSource},
+            )
+            self.assertEqual(
+                test_registry.filter_datasources(names=["secret"], scopes=["TEST/WRITE"]),
+                {SecretDataSource},
+            )
+        check_scopes_mock.assert_not_called()
+
     def test_init_dataservices_dataset(self):
         with unittest.mock.patch(
             "datapunt_geosearch.db._DBConnection.fetch_all"
@@ -289,5 +335,123 @@ class TestDatasetRegistry(unittest.TestCase):
         self.assertEqual(result.metadata["field_mapping"], dict(id="test"))
 
 
+class TestIncrementalRefresh(unittest.TestCase):
+    def _refresh(self, test_registry, rows):
+        with unittest.mock.patch(
+            "datapunt_geosearch.db._DBConnection.fetch_all", return_value=rows
+        ):
+            return test_registry.init_dataservices_datasets()
+
+    def test_unchanged_datasets_are_reused(self):
+        test_registry = DatasetRegistry()
+        first = self._refresh(test_registry, [dataservices_row("one"), dataservices_row("two")])
+        second = self._refresh(test_registry, [dataservices_row("two"), dataservices_row("one")])
+
+        self.assertEqual(first, second)
+        self.assertEqual(test_registry.refresh_stats, {"reused": 1, "rebuilt": 0, "removed": 0})
+
+    def test_changed_datasets_are_rebuilt(self):
+        test_registry = DatasetRegistry()
+        first = self._refresh(
+            test_registry, [dataservices_row("one"), dataservices_row("one", "other_dataset")]
+        )
+        rows = [
+            dataservices_row("one", datasettable_authorization="TEST"),
+            dataservices_row("one", "other_dataset"),
+        ]
+        second = self._refresh(test_registry, rows)
+
+        self.assertIsNot(first["test_dataset/one"], second["test_dataset/one"])
+        self.assertEqual(second["test_dataset/one"].metadata["scopes"], {"TEST"})
+        self.assertIs(first["other_dataset/one"], second["other_dataset/one"])
+        self.assertEqual(test_registry.refresh_stats, {"reused": 1, "rebuilt": 1, "removed": 0})
+        self.assertEqual(
+            test_registry.datasets["DSN_DATASERVICES_DATASETS"],
+            [second["test_dataset/one"], second["other_dataset/one"]],
+        )
+
+    def test_removed_datasets_are_unregistered(self):
+        class StaticDataSource(DataSourceBase):
+            metadata = {"datasets": {"static": {"static": []}}}
+
+        test_registry = DatasetRegistry()
+        test_registry.register_datasource("DSN_STATIC", StaticDataSource)
+        self._refresh(
+            test_registry, [dataservices_row("one"), dataservices_row("one", "other_dataset")]
+        )
+        self._refresh(test_registry, [dataservices_row("one", "other_dataset")])
+
+        self.assertEqual(
+            set(test_registry.providers),
+            {"static", "static/static", "other_dataset", "other_dataset/one"},
+        )
+        self.assertEqual(len(test_registry.datasets["DSN_DATASERVICES_DATASETS"]), 1)
+        self.assertEqual(test_registry.refresh_stats, {"reused": 1, "rebuilt": 0, "removed": 1})
+
+    def test_schema_is_parsed_once_per_dataset(self):
+        test_registry = DatasetRegistry()
+        rows = [
+            dataservices_row(name, "fake", schema_data=FAKE_SCHEMA)
+            for name in ("public", "secret")
+        ]
+        with unittest.mock.patch(
+            "datapunt_geosearch.registry.DatasetSchema.from_dict",
+            wraps=registry.DatasetSchema.from_dict,
+        ) as from_dict_mock:
+            datasets = self._refresh(test_registry, rows)
+            rows[1]["datasettable_authorization"] = "FAKE/SECRET"
+            self._refresh(test_registry, rows)
+
+        self.assertEqual(set(datasets), {"fake/public", "fake/secret"})
+        self.assertEqual(from_dict_mock.call_count, 1)
+
+
+class TestBackgroundRefresh(unittest.TestCase):
+    def setUp(self):
+        self.test_registry = DatasetRegistry()
+        self.test_registry._datasets_initialized = time.time() - 1000
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.refreshes = []
+
+        def fake_refresh():
+            self.refreshes.append(time.time())
+            self.started.set()
+            self.release.wait(5)
+            self.test_registry.providers = {"refreshed": DataSourceBase}
+
+        patcher = unittest.mock.patch.object(
+            self.test_registry, "init_dataservices_datasets", side_effect=fake_refresh
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.release.set)
+
+    def test_expired_datasources_are_served_while_refreshing(self):
+        self.test_registry.providers = {"current": DataSourceBase}
+
+        self.assertEqual(self.test_registry.get_all_datasources(), {"current": DataSourceBase})
+        self.assertTrue(self.test_registry.refreshing)
+
+        self.release.set()
+        self.assertTrue(self.test_registry.refresh(wait=True, timeout=5))
+        self.assertEqual(self.test_registry.get_all_datasources(), {"refreshed": DataSourceBase})
+
+    def test_refresh_triggers_are_coalesced(self):
+        self.test_registry.refresh()
+        self.started.wait(5)
+        for _ in range(3):
+            self.test_registry.get_all_datasources()
+            self.test_registry.refresh()
+
+        self.release.set()
+        self.assertTrue(self.test_registry.refresh(wait=True, timeout=5))
+        self.assertEqual(len(self.refreshes), 2)
+        self.assertFalse(self.test_registry.refreshing)
+
+    def test_waiting_for_a_refresh_times_out(self):
+        self.assertFalse(self.test_registry.refresh(wait=True, timeout=0.05))
+
+
 if __name__ == "__main__":
     unittest.main()
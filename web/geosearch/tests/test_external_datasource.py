@@ -1,3 +1,4 @@
+import threading
 import time
 import unittest
 import unittest.mock
@@ -129,8 +130,10 @@ class TestExternalDataSource(unittest.TestCase):
 
         request_params = dict(x=129569.4, y=479968.42)
 
-        with unittest.mock.patch("requests.get") as requests_mock:
-            response_mock = unittest.mock.MagicMock()
+        with unittest.mock.patch.object(
+            test_datasource.http_client.session, "get"
+        ) as requests_mock:
+            response_mock = unittest.mock.MagicMock(ok=True, status_code=200)
             response_mock.json = lambda: [{"id": "31"}]
             requests_mock.return_value = response_mock
 
@@ -163,7 +166,9 @@ class TestExternalDataSource(unittest.TestCase):
         request_params = dict(x=129569.4, y=479968.42)
 
         with unittest.mock.patch("datapunt_geosearch.datasource._logger") as logger_mock:
-            with unittest.mock.patch("requests.get") as requests_mock:
+            with unittest.mock.patch.object(
+                test_datasource.http_client.session, "get"
+            ) as requests_mock:
                 requests_mock.side_effect = HTTPError("meh.")
 
                 result = test_datasource.fetch_data(
@@ -263,3 +268,26 @@ class TestExternalDataSource(unittest.TestCase):
                 "test/test": test_datasource,
             },
         )
+
+    def test_execute_queries_fetches_the_datasets_concurrently(self):
+        test_datasource = datasource.ExternalDataSource(
+            meta=dict(
+                base_url="http://localhost:8000",
+                datasets=dict(test=dict(one="test/one/", two="test/two/")),
+            )
+        )
+        barrier = threading.Barrier(2, timeout=1)
+
+        def fake_fetch_data(dataset_name, subset_url, request_params=None):
+            # Both datasets have to be fetched at the same time to pass the barrier.
+            barrier.wait()
+            return [{"properties": {"type": dataset_name}}]
+
+        with unittest.mock.patch.object(
+            test_datasource, "fetch_data", side_effect=fake_fetch_data
+        ):
+            result = test_datasource.execute_queries()
+
+        self.assertEqual(
+            [feature["properties"]["type"] for feature in result], ["test/one", "test/two"]
+        )
@@ -1,10 +1,16 @@
 import datetime
 import json
+import threading
+import time
 import unittest
 import unittest.mock
 
+import pytest
 from flask import current_app as app
 
+from datapunt_geosearch import db
+from datapunt_geosearch.blueprints import health as health_blueprint
+from datapunt_geosearch.health_check import CheckResult, HealthCheck
 from datapunt_geosearch.registry import registry
 
 
@@ -22,6 +28,7 @@ class HealthTestCase(unittest.TestCase):
             self.assertEqual(json_response["Datasets initialized"], registry._datasets_initialized)
             self.assertEqual(json_response["Delay"], registry.INITIALIZE_DELAY_SECONDS)
 
+    @pytest.mark.usefixtures("dataservices_db")
     def test_force_refresh(self):
         # Simulate that registry initiation happened 10 seconds ago.
         registry._datasets_initialized = (
@@ -34,3 +41,87 @@ class HealthTestCase(unittest.TestCase):
             self.assertLess(int(json_response["Time since last refresh"]), 5)
             self.assertEqual(json_response["Datasets initialized"], registry._datasets_initialized)
             self.assertEqual(json_response["Delay"], registry.INITIALIZE_DELAY_SECONDS)
+
+
+class HealthCheckTestCase(unittest.TestCase):
+    def setUp(self):
+        self.health_check = HealthCheck(cache_seconds=60, dataset="fake/public")
+        for patcher in (
+            unittest.mock.patch.object(
+                health_blueprint, "get_health_check", return_value=self.health_check
+            ),
+            # The dataset is checked in the tests, not in a background thread
+            unittest.mock.patch.object(self.health_check, "_start"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_liveness_does_not_use_the_database(self):
+        with unittest.mock.patch.object(
+            db, "get_pool"
+        ) as get_pool_mock, app.test_client() as client:
+            response = client.get("/status/live")
+
+        self.assertEqual(response.status_code, 200)
+        get_pool_mock.assert_not_called()
+
+    @pytest.mark.usefixtures("dataservices_db")
+    def test_readiness_pings_once_per_interval(self):
+        with unittest.mock.patch.object(
+            db.ConnectionPool, "ping", return_value=True
+        ) as ping_mock, app.test_client() as client:
+            for path in ("/status/ready", "/status/ready", "/status/health"):
+                response = client.get(path)
+                self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(ping_mock.call_count, 1)
+
+    def test_previous_ping_is_used_while_pinging(self):
+        previous = CheckResult(True, "Connectivity OK", time.time() - 120)
+        self.health_check.ping_result = previous
+        pinging = threading.Event()
+        release = threading.Event()
+
+        def _ping():
+            pinging.set()
+            release.wait(5)
+            return CheckResult(False, "The dataservices database can not be reached", time.time())
+
+        with unittest.mock.patch.object(
+            self.health_check, "_ping", side_effect=_ping
+        ) as ping_mock:
+            thread = threading.Thread(target=self.health_check.ready)
+            thread.start()
+            self.assertTrue(pinging.wait(5))
+            # Not blocked by the ping in flight
+            self.assertIs(self.health_check.ready(), previous)
+            release.set()
+            thread.join(5)
+
+        self.assertEqual(ping_mock.call_count, 1)
+        self.assertFalse(self.health_check.ready().ok)
+
+    @pytest.mark.usefixtures("dataservices_db")
+    def test_not_ready_when_the_database_can_not_be_pinged(self):
+        with unittest.mock.patch.object(
+            db.ConnectionPool, "ping", return_value=False
+        ), app.test_client() as client:
+            response = client.get("/status/ready")
+
+        self.assertEqual(response.status_code, 503)
+
+    @pytest.mark.usefixtures("dataservices_db", "dataservices_fake_data")
+    def test_not_ready_when_the_last_dataset_check_failed(self):
+        registry._datasets_initialized = None
+        self.health_check.point = (123282.6, 487674.8)
+        self.health_check.dataset_result = self.health_check.check_dataset()
+        self.assertTrue(self.health_check.dataset_result.ok)
+        self.assertIsNotNone(self.health_check.last_success)
+
+        self.health_check.dataset = "fake/missing"
+        self.health_check.dataset_result = self.health_check.check_dataset()
+        with app.test_client() as client:
+            response = client.get("/status/ready")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data, b"Dataset fake/missing is not available")
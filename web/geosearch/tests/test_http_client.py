@@ -0,0 +1,166 @@
+import threading
+import unittest
+import unittest.mock
+
+import requests
+
+from datapunt_geosearch import http_client
+from datapunt_geosearch.datasource import ExternalDataSource
+
+
+def response(status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+class HttpClientTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = unittest.mock.patch.object(http_client, "http_clients", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_datasources_share_the_client_of_their_base_url(self):
+        meta = dict(base_url="http://localhost:8000/", datasets={})
+        first = ExternalDataSource(meta=meta)
+        second = ExternalDataSource(meta=dict(meta))
+        other = ExternalDataSource(meta=dict(meta, base_url="http://localhost:8001/"))
+
+        self.assertIs(first.http_client, second.http_client)
+        self.assertIsNot(first.http_client, other.http_client)
+        self.assertEqual(
+            set(http_client.http_stats()), {"http://localhost:8000/", "http://localhost:8001/"}
+        )
+
+    def test_requests_and_errors_are_counted(self):
+        client = http_client.get_http_client("http://localhost:8000/")
+        with unittest.mock.patch.object(
+            client.session,
+            "get",
+            side_effect=[response(), response(503), requests.exceptions.ConnectTimeout()],
+        ) as get_mock:
+            client.get("http://localhost:8000/a", params={"x": 1})
+            client.get("http://localhost:8000/b")
+            with self.assertRaises(requests.exceptions.ConnectTimeout):
+                client.get("http://localhost:8000/c")
+
+        get_mock.assert_any_call("http://localhost:8000/a", params={"x": 1}, timeout=1)
+        stats = client.stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["errors"], 2)
+        self.assertEqual(stats["busy"], 0)
+        self.assertIsNotNone(stats["latency_ms_avg"])
+
+    def test_concurrent_requests_are_limited_per_base_url(self):
+        client = http_client.get_http_client(
+            "http://localhost:8000/", max_connections=1, timeout=0.05
+        )
+        started, release = threading.Event(), threading.Event()
+
+        def slow_get(url, params=None, timeout=None):
+            started.set()
+            release.wait(1)
+            return response()
+
+        with unittest.mock.patch.object(client.session, "get", side_effect=slow_get):
+            thread = threading.Thread(target=client.get, args=("http://localhost:8000/a",))
+            thread.start()
+            started.wait(1)
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                client.get("http://localhost:8000/b")
+            release.set()
+            thread.join()
+
+        stats = client.stats()
+        self.assertEqual(stats["requests"], 1)
+        self.assertEqual(stats["busy"], 1)
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = http_client.HttpClient(
+            "http://localhost:8000/", max_failures=2, reset_timeout=60
+        )
+        patcher = unittest.mock.patch.object(self.client.session, "get")
+        self.get_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fail(self, times):
+        self.get_mock.side_effect = requests.exceptions.ConnectTimeout()
+        for _ in range(times):
+            with self.assertRaises(requests.exceptions.ConnectTimeout):
+                self.client.get("http://localhost:8000/a")
+
+    def _expire_reset_timeout(self):
+        self.client._opened_at -= 61
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        self._fail(1)
+        self.get_mock.side_effect = [response(), response(500)]
+        self.client.get("http://localhost:8000/a")
+        self.client.get("http://localhost:8000/a")
+        self.assertEqual(self.client.state, http_client.CIRCUIT_CLOSED)
+
+        self._fail(1)
+        self.assertEqual(self.client.state, http_client.CIRCUIT_OPEN)
+        self.get_mock.reset_mock()
+        with self.assertRaises(http_client.CircuitOpenError):
+            self.client.get("http://localhost:8000/a")
+        self.get_mock.assert_not_called()
+        self.assertEqual(self.client.stats()["rejected"], 1)
+
+    def test_a_successful_probe_closes_the_circuit(self):
+        self._fail(2)
+        self._expire_reset_timeout()
+        self.assertEqual(self.client.state, http_client.CIRCUIT_HALF_OPEN)
+
+        self.get_mock.side_effect = [response()]
+        self.client.get("http://localhost:8000/a")
+        self.assertEqual(self.client.state, http_client.CIRCUIT_CLOSED)
+
+    def test_a_failed_probe_opens_the_circuit_again(self):
+        self._fail(2)
+        self._expire_reset_timeout()
+        self._fail(1)
+        self.assertEqual(self.client.state, http_client.CIRCUIT_OPEN)
+        with self.assertRaises(http_client.CircuitOpenError):
+            self.client.get("http://localhost:8000/a")
+
+    def test_external_datasource_returns_no_results_while_the_circuit_is_open(self):
+        self._fail(2)
+        test_datasource = ExternalDataSource(
+            meta=dict(base_url="http://localhost:8000/", datasets={})
+        )
+        test_datasource.http_client = self.client
+        self.get_mock.reset_mock()
+
+        result = test_datasource.fetch_data("test/test", "test/search", dict(x=1, y=2))
+
+        self.assertEqual(result, [])
+        self.get_mock.assert_not_called()
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def test_json_responses_are_cached(self):
+        client = http_client.HttpClient("http://localhost:8000/", cache_ttl=60)
+        ok = unittest.mock.MagicMock(ok=True, status_code=200)
+        ok.json.return_value = [{"id": "31"}]
+        with unittest.mock.patch.object(client.session, "get", return_value=ok) as get_mock:
+            first = client.get_json("http://localhost:8000/a", params={"x": 1, "y": 2})
+            second = client.get_json("http://localhost:8000/a", params={"y": 2, "x": 1})
+            client.get_json("http://localhost:8000/a", params={"x": 1, "y": 3})
+
+        self.assertEqual(first, [{"id": "31"}])
+        self.assertIs(second, first)
+        self.assertEqual(get_mock.call_count, 2)
+        self.assertEqual(client.stats()["cache_hits"], 1)
+
+    def test_failed_responses_are_not_cached(self):
+        client = http_client.HttpClient("http://localhost:8000/", cache_ttl=60)
+        failed = unittest.mock.MagicMock(ok=False, status_code=503)
+        failed.json.return_value = {"detail": "unavailable"}
+        with unittest.mock.patch.object(client.session, "get", return_value=failed) as get_mock:
+            client.get_json("http://localhost:8000/a")
+            client.get_json("http://localhost:8000/a")
+
+        self.assertEqual(get_mock.call_count, 2)
@@ -0,0 +1,118 @@
+import json
+import time
+import unittest
+import unittest.mock
+
+import flask
+import requests
+from flask import current_app as app
+from jwcrypto.jwk import JWK
+from jwcrypto.jwt import JWT
+
+from datapunt_geosearch import authz
+
+JWKS_URL = "https://iam.example.com/certs"
+
+
+def make_jwks(*keys):
+    return json.dumps({"keys": [json.loads(key.export_public()) for key in keys]})
+
+
+def make_token(key):
+    now = int(time.time())
+    token = JWT(
+        header={"alg": "ES256", "kid": key.get("kid")},
+        claims={"exp": now + 600, "realm_access": {"roles": ["fake_secret"]}, "sub": "test"},
+    )
+    token.make_signed_token(key)
+    return token.serialize()
+
+
+class KeysetManagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.old_key = JWK.generate(kty="EC", crv="P-256", kid="old")
+        self.new_key = JWK.generate(kty="EC", crv="P-256", kid="new")
+        self.jwks = make_jwks(self.old_key)
+        patcher = unittest.mock.patch.object(authz.requests, "get", side_effect=self._get)
+        self.get_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get(self, url, timeout=None):
+        if isinstance(self.jwks, Exception):
+            raise self.jwks
+        return unittest.mock.Mock(text=self.jwks)
+
+    def test_keys_are_loaded_in_the_background(self):
+        manager = authz.KeysetManager(jwks_url=JWKS_URL)
+        self.get_mock.assert_not_called()
+        self.assertEqual(len(manager.keyset["keys"]), 0)
+
+        for _ in range(100):
+            if manager.reloads:
+                break
+            time.sleep(0.01)
+        self.assertIsNotNone(manager.keyset.get_key("old"))
+        self.get_mock.assert_called_once_with(JWKS_URL, timeout=5)
+
+    def test_keys_loaded_before_the_fork_are_not_loaded_again(self):
+        manager = authz.KeysetManager(jwks_url=JWKS_URL, refresh_interval=3600)
+        manager.reload()
+        manager.loaded_at -= 600
+
+        # Run the worker of the background thread until its first sleep
+        with unittest.mock.patch.object(
+            authz.time, "sleep", side_effect=InterruptedError
+        ) as sleep_mock, self.assertRaises(InterruptedError):
+            manager._reload_worker()
+
+        self.assertEqual(self.get_mock.call_count, 1)
+        self.assertEqual(manager.reloads, 1)
+        (interval,), _kwargs = sleep_mock.call_args
+        self.assertAlmostEqual(interval, 3000, delta=5)
+
+    def test_keys_are_kept_when_loading_fails(self):
+        manager = authz.KeysetManager(jwks_url=JWKS_URL)
+        self.assertTrue(manager.reload())
+        key = manager._keyset.get_key("old")
+
+        self.jwks = requests.exceptions.ConnectTimeout("slow")
+        self.assertFalse(manager.reload())
+        self.assertIs(manager._keyset.get_key("old"), key)
+        self.assertIn("slow", manager.stats()["last_error"])
+
+    def test_unchanged_keys_are_reused(self):
+        manager = authz.KeysetManager(jwks_url=JWKS_URL)
+        manager.reload()
+        key = manager._keyset.get_key("old")
+
+        self.jwks = make_jwks(self.old_key, self.new_key)
+        manager.reload()
+        self.assertIs(manager._keyset.get_key("old"), key)
+        self.assertIsNotNone(manager._keyset.get_key("new"))
+
+    def test_unknown_keys_reload_at_most_once_per_interval(self):
+        manager = authz.KeysetManager(jwks_url=JWKS_URL, min_reload_interval=60)
+        manager.reload()
+        self.jwks = make_jwks(self.old_key, self.new_key)
+
+        self.assertFalse(manager.reload_missing_key("new"))
+        self.assertEqual(self.get_mock.call_count, 1)
+
+        manager._reloaded_at -= 60
+        self.assertTrue(manager.reload_missing_key("new"))
+        self.assertTrue(manager.reload_missing_key("new"))
+        self.assertEqual(self.get_mock.call_count, 2)
+
+    def test_tokens_of_a_rotated_key_are_accepted(self):
+        manager = authz.KeysetManager(jwks_url=JWKS_URL, min_reload_interval=0)
+        manager.reload()
+        self.jwks = make_jwks(self.new_key)
+        token = make_token(self.new_key)
+
+        # Without a background thread, which would keep reloading after the test.
+        with unittest.mock.patch.object(manager, "_reload_worker"), unittest.mock.patch.dict(
+            app.config, {"JW_KEYSET": manager, "JWT_CLAIMS_CACHE_SIZE": 0}
+        ), app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+            authz.check_authentication(flask.request)
+            self.assertEqual(flask.g.authz_scopes, {"FAKE/SECRET"})
+        self.assertIsNone(manager._keyset.get_key("old"))
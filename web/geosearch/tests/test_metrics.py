@@ -0,0 +1,142 @@
+import json
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import pytest
+from flask import current_app as app
+
+from datapunt_geosearch import metrics
+from datapunt_geosearch.registry import registry
+
+
+class PrometheusFormatTestCase(unittest.TestCase):
+    def test_metric_names_get_the_unit_as_suffix(self):
+        self.assertEqual(
+            metrics._prometheus_name("geosearch.query.fetch.duration", "s"),
+            "geosearch_query_fetch_duration_seconds",
+        )
+        self.assertEqual(
+            metrics._prometheus_name("geosearch.streamed", "By", suffix="total"),
+            "geosearch_streamed_bytes_total",
+        )
+        self.assertEqual(
+            metrics._prometheus_name("geosearch.query.rows", "{row}"), "geosearch_query_rows"
+        )
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(
+            metrics._prometheus_labels({"dataset": 'a"b\\c'}, le=0.5),
+            '{dataset="a\\"b\\\\c",le="0.5"}',
+        )
+
+
+def histogram(count, attributes=None):
+    return {
+        "name": "geosearch.query.rows",
+        "unit": "{row}",
+        "description": "Rows",
+        "kind": "histogram",
+        "points": [
+            {
+                "attributes": attributes or {"dataset": "fake"},
+                "bounds": [0, 1],
+                "bucket_counts": [0, count, 0],
+                "sum": count,
+                "count": count,
+            }
+        ],
+    }
+
+
+class MetricsDirTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        patcher = unittest.mock.patch.object(metrics, "_metrics_dir", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_metrics_of_processes_are_summed(self):
+        merged = metrics._merge(
+            [[histogram(1)], [histogram(2)], [histogram(5, {"dataset": "other"})]]
+        )
+
+        self.assertEqual(len(merged), 1)
+        points = {point["attributes"]["dataset"]: point for point in merged[0]["points"]}
+        self.assertEqual(points["fake"]["bucket_counts"], [0, 3, 0])
+        self.assertEqual((points["fake"]["sum"], points["fake"]["count"]), (3, 3))
+        self.assertEqual(points["other"]["count"], 5)
+
+    def test_metrics_of_other_processes_are_served(self):
+        with open(os.path.join(self.directory, "stale.json"), "w") as f:
+            f.write("[]")
+        metrics.setup_metrics_dir(self.directory)
+        self.assertEqual(os.listdir(self.directory), [])
+
+        with open(os.path.join(self.directory, "1.json"), "w") as f:
+            json.dump([histogram(4, {"dataset": "other/process"})], f)
+        text = metrics.render_prometheus()
+
+        self.assertIn('geosearch_query_rows_count{dataset="other/process"} 4', text)
+        self.assertIn(metrics._process_file_name(), os.listdir(self.directory))
+
+    def test_metrics_of_a_previous_process_with_the_same_pid_are_kept(self):
+        metrics.setup_metrics_dir(self.directory)
+        previous = os.path.join(self.directory, f"{os.getpid()}-1.json")
+        with open(previous, "w") as f:
+            json.dump([histogram(4, {"dataset": "previous/process"})], f)
+
+        text = metrics.render_prometheus()
+
+        self.assertTrue(os.path.exists(previous))
+        self.assertNotEqual(metrics._process_file_name(), os.path.basename(previous))
+        self.assertIn('geosearch_query_rows_count{dataset="previous/process"} 4', text)
+
+
+@pytest.mark.usefixtures("dataservices_db", "dataservices_fake_data", "role_configuration")
+class MetricsEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        # Force registry to reload dataservices datasources
+        registry._datasets_initialized = None
+
+    def _sample(self, text, name, **labels):
+        """Return the value of a sample with (at least) `labels`."""
+        for line in text.splitlines():
+            if line.startswith(f"{name}{{") and all(
+                f'{key}="{value}"' in line for key, value in labels.items()
+            ):
+                return float(line.rsplit(" ", 1)[1])
+        return None
+
+    def test_query_metrics_are_served_by_dataset_and_dsn(self):
+        labels = dict(dataset="fake/public", dsn="DSN_DATASERVICES_DATASETS")
+        with app.test_client() as client:
+            before = client.get("/status/metrics").get_data(as_text=True)
+            client.get("/?x=123282.6&y=487684.8&radius=20&datasets=fake").get_data()
+            response = client.get("/status/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain; version=0.0.4"))
+        text = response.get_data(as_text=True)
+        self.assertIn("# TYPE geosearch_query_execution_duration_seconds histogram", text)
+        self.assertIn("# TYPE geosearch_streamed_bytes_total counter", text)
+
+        count = self._sample(text, "geosearch_query_fetch_duration_seconds_count", **labels)
+        previous = self._sample(before, "geosearch_query_fetch_duration_seconds_count", **labels)
+        self.assertEqual(count, (previous or 0) + 1)
+        self.assertGreater(self._sample(text, "geosearch_query_rows_sum", **labels), 0)
+        self.assertIsNotNone(
+            self._sample(text, "geosearch_query_rows_bucket", le="+Inf", **labels)
+        )
+        self.assertGreater(
+            self._sample(
+                text, "geosearch_streamed_bytes_total", dataset="fake/public", dsn=labels["dsn"]
+            ),
+            0,
+        )
+        self.assertIsNotNone(
+            self._sample(text, "geosearch_serialization_duration_seconds_count", **labels)
+        )
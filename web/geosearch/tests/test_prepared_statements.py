@@ -0,0 +1,108 @@
+import json
+import unittest
+
+import pytest
+from flask import current_app as app
+
+from datapunt_geosearch import db
+from datapunt_geosearch.registry import registry
+from datapunt_geosearch.statements import statement_cache, to_prepared_statement
+
+
+class ToPreparedStatementTestCase(unittest.TestCase):
+    def test_named_placeholders_become_numbered_parameters(self):
+        statement = to_prepared_statement(
+            "SELECT ST_DWithin(g, ST_MakePoint(%(x)s, %(y)s), %(radius)s) AND %(x)s > 0"
+        )
+
+        self.assertEqual(
+            statement.text, "SELECT ST_DWithin(g, ST_MakePoint($1, $2), $3) AND $1 > 0"
+        )
+        self.assertEqual(statement.parameters, ("x", "y", "radius"))
+
+    def test_statement_name_depends_on_text(self):
+        first = to_prepared_statement("SELECT %(x)s")
+        second = to_prepared_statement("SELECT %(y)s + 1")
+
+        self.assertEqual(first.name, to_prepared_statement("SELECT %(x)s").name)
+        self.assertNotEqual(first.name, second.name)
+
+
+@pytest.mark.usefixtures("dataservices_db", "dataservices_fake_data", "role_configuration")
+class PreparedStatementsTestCase(unittest.TestCase):
+    def setUp(self):
+        # Force registry to reload dataservices datasources
+        registry._datasets_initialized = None
+        statement_cache.clear()
+        app.config["PREPARED_STATEMENTS"] = True
+
+    def tearDown(self):
+        app.config["PREPARED_STATEMENTS"] = False
+
+    def _search(self, query):
+        with app.test_client() as client:
+            response = client.get(query)
+            return json.loads(response.data)
+
+    def _prepared_statement_names(self):
+        connection = db.dbconnection(app.config["DSN_DATASERVICES_DATASETS"], set_user_role=True)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM pg_prepared_statements")
+            names = {row[0] for row in cursor.fetchall()}
+        db.release_connections()
+        return names
+
+    def test_prepared_statements_return_same_features(self):
+        query = "/?x=123282.6&y=487684.8&radius=20&limit=3&datasets=fake,bag&_fields=volgnummer"
+        prepared_response = self._search(query)
+        app.config["PREPARED_STATEMENTS"] = False
+        regular_response = self._search(query)
+
+        self.assertEqual(len(prepared_response["features"]), 4)
+        self.assertCountEqual(prepared_response["features"], regular_response["features"])
+
+    def test_statements_are_prepared_once_per_connection(self):
+        self._search("/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag")
+        names = self._prepared_statement_names()
+        self.assertEqual(len(names), 2)
+
+        response = self._search("/?x=123282.6&y=487674.8&radius=1&datasets=fake,bag")
+        self.assertEqual(len(response["features"]), 1)
+        self.assertEqual(self._prepared_statement_names(), names)
+
+    def test_registry_refresh_keeps_statements_of_unchanged_datasets(self):
+        self._search("/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag")
+        self.assertEqual(len(statement_cache), 2)
+        names = statement_cache.names()
+
+        registry._datasets_initialized = None
+        registry.init_datasets()
+
+        self.assertEqual(statement_cache.names(), names)
+
+    def test_registry_refresh_removes_statements_of_changed_datasets(self):
+        self._search("/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag")
+        self.assertEqual(len(statement_cache), 2)
+        evictions = statement_cache.evictions
+
+        _fingerprint, classes = registry._dataservices_datasets["fake"]
+        registry._dataservices_datasets["fake"] = ("changed", classes)
+        registry._datasets_initialized = None
+        registry.init_datasets()
+
+        self.assertEqual(len(statement_cache), 1)
+        self.assertEqual(statement_cache.evictions, evictions + 1)
+
+        response = self._search("/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag")
+        self.assertEqual(len(response["features"]), 7)
+        self.assertEqual(self._prepared_statement_names(), statement_cache.names())
+
+    def test_evicted_statements_are_deallocated(self):
+        maxsize, statement_cache.maxsize = statement_cache.maxsize, 1
+        self.addCleanup(setattr, statement_cache, "maxsize", maxsize)
+
+        response = self._search("/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag")
+
+        self.assertEqual(len(response["features"]), 7)
+        self.assertEqual(len(statement_cache), 1)
+        self.assertEqual(self._prepared_statement_names(), statement_cache.names())
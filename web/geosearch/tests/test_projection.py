@@ -0,0 +1,38 @@
+import unittest
+import unittest.mock
+
+from datapunt_geosearch.datasource import DataSourceBase, compile_projection
+
+
+class ProjectionTestCase(unittest.TestCase):
+    columns = ("display", "type", "geometrie", "id", "volgnummer", "distance")
+    row = ("Buurt", "gebieden/buurten", "0101", "1", 2, 3.5)
+
+    def setUp(self):
+        self.datasource = DataSourceBase(connection=unittest.mock.MagicMock())
+        self.datasource.dataset_field_names = ["volgnummer"]
+
+    def test_features_have_the_same_properties_as_build_feature(self):
+        self.datasource.field_names_in_query = ["volgnummer", "unknown"]
+        self.assertEqual(
+            self.datasource.build_features([self.row], self.columns),
+            [self.datasource.build_feature(dict(zip(self.columns, self.row)))],
+        )
+
+    def test_plan_is_compiled_once_per_field_selection(self):
+        compile_projection.cache_clear()
+        self.datasource.build_features([self.row], self.columns)
+        self.datasource.build_features([self.row, self.row], self.columns)
+        self.datasource.field_names_in_query = ["volgnummer"]
+        self.datasource.build_features([self.row], self.columns)
+
+        self.assertEqual(compile_projection.cache_info().misses, 2)
+
+    def test_single_property(self):
+        self.assertEqual(
+            self.datasource.build_features([("1",), ("2",)], ("id",)),
+            [{"properties": {"id": "1"}}, {"properties": {"id": "2"}}],
+        )
+        self.assertEqual(
+            self.datasource.build_features([("x",)], ("other",)), [{"properties": {}}]
+        )
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+from flask import current_app as app
+
+from datapunt_geosearch.registry import DatasetRegistry
+from datapunt_geosearch.registry_snapshot import RegistrySnapshot
+from tests.conftest import FAKE_SCHEMA
+from tests.test_dataset_registry import dataservices_row
+
+ROWS = [
+    dataservices_row(name, "fake", schema_data=FAKE_SCHEMA) for name in ("public", "secret")
+] + [dataservices_row("one")]
+
+
+class RegistrySnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "registry")
+        self.snapshot = RegistrySnapshot(self.path)
+
+    def test_rows_are_written_and_read(self):
+        self.assertIsNone(self.snapshot.read())
+
+        written = self.snapshot.write(ROWS)
+        read = self.snapshot.read()
+
+        self.assertEqual(read.rows, ROWS)
+        self.assertEqual(read.generation, written.generation)
+        self.assertEqual(self.snapshot.read_header().generation, 1)
+
+    def test_generation_is_incremented(self):
+        self.snapshot.write(ROWS)
+        self.snapshot.write(ROWS[:1])
+
+        self.assertEqual(self.snapshot.read_header().generation, 2)
+        self.assertEqual(self.snapshot.read().rows, ROWS[:1])
+
+    def test_fresh_snapshot_is_not_fetched_again(self):
+        fetch = unittest.mock.Mock(return_value=ROWS)
+        first = self.snapshot.load(fetch, max_age=60)
+        second = self.snapshot.load(fetch, max_age=60)
+
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(second.generation, first.generation)
+        self.assertEqual(second.rows, ROWS)
+
+    def test_expired_snapshot_is_refreshed(self):
+        fetch = unittest.mock.Mock(return_value=ROWS)
+        self.snapshot.load(fetch, max_age=60)
+        with unittest.mock.patch("time.time", return_value=time.time() + 61):
+            refreshed = self.snapshot.load(fetch, max_age=60)
+
+        self.assertEqual(fetch.call_count, 2)
+        self.assertEqual(refreshed.generation, 2)
+
+    def test_expired_snapshot_is_read_while_another_process_refreshes(self):
+        self.snapshot.write(ROWS)
+        fetch = unittest.mock.Mock(return_value=[])
+        with unittest.mock.patch.object(
+            self.snapshot, "lock", return_value=unittest.mock.MagicMock()
+        ) as lock_mock:
+            lock_mock.return_value.__enter__.return_value = False
+            snapshot = self.snapshot.load(fetch, max_age=0)
+
+        fetch.assert_not_called()
+        self.assertEqual((snapshot.generation, snapshot.rows), (1, ROWS))
+
+    def test_registry_is_built_from_the_snapshot(self):
+        self.snapshot.write(ROWS)
+        test_registry = DatasetRegistry()
+        with unittest.mock.patch.dict(
+            app.config, {"REGISTRY_SNAPSHOT_PATH": self.path}
+        ), unittest.mock.patch("datapunt_geosearch.db._DBConnection.fetch_all") as fetch_all_mock:
+            datasets = test_registry.init_dataservices_datasets()
+
+            fetch_all_mock.assert_not_called()
+            self.assertEqual(set(datasets), {"fake/public", "fake/secret", "test_dataset/one"})
+            self.assertEqual(test_registry._snapshot_generation, 1)
+            self.assertFalse(test_registry._snapshot_due())
+
+            # Another process wrote a new generation
+            self.snapshot.write(ROWS[:2])
+            test_registry._snapshot_checked = None
+            self.assertTrue(test_registry._snapshot_due())
+            datasets = test_registry.init_dataservices_datasets()
+
+        fetch_all_mock.assert_not_called()
+        self.assertEqual(set(datasets), {"fake/public", "fake/secret"})
+        self.assertEqual(test_registry.refresh_stats, {"reused": 1, "rebuilt": 0, "removed": 1})
+
+    def test_expired_snapshot_is_only_due_with_a_new_generation(self):
+        self.snapshot.write(ROWS)
+        test_registry = DatasetRegistry()
+        test_registry._snapshot_generation = 1
+        with unittest.mock.patch.dict(
+            app.config, {"REGISTRY_SNAPSHOT_PATH": self.path}
+        ), unittest.mock.patch("time.time", return_value=time.time() + 3600):
+            # Another process holds the lock to write the next generation
+            self.assertFalse(test_registry._snapshot_due())
+
+            self.snapshot.write(ROWS)
+            test_registry._snapshot_checked = None
+            self.assertTrue(test_registry._snapshot_due())
+
+    def test_forced_refresh_reads_the_database(self):
+        self.snapshot.write([])
+        test_registry = DatasetRegistry()
+        test_registry._refresh_forced = True
+        with unittest.mock.patch.dict(
+            app.config, {"REGISTRY_SNAPSHOT_PATH": self.path}
+        ), unittest.mock.patch("datapunt_geosearch.db._DBConnection.fetch_all", return_value=ROWS):
+            datasets = test_registry.init_dataservices_datasets()
+
+        self.assertEqual(len(datasets), 3)
+        self.assertEqual(self.snapshot.read_header().generation, 2)
+        self.assertFalse(test_registry._refresh_forced)
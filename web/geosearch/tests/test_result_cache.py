@@ -0,0 +1,111 @@
+import json
+import time
+import unittest
+import unittest.mock
+
+import pytest
+from flask import current_app as app
+
+from datapunt_geosearch.blueprints import engine
+from datapunt_geosearch.datasource import DataSourceBase
+from datapunt_geosearch.registry import registry
+from datapunt_geosearch.result_cache import ENTRY_OVERHEAD_BYTES, ResultCache
+
+
+class MagicDataSource(DataSourceBase):
+    dsn_name = "DSN_TEST_DATASET"
+    metadata = {"datasets": {"magic": {"test1": "public.test1", "test2": "public.test2"}}}
+
+
+class ResultCacheTestCase(unittest.TestCase):
+    def test_hits_and_misses_are_counted(self):
+        cache = ResultCache(max_bytes=10_000, ttl=60)
+        self.assertIsNone(cache.get("key"))
+        cache.set("key", (b'{"properties": {}}',))
+        self.assertEqual(cache.get("key"), (b'{"properties": {}}',))
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["bytes"], ENTRY_OVERHEAD_BYTES + 18)
+
+    def test_least_recently_used_entries_are_evicted_when_full(self):
+        cache = ResultCache(max_bytes=3 * (ENTRY_OVERHEAD_BYTES + 10), ttl=60)
+        for key in ("a", "b", "c"):
+            cache.set(key, (b"x" * 10,))
+        cache.get("a")
+        cache.set("d", (b"x" * 10,))
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("d"))
+
+    def test_entries_larger_than_the_cache_are_not_stored(self):
+        cache = ResultCache(max_bytes=100, ttl=60)
+        cache.set("key", (b"x" * 1000,))
+        self.assertIsNone(cache.get("key"))
+
+    def test_entries_expire(self):
+        cache = ResultCache(max_bytes=10_000, ttl=0.01)
+        cache.set("key", (b"x",))
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("key"))
+
+
+class ResultCacheKeyTestCase(unittest.TestCase):
+    request_args = {"x": "123282.61", "y": "487674.8", "rd": True, "limit": None}
+
+    def test_nearby_coordinates_share_a_key(self):
+        nearby_args = dict(self.request_args, x="123282.63")
+        self.assertEqual(
+            engine.result_cache_key(MagicDataSource, self.request_args, ["magic"]),
+            engine.result_cache_key(MagicDataSource, nearby_args, ["magic"]),
+        )
+
+    def test_key_depends_on_request_parameters(self):
+        key = engine.result_cache_key(MagicDataSource, self.request_args, ["magic"])
+        for request_args, datasets, scopes in (
+            (dict(self.request_args, x="123283.6"), ["magic"], None),
+            (dict(self.request_args, radius="50"), ["magic"], None),
+            (dict(self.request_args, limit="1"), ["magic"], None),
+            (dict(self.request_args, _fields="volgnummer"), ["magic"], None),
+            (self.request_args, ["magic/test1"], None),
+            (self.request_args, ["magic"], {"FAKE/SECRET"}),
+        ):
+            self.assertNotEqual(
+                engine.result_cache_key(MagicDataSource, request_args, datasets, scopes), key
+            )
+
+    def test_key_only_contains_datasets_of_the_datasource(self):
+        self.assertEqual(
+            engine.result_cache_key(MagicDataSource, self.request_args, ["magic", "other"]),
+            engine.result_cache_key(MagicDataSource, self.request_args, ["magic"]),
+        )
+
+
+@pytest.mark.usefixtures("dataservices_db", "dataservices_fake_data", "role_configuration")
+class ResultCacheSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        # Force registry to reload dataservices datasources
+        registry._datasets_initialized = None
+        app.config["RESULT_CACHE_MAX_BYTES"] = 1_000_000
+
+    def tearDown(self):
+        app.config["RESULT_CACHE_MAX_BYTES"] = 0
+
+    def _search(self, query):
+        with app.test_client() as client:
+            response = client.get(query)
+            return json.loads(response.data)
+
+    def test_repeated_search_is_served_from_cache(self):
+        query = "/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag"
+        response = self._search(query)
+        self.assertEqual(len(response["features"]), 7)
+
+        with unittest.mock.patch.object(engine, "fetch_all_data") as fetch_mock:
+            fetch_mock.return_value = []
+            cached_response = self._search(query)
+
+        self.assertEqual(cached_response, response)
+        fetch_mock.assert_called_once()
+        self.assertEqual(fetch_mock.call_args.args[0], [])
@@ -0,0 +1,140 @@
+import time
+import unittest
+import unittest.mock
+
+import pytest
+import shapely
+from flask import current_app as app
+
+from datapunt_geosearch import spatial_index
+from datapunt_geosearch.datasource import DataSourceBase
+from datapunt_geosearch.registry import DatasetRegistry
+from datapunt_geosearch.spatial_index import SpatialIndex, build_spatial_indexes
+
+
+class GebiedenDataSource(DataSourceBase):
+    dsn_name = "DSN_DATASERVICES_DATASETS"
+    dataset_field_names = ["volgnummer"]
+    metadata = {
+        "geofield": "geometry",
+        "operator": "contains",
+        "datasets": {"gebieden": {"buurten": "public.gebieden_buurten"}},
+    }
+
+
+def box_index(**kwargs):
+    return SpatialIndex(
+        rows=[{"id": "stadsdeel"}, {"id": "buurt"}, {"id": "elders"}],
+        geometries=[
+            shapely.box(0, 0, 1000, 100),
+            shapely.box(0, 0, 100, 100),
+            shapely.box(2000, 2000, 3000, 3000),
+        ],
+        **kwargs,
+    )
+
+
+class SpatialIndexTestCase(unittest.TestCase):
+    def test_containing_polygons_are_ordered_by_centroid_distance(self):
+        rows = box_index().contains(60, 50)
+        self.assertEqual(
+            rows,
+            [{"id": "buurt", "distance": 10.0}, {"id": "stadsdeel", "distance": 440.0}],
+        )
+
+    def test_points_outside_and_on_the_boundary_are_not_contained(self):
+        self.assertEqual(box_index().contains(1500, 1500), [])
+        self.assertEqual([row["id"] for row in box_index().contains(1000, 50)], [])
+
+    def test_rows_outside_their_validity_are_skipped(self):
+        now = time.time()
+        index = box_index(valid_from=[None, now + 60, None], valid_to=[now - 60, None, None])
+        self.assertEqual(index.contains(50, 50, now=now), [])
+        self.assertEqual(len(index.contains(50, 50, now=now + 120)), 1)
+
+
+class SpatialIndexQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.datasource = GebiedenDataSource(connection=unittest.mock.MagicMock())
+        self.datasource.x, self.datasource.y = 60, 50
+        patcher = unittest.mock.patch.object(
+            spatial_index,
+            "spatial_indexes",
+            {(GebiedenDataSource, "public.gebieden_buurten"): box_index()},
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_indexed_tables_are_not_queried_in_the_database(self):
+        features = self.datasource.execute_queries()
+
+        self.datasource.dbconn.cursor.assert_not_called()
+        self.assertEqual(
+            [feature["properties"] for feature in features],
+            [{"id": "buurt", "distance": 10.0}, {"id": "stadsdeel", "distance": 440.0}],
+        )
+
+    def test_extra_fields_and_wgs84_coordinates_are_queried_in_the_database(self):
+        for field_names_in_query, use_rd in ((["volgnummer"], True), (None, False)):
+            self.datasource.field_names_in_query = field_names_in_query
+            self.datasource.use_rd = use_rd
+            self.assertIsNone(self.datasource.query_spatial_index("public.gebieden_buurten"))
+
+
+@pytest.mark.usefixtures("dataservices_db", "dataservices_fake_data")
+class SpatialIndexDatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        row = dict(
+            schema="public",
+            table_name="bag_gebieden_v1",
+            name="gebieden",
+            name_field="name",
+            geometry_type="POLYGON",
+            geometry_field="geometry",
+            id_field="id",
+            dataset_name="bag",
+        )
+        self.datasource_class = DatasetRegistry().init_dataset(
+            row=row, class_name="IndexedGebieden", dsn_name="DSN_DATASERVICES_DATASETS"
+        )
+        app.config["SPATIAL_INDEX_MAX_ROWS"] = 100
+        self.addCleanup(app.config.update, SPATIAL_INDEX_MAX_ROWS=0)
+        self.addCleanup(build_spatial_indexes, [])
+
+    def _search(self):
+        datasource = self.datasource_class(dsn=app.config["DSN_DATASERVICES_DATASETS"])
+        datasource.x, datasource.y = 123282.6, 487684.8
+        return datasource.execute_queries()
+
+    def test_index_returns_the_same_features_as_the_database(self):
+        database_features = self._search()
+        build_spatial_indexes([self.datasource_class])
+
+        self.assertIn(
+            (self.datasource_class, "public.bag_gebieden_v1"), spatial_index.spatial_indexes
+        )
+        self.assertEqual(len(database_features), 6)
+        self.assertCountEqual(self._search(), database_features)
+
+    def test_tables_above_the_threshold_are_not_indexed(self):
+        app.config["SPATIAL_INDEX_MAX_ROWS"] = 5
+        build_spatial_indexes([self.datasource_class])
+        self.assertEqual(spatial_index.spatial_indexes, {})
+
+    def test_tables_of_unchanged_datasets_are_not_loaded_again(self):
+        fingerprints = {self.datasource_class: "first"}
+        build_spatial_indexes([self.datasource_class], fingerprints)
+        index = spatial_index.spatial_indexes[(self.datasource_class, "public.bag_gebieden_v1")]
+
+        with unittest.mock.patch.object(
+            spatial_index, "load_spatial_index", wraps=spatial_index.load_spatial_index
+        ) as load_mock:
+            build_spatial_indexes([self.datasource_class], fingerprints)
+            self.assertIs(
+                spatial_index.spatial_indexes[(self.datasource_class, "public.bag_gebieden_v1")],
+                index,
+            )
+            load_mock.assert_not_called()
+
+            build_spatial_indexes([self.datasource_class], {self.datasource_class: "second"})
+            self.assertEqual(load_mock.call_count, 1)
@@ -0,0 +1,69 @@
+import json
+import unittest
+import unittest.mock
+
+from flask import current_app as app
+
+from datapunt_geosearch.blueprints import engine
+
+
+class BufferChunksTestCase(unittest.TestCase):
+    def test_parts_are_joined_into_chunks(self):
+        chunks = list(engine.buffer_chunks([b"a" * 4, "b" * 4, b"c" * 4], 8))
+        self.assertEqual(chunks, [b"aaaabbbb", b"cccc"])
+
+    def test_pending_chunk_is_flushed_when_a_datasource_is_done(self):
+        def slow_parts():
+            yield b"first"
+            yield engine.FLUSH
+            # The next datasource is slow, "first" must have been sent already
+            self.assertEqual(chunks, [b"first"])
+            yield b"second"
+            yield engine.FLUSH
+            yield engine.FLUSH
+            yield b"third"
+
+        chunks = []
+        for chunk in engine.buffer_chunks(slow_parts(), 1000):
+            chunks.append(chunk)
+        self.assertEqual(chunks, [b"first", b"second", b"third"])
+
+
+class GenerateAsyncTestCase(unittest.TestCase):
+    def test_feature_collection_is_streamed_in_few_chunks(self):
+        features = [json.dumps({"properties": {"id": i}}).encode() for i in range(2000)]
+        request_args = {"datasets": "fake"}
+        app.config["STREAM_CHUNK_SIZE"] = 16384
+        self.addCleanup(app.config.update, STREAM_CHUNK_SIZE=32768)
+
+        with unittest.mock.patch.object(
+            engine, "query_datasources", return_value=iter(features)
+        ), unittest.mock.patch.object(engine.registry, "filter_datasources", return_value=set()):
+            chunks = list(engine.generate_async(request_args))
+
+        self.assertTrue(all(isinstance(chunk, bytes) for chunk in chunks))
+        self.assertEqual(chunks[0], b'{"type": "FeatureCollection", "features": [')
+        self.assertLessEqual(len(chunks), 5)
+        feature_collection = json.loads(b"".join(chunks))
+        self.assertEqual(feature_collection["type"], "FeatureCollection")
+        self.assertEqual(len(feature_collection["features"]), 2000)
+
+    def test_features_are_sent_when_their_datasource_is_done(self):
+        parts = [b'{"id": 1}', engine.FLUSH, b'{"id": 2}', b'{"id": 3}', engine.FLUSH]
+        with unittest.mock.patch.object(
+            engine, "query_datasources", return_value=iter(parts)
+        ), unittest.mock.patch.object(engine.registry, "filter_datasources", return_value=set()):
+            chunks = list(engine.generate_async({"datasets": "fake"}))
+
+        self.assertEqual(chunks[1:], [b'{"id": 1}', b',{"id": 2},{"id": 3}', b"]}"])
+        self.assertEqual(len(json.loads(b"".join(chunks))["features"]), 3)
+
+    def test_header_is_sent_before_the_datasources_are_queried(self):
+        with unittest.mock.patch.object(
+            engine, "query_datasources"
+        ) as query_mock, unittest.mock.patch.object(
+            engine.registry, "filter_datasources", return_value=set()
+        ):
+            chunks = engine.generate_async({"datasets": "fake"})
+            self.assertEqual(next(chunks), b'{"type": "FeatureCollection", "features": [')
+            query_mock.assert_not_called()
@@ -0,0 +1,125 @@
+import json
+import unittest
+import unittest.mock
+
+import pytest
+from flask import current_app as app
+from psycopg2 import sql
+
+from datapunt_geosearch.blueprints import engine
+from datapunt_geosearch.datasource import DataSourceBase, execute_union_queries
+from datapunt_geosearch.registry import registry
+
+
+class RdDataSource(DataSourceBase):
+    dsn_name = "DSN_DATASERVICES_DATASETS"
+    metadata = {"datasets": {"rd": {"one": "rd_one_v1"}}}
+
+
+class OtherRdDataSource(RdDataSource):
+    metadata = {"datasets": {"rd": {"two": "rd_two_v1"}}}
+
+
+class Wgs84DataSource(DataSourceBase):
+    dsn_name = "DSN_DATASERVICES_DATASETS"
+    crs = "EPSG:4326"
+    metadata = {"datasets": {"wgs84": {"one": "wgs84_one_v1"}}}
+
+
+class UnionGroupsTestCase(unittest.TestCase):
+    request_args = {
+        "x": "52.37",
+        "y": "4.89",
+        "rd": False,
+        "limit": None,
+        "projected": {28992: (121000.0, 487000.0), 4326: (4.89, 52.37)},
+    }
+
+    def test_datasources_in_different_crs_are_not_combined(self):
+        classes = [RdDataSource, Wgs84DataSource, OtherRdDataSource]
+        with unittest.mock.patch.object(
+            engine, "execute_union_queries", return_value=[[], []]
+        ) as union_mock, unittest.mock.patch.object(
+            engine, "fetch_data", return_value=[]
+        ) as fetch_mock:
+            results = dict(engine.fetch_data_union(classes, self.request_args, None))
+
+        self.assertEqual(set(results), set(classes))
+        union_mock.assert_called_once()
+        datasources = union_mock.call_args.args[0]
+        self.assertEqual([type(datasource) for datasource in datasources], classes[::2])
+        self.assertEqual([(d.x, d.y) for d in datasources], [(121000.0, 487000.0)] * 2)
+        fetch_mock.assert_called_once_with(Wgs84DataSource, self.request_args, None)
+
+    def test_union_of_datasources_with_different_coordinates_fails(self):
+        datasources = [
+            engine.configure_datasource(
+                datasource_class(connection=unittest.mock.MagicMock()), self.request_args
+            )
+            for datasource_class in (RdDataSource, Wgs84DataSource)
+        ]
+        for datasource in datasources:
+            datasource.query_spatial_index = unittest.mock.Mock(return_value=None)
+            datasource.get_query = unittest.mock.Mock(return_value=sql.SQL("SELECT 1"))
+
+        with self.assertRaises(ValueError):
+            execute_union_queries(datasources)
+        datasources[0].dbconn.cursor.assert_not_called()
+
+
+@pytest.mark.usefixtures("dataservices_db", "dataservices_fake_data", "role_configuration")
+class UnionQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        # Force registry to reload dataservices datasources
+        registry._datasets_initialized = None
+        app.config["QUERY_MODE"] = "union"
+
+    def tearDown(self):
+        app.config["QUERY_MODE"] = "sequential"
+
+    def _search(self, query):
+        with app.test_client() as client:
+            response = client.get(query)
+            return json.loads(response.data)
+
+    def test_union_query_returns_same_features_as_sequential_queries(self):
+        query = "/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag"
+        union_response = self._search(query)
+        app.config["QUERY_MODE"] = "sequential"
+        sequential_response = self._search(query)
+
+        self.assertEqual(union_response["type"], "FeatureCollection")
+        self.assertEqual(len(union_response["features"]), 7)
+        self.assertCountEqual(union_response["features"], sequential_response["features"])
+
+    def test_union_query_does_not_query_tables_separately(self):
+        with unittest.mock.patch("datapunt_geosearch.blueprints.engine.fetch_data") as fetch_mock:
+            response = self._search("/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag")
+
+        self.assertEqual(len(response["features"]), 7)
+        self.assertEqual(fetch_mock.mock_calls, [])
+
+    def test_union_query_keeps_features_ordered_by_distance_per_table(self):
+        response = self._search("/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag")
+        for table in ("fake/public", "bag/gebieden"):
+            distances = [
+                feature["properties"]["distance"]
+                for feature in response["features"]
+                if feature["properties"]["type"] == table
+            ]
+            self.assertEqual(distances, sorted(distances))
+
+    def test_union_query_with_extra_fields(self):
+        response = self._search(
+            "/?x=123282.6&y=487684.8&radius=20&datasets=fake,bag&_fields=volgnummer"
+        )
+        self.assertEqual(len(response["features"]), 7)
+        for feature in response["features"]:
+            self.assertEqual(feature["properties"]["volgnummer"], 1)
+            self.assertNotIn("geometrie", feature["properties"])
+
+    def test_union_query_respects_limit(self):
+        response = self._search("/?x=123282.6&y=487684.8&radius=20&limit=2&datasets=fake,bag")
+        types = [feature["properties"]["type"] for feature in response["features"]]
+        self.assertEqual(types.count("bag/gebieden"), 2)
+        self.assertEqual(types.count("fake/public"), 1)
@@ -0,0 +1,58 @@
+import threading
+import unittest
+import unittest.mock
+
+import pytest
+from flask import current_app as app
+
+from datapunt_geosearch import warmup
+from datapunt_geosearch.db import connection_pools, get_pool
+from datapunt_geosearch.registry import registry
+
+
+@pytest.mark.usefixtures("dataservices_db", "dataservices_fake_data")
+class WarmUpTestCase(unittest.TestCase):
+    def setUp(self):
+        # Force registry to reload dataservices datasources
+        registry._datasets_initialized = None
+
+    def test_master_builds_the_registry_without_keeping_connections(self):
+        warmup.warm_up_master(app._get_current_object())
+
+        self.assertIsNotNone(registry._datasets_initialized)
+        self.assertIsNotNone(registry.get_by_name("fake/public"))
+        self.assertEqual(connection_pools, {})
+
+    def test_worker_is_not_ready_until_its_pools_are_open(self):
+        started, release = threading.Event(), threading.Event()
+        init_datasets = registry.init_datasets
+
+        def slow_init_datasets():
+            started.set()
+            release.wait(5)
+            init_datasets()
+
+        with unittest.mock.patch.object(
+            registry, "init_datasets", side_effect=slow_init_datasets
+        ), app.test_client() as client:
+            thread = warmup.start_worker_warm_up(app._get_current_object())
+            started.wait(5)
+            self.assertFalse(warmup.is_ready())
+            response = client.get("/status/health")
+            self.assertEqual(response.status_code, 503)
+
+            release.set()
+            thread.join(5)
+
+        self.assertTrue(warmup.is_ready())
+        pool = get_pool(app.config["DSN_DATASERVICES_DATASETS"], set_user_role=True)
+        self.assertGreaterEqual(pool.stats()["idle"], pool.min_size)
+
+    def test_warm_up_can_be_disabled(self):
+        with unittest.mock.patch.dict(app.config, {"WARMUP": False}), unittest.mock.patch.object(
+            warmup, "start_worker_warm_up"
+        ) as start_mock:
+            warmup.warm_up(app._get_current_object())
+
+        start_mock.assert_not_called()
+        self.assertTrue(warmup.is_ready())
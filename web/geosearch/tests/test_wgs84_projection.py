@@ -0,0 +1,115 @@
+import json
+import unittest
+import unittest.mock
+
+import psycopg2
+import pytest
+from flask import current_app as app
+from flask import g
+
+from datapunt_geosearch import db
+from datapunt_geosearch.blueprints import engine
+from datapunt_geosearch.datasource import DataSourceBase
+from datapunt_geosearch.registry import registry
+
+
+class RdDataSource(DataSourceBase):
+    dsn_name = "DSN_DATASERVICES_DATASETS"
+
+
+class WebMercatorDataSource(DataSourceBase):
+    dsn_name = "DSN_DATASERVICES_DATASETS"
+    crs = "EPSG:3857"
+
+
+class ExternalDataSource(DataSourceBase):
+    dsn_name = None
+
+
+class ConfigureDatasourceTestCase(unittest.TestCase):
+    request_args = {
+        "x": "52.37",
+        "y": "4.89",
+        "rd": False,
+        "limit": None,
+        "projected": {28992: (121000.0, 487000.0), 3857: (544000.0, 6867000.0)},
+    }
+
+    def _configure(self, datasource_class):
+        datasource = datasource_class(connection=unittest.mock.MagicMock())
+        return engine.configure_datasource(datasource, self.request_args)
+
+    def test_datasources_get_the_point_in_their_crs(self):
+        for datasource_class, point in (
+            (RdDataSource, (121000.0, 487000.0)),
+            (WebMercatorDataSource, (544000.0, 6867000.0)),
+        ):
+            datasource = self._configure(datasource_class)
+            self.assertTrue(datasource.use_rd)
+            self.assertEqual((datasource.x, datasource.y), point)
+
+    def test_external_datasources_keep_the_wgs84_coordinates(self):
+        datasource = self._configure(ExternalDataSource)
+        self.assertFalse(datasource.use_rd)
+        self.assertEqual((datasource.x, datasource.y), (52.37, 4.89))
+
+
+@pytest.mark.usefixtures("dataservices_db", "dataservices_fake_data", "role_configuration")
+class ProjectionTestCase(unittest.TestCase):
+    def setUp(self):
+        # Force registry to reload dataservices datasources
+        registry._datasets_initialized = None
+        engine._projection_cache.clear()
+
+        # The WGS84 coordinates of the point next to the features of the fixtures
+        connection = db.dbconnection(app.config["DSN_DATASERVICES_DATASETS"])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT ST_Y(point), ST_X(point) FROM (SELECT ST_Transform("
+                "ST_SetSRID(ST_MakePoint(123282.6, 487684.8), 28992), 4326) AS point) AS p"
+            )
+            self.lat, self.lon = cursor.fetchone()
+        db.release_connections()
+
+    def _search(self):
+        with app.test_client() as client:
+            response = client.get(f"/?lat={self.lat}&lon={self.lon}&radius=20&datasets=fake,bag")
+            return json.loads(response.data)
+
+    def test_coordinates_are_projected_once_per_request(self):
+        with unittest.mock.patch.object(
+            engine, "project_wgs84", wraps=engine.project_wgs84
+        ) as project_mock:
+            response = self._search()
+
+        self.assertEqual(len(response["features"]), 7)
+        project_mock.assert_called_once()
+        _lat, _lon, srids, _source_class = project_mock.call_args.args
+        self.assertEqual(srids, {28992})
+        self.assertEqual(len(engine._projection_cache), 1)
+
+    def test_projected_coordinates_are_cached(self):
+        self._search()
+        with unittest.mock.patch.object(engine, "dedicated_connection") as connection_mock:
+            engine.project_wgs84(self.lat, self.lon, {28992}, RdDataSource)
+        connection_mock.assert_not_called()
+
+    def test_connection_is_returned_after_the_projection(self):
+        pool = db.get_pool(app.config["DSN_DATASERVICES_DATASETS"])
+        in_use = pool.stats()["in_use"]
+        with app.test_request_context():
+            projected = engine.project_wgs84(self.lat, self.lon, {28992}, RdDataSource)
+            self.assertNotIn("_db_connections", g)
+            self.assertEqual(pool.stats()["in_use"], in_use)
+
+        self.assertEqual(set(projected), {28992})
+
+    def test_queries_project_the_coordinates_when_that_fails(self):
+        projected_features = self._search()["features"]
+        with unittest.mock.patch.object(
+            engine, "project_wgs84", side_effect=psycopg2.OperationalError
+        ):
+            features = self._search()["features"]
+
+        self.assertEqual(len(features), 7)
+        self.assertCountEqual(features, projected_features)
@@ -1,8 +1,13 @@
 import argparse
 
 from datapunt_geosearch import create_app
+from datapunt_geosearch.metrics import setup_metrics_dir
+from datapunt_geosearch.warmup import warm_up
 
 app = create_app("datapunt_geosearch.config")
+if app.config.get("METRICS_DIR"):
+    setup_metrics_dir(app.config["METRICS_DIR"])
+warm_up(app)
 
 
 if __name__ == "__main__":